@@ -0,0 +1,108 @@
+"""
+Synthetic firmware for macro benchmarks as lists of opcode words
+"""
+
+def movlw(k):
+    return [0x0E00 | k]
+
+def movwf(f):
+    return [0x6E00 | f]
+
+def decfsz(f, d=1):
+    return [0x2C00 | (d << 9) | f]
+
+def btfsc(f, b):
+    return [0xB000 | (b << 9) | f]
+
+def btg(f, b):
+    return [0x7000 | (b << 9) | f]
+
+def goto(addr):
+    return [0xEF00 | ((addr >> 1) & 0xff), 0xF000 | (addr >> 9)]
+
+def call(addr):
+    return [0xEC00 | ((addr >> 1) & 0xff), 0xF000 | (addr >> 9)]
+
+def return_():
+    return [0x0012]
+
+def nop():
+    return [0x0000]
+
+def addwf(f, d=1):
+    return [0x2400 | (d << 9) | f]
+
+def addwfc(f, d=1):
+    return [0x2000 | (d << 9) | f]
+
+def subwf(f, d=1):
+    return [0x5C00 | (d << 9) | f]
+
+def iorwf(f, d=1):
+    return [0x1000 | (d << 9) | f]
+
+def xorwf(f, d=1):
+    return [0x1800 | (d << 9) | f]
+
+def addlw(k):
+    return [0x0F00 | k]
+
+def andlw(k):
+    return [0x0B00 | k]
+
+def clrf(f):
+    return [0x6A00 | f]
+
+def movff(fs, fd):
+    return [0xC000 | fs, 0xF000 | fd]
+
+def lfsr(n, k):
+    return [0xEE00 | (n << 4) | (k >> 8), 0xF000 | (k & 0xff)]
+
+# virtual registers of indirect addressing in access bank
+POSTINC0, POSTINC1, POSTINC2 = 0xEE, 0xE6, 0xDE
+
+def delay_loop():
+    """ Nested delay loop over two counters """
+    return (movlw(0) + movwf(0x21) +    # 0
+            movwf(0x20) +               # 4: outer
+            decfsz(0x20) + goto(6) +    # 6: inner
+            decfsz(0x21) + goto(4) +    # 12
+            goto(0))                    # 18
+
+def call_return():
+    """ Chain of calls of short subroutines """
+    return (call(16) + call(20) +               # 0
+            call(16) + goto(0) +                # 8
+            btg(0x30, 0) + return_() +          # 16
+            call(16) + nop() + return_())       # 20
+
+def bit_twiddling():
+    """ Loop testing and toggling bits of several registers """
+    return (btg(0x40, 0) +                      # 0
+            btfsc(0x40, 0) + btg(0x41, 3) +     # 2
+            btfsc(0x41, 3) + btg(0x42, 7) +     # 6
+            movlw(0x5a) + movwf(0x43) +         # 10
+            btg(0x43, 1) +                      # 14
+            goto(0))                            # 16
+
+def arithmetic():
+    """ 16-bit accumulation and checksum updating flags """
+    return (movlw(0x37) + addwf(0x50) +         # 0
+            movlw(0) + addwfc(0x51) +           # 4
+            iorwf(0x50, 0) + xorwf(0x52) +      # 8
+            addlw(0x11) + andlw(0x7f) +         # 12
+            subwf(0x53) +                       # 16
+            goto(0))                            # 18
+
+def buffer_copy():
+    """ Copy of 64-byte buffer through FSR0 and FSR1 and clearing through FSR2 """
+    return (lfsr(0, 0x100) + lfsr(1, 0x200) +       # 0
+            movlw(64) + movwf(0x20) +               # 8
+            movff(POSTINC0, POSTINC1) +             # 12: copy
+            decfsz(0x20) + goto(12) +               # 16
+            lfsr(2, 0x100) +                        # 22
+            movlw(64) + movwf(0x20) +               # 26
+            clrf(POSTINC2) +                        # 30: clear
+            decfsz(0x20) + goto(30) +               # 32
+            goto(0))                                # 38
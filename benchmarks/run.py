@@ -0,0 +1,198 @@
+#!/usr/bin/python
+"""
+Benchmark suite of simulator
+
+Every benchmark runs in its own interpreter, so that its peak memory is
+measured separately. Rates are best of several repeats and are compared
+against stored baseline. Micro benchmarks count processed items (opcodes,
+bytes, accesses, events) per second, macro benchmarks count simulated
+instruction cycles per second, not executed ops.
+
+Usage: python benchmarks/run.py [--quick] [--save] [--baseline FILE] [NAME ...]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'minipic'))
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+REPEATS = 3
+
+def best_rate(func, count):
+    """ Best rate (items per second) of 'func' processing 'count' items """
+    best = 0.0
+    for _ in xrange(REPEATS):
+        start = time.time()
+        func()
+        best = max(best, count / max(time.time() - start, 1e-9))
+    return best
+
+# micro benchmarks: func(scale) returns list of (metric name, rate)
+def bench_decode(scale):
+    import decoder
+    results = []
+    for cop, mask, extractor in decoder.OPCODES:
+        opcodes = list(decoder._codes(cop, mask))
+        cls = extractor(cop, 0xF000).__class__.__name__
+        def decode_all():
+            decoder._interned.clear()
+            for opcode in opcodes:
+                decoder.decode_op(opcode, 0xF000)
+        results.append(('decode_' + cls, best_rate(decode_all, len(opcodes))))
+    words = range(0x10000)
+    results.append(('decode_many_cached', best_rate(lambda: decoder.decode_many(words), len(words))))
+    return results
+
+def bench_load_hex(scale):
+    import StringIO
+    import ihex
+    from picmicro import ProgramMemory
+    rnd = random.Random(0)
+    lines = []
+    size = 0x40000 * scale
+    for addr in xrange(0, size, 16):
+        if addr & 0xffff == 0:
+            lines.append(_record(4, 0, [0, addr >> 16]))
+        lines.append(_record(0, addr & 0xffff, [rnd.randrange(256) for _ in xrange(16)]))
+    lines.append(_record(1, 0, []))
+    text = '\n'.join(lines) + '\n'
+    load = lambda: ihex.load(StringIO.StringIO(text), ProgramMemory())
+    return [('load_hex_bytes', best_rate(load, size))]
+
+def _record(type_rec, addr, data):
+    raw = bytearray([len(data), addr >> 8, addr & 0xff, type_rec]) + bytearray(data)
+    raw.append(-sum(raw) & 0xff)
+    return ':' + str(raw).encode('hex').upper()
+
+def bench_data_memory(scale):
+    from picmicro import MCU
+    data = MCU().data
+    count = 200000 * scale
+    addrs = [(i * 7) & 0xfff for i in xrange(count)]
+    def read_write():
+        read, write = data.read, data.write
+        for addr in addrs:
+            write(addr, read(addr) ^ 1)
+    def registers():
+        for addr in addrs[:count // 4]:
+            data[addr].put(data[addr].get() ^ 1)
+    return [('data_read_write', best_rate(read_write, count)),
+            ('data_register_objects', best_rate(registers, count // 4))]
+
+def bench_trace(scale):
+    from tracebuf import TraceBuf, REGISTER_WRITE
+    trace = TraceBuf()
+    count = 200000 * scale
+    def add_events():
+        add_event = trace.add_event
+        for i in xrange(count):
+            add_event(('register_write', 0x20, i & 0xff))
+    def add_records():
+        add = trace.add
+        for i in xrange(count):
+            add(REGISTER_WRITE, 0x20, i & 0xff)
+    return [('trace_add_event', best_rate(add_events, count)),
+            ('trace_add', best_rate(add_records, count))]
+
+# macro benchmarks: firmware run for fixed number of cycles, rate in cycles/s
+def _macro(name, words, scale):
+    from picmicro import MCU, TRACE_FULL
+    cycles = 200000 * scale
+    results = []
+    for suffix, kwargs in (('', {}), ('_blocks', {'blocks': True}),
+                           ('_traced', {'trace_level': TRACE_FULL})):
+        pic = MCU(**kwargs)
+        for i, word in enumerate(words):
+            pic.program.write_word(2 * i, word)
+        results.append((name + suffix, best_rate(lambda: pic.run(cycles), cycles)))
+    return results
+
+def bench_delay_loop(scale):
+    import programs
+    return _macro('delay_loop', programs.delay_loop(), scale)
+
+def bench_call_return(scale):
+    import programs
+    return _macro('call_return', programs.call_return(), scale)
+
+def bench_bit_twiddling(scale):
+    import programs
+    return _macro('bit_twiddling', programs.bit_twiddling(), scale)
+
+def bench_arithmetic(scale):
+    import programs
+    return _macro('arithmetic', programs.arithmetic(), scale)
+
+def bench_buffer_copy(scale):
+    import programs
+    return _macro('buffer_copy', programs.buffer_copy(), scale)
+
+BENCHMARKS = [
+    ('decode', bench_decode),
+    ('load_hex', bench_load_hex),
+    ('data_memory', bench_data_memory),
+    ('trace', bench_trace),
+    ('delay_loop', bench_delay_loop),
+    ('call_return', bench_call_return),
+    ('bit_twiddling', bench_bit_twiddling),
+    ('arithmetic', bench_arithmetic),
+    ('buffer_copy', bench_buffer_copy),
+]
+
+def run_one(name, scale):
+    """ Run benchmark in this process and print its results as JSON """
+    sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+    results = dict(BENCHMARKS)[name](scale)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'results': results, 'peak_kb': peak_kb})
+
+def run_isolated(name, scale):
+    output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--one', name, '--scale', str(scale)])
+    return json.loads(output)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of simulator')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--quick', action='store_true', help='run with smaller workloads')
+    parser.add_argument('--save', action='store_true', help='store results as new baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='file of baseline results')
+    parser.add_argument('--one', help=argparse.SUPPRESS)
+    parser.add_argument('--scale', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scale = args.scale or (1 if args.quick else 5)
+    if args.one:
+        run_one(args.one, scale)
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except IOError:
+        baseline = {}
+    current = {}
+    print '%-28s %14s %10s %10s' % ('benchmark', 'rate/s', 'baseline', 'peak KB')
+    for name, _ in BENCHMARKS:
+        if args.names and name not in args.names:
+            continue
+        report = run_isolated(name, scale)
+        for metric, rate in report['results']:
+            current[metric] = {'rate': rate, 'peak_kb': report['peak_kb']}
+            base = baseline.get(metric)
+            ratio = '%9.2fx' % (rate / base['rate']) if base else '%10s' % '-'
+            print '%-28s %14.0f %s %10d' % (metric, rate, ratio, report['peak_kb'])
+    if args.save:
+        baseline.update(current)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Batch runner of one program image against many scenarios
+
+Image is loaded and predecoded once, then scenarios are fanned out to pool
+of worker processes. Workers are forked from booted MCU, so they share its
+program memory read-only and restore booted state before every scenario.
+
+Scenario is JSON object (one per line of scenario file):
+    id: identifier copied into result
+    pc, wreg, bsr: initial values of registers
+    ram: mapping of data memory address (number or string like "0x20") to byte
+    max_cycles, until_pc, breakpoints: stop conditions of MCU.run
+    registers: data memory addresses reported in result
+
+Result is JSON object with id, stop reason, cycles, final PC, WREG, STATUS,
+BSR and requested registers.
+
+Usage: python -m minipic.batch image.hex scenarios.jsonl [-j JOBS] [-o FILE]
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+
+import ihex
+from picmicro import MCU
+from register import WREG, STATUS, BSR
+
+DEFAULT_MAX_CYCLES = 1000000
+
+# booted MCU and its snapshot inherited by forked workers
+_pic = None
+_boot = None
+
+def _addr(value):
+    return int(value, 0) if isinstance(value, basestring) else value
+
+def boot(hexfile, blocks=False):
+    """ Load image, predecode it and take snapshot of booted MCU """
+    global _pic, _boot
+    pic = MCU(blocks=blocks)
+    with open(hexfile, 'r') as f:
+        ihex.load(f, pic.program)
+    pic.program.predecode()
+    _pic, _boot = pic, pic.snapshot()
+    return pic
+
+def run_scenario(scenario):
+    """ Run scenario on booted MCU and return result record """
+    pic = _pic
+    pic.restore(_boot)
+    data = pic.data
+    if 'pc' in scenario:
+        pic.pc.value = _addr(scenario['pc'])
+    for name, addr in (('wreg', WREG), ('bsr', BSR)):
+        if name in scenario:
+            data.write(addr, scenario[name])
+    for addr, value in scenario.get('ram', {}).items():
+        data.write(_addr(addr), value)
+    until_pc = scenario.get('until_pc')
+    reason, cycles = pic.run(
+            scenario.get('max_cycles', DEFAULT_MAX_CYCLES),
+            None if until_pc is None else _addr(until_pc),
+            set(map(_addr, scenario.get('breakpoints', ()))))
+    return {
+        'id': scenario.get('id'),
+        'reason': reason,
+        'cycles': cycles,
+        'pc': pic.pc.value,
+        'wreg': data.ram[WREG],
+        'status': data.ram[STATUS],
+        'bsr': data.ram[BSR],
+        'registers': dict(('%#x' % _addr(addr), data.ram[_addr(addr)])
+                          for addr in scenario.get('registers', ())),
+    }
+
+def run_batch(hexfile, scenarios, jobs=None, blocks=False, chunksize=16):
+    """ Run scenarios on all cores, yield result records in order of scenarios """
+    boot(hexfile, blocks)
+    if jobs == 1:
+        for scenario in scenarios:
+            yield run_scenario(scenario)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(run_scenario, scenarios, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def read_scenarios(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m minipic.batch',
+            description='Run program image against many scenarios')
+    parser.add_argument('hexfile', help='program image in Intel HEX format')
+    parser.add_argument('scenarios', help='file of JSON scenarios, one per line')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help='number of worker processes (default: number of cores)')
+    parser.add_argument('-o', '--output', default='-',
+            help='file for JSON results, one per line (default: stdout)')
+    parser.add_argument('--blocks', action='store_true',
+            help='run through cache of compiled blocks')
+    args = parser.parse_args(argv)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        with open(args.scenarios, 'r') as f:
+            for result in run_batch(args.hexfile, read_scenarios(f), args.jobs, args.blocks):
+                out.write(json.dumps(result, sort_keys=True) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == '__main__':
+    main()
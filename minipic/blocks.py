@@ -0,0 +1,557 @@
+"""
+Translation of basic blocks of program into Python functions
+
+Sequence of ops up to jump or skip operation is compiled once into one
+generated function with PC arithmetic folded in. Skip over plain operation
+is compiled into conditional code inside the block, and block jumping back
+to its own start is compiled into loop. Blocks are dropped when program
+memory under them is written.
+
+Block function takes MCU and budget of cycles, executes at least one pass
+through the block and returns number of executed cycles. Cycles of ops are
+summed when block is compiled, so only ops executed by call return their
+cycles at run time.
+"""
+import sys
+from op import *
+from op import _add, _add_carry, _sub, _sub_borrow, _sub_from_w, _and, _ior, _xor
+from op import _com, _mov, _inc, _dec, _neg, _rlc, _rlnc, _rrc, _rrnc, _swap, _clr, _set
+from register import ByteRegister, Status, WREG, BSR, STATUS, PCL, PRODL, PRODH, Z
+from register import ADD_FLAGS, NZ_FLAGS, FSRS, TABLAT, TBLPTRL, TBLPTRH, TBLPTRU
+from register import IndirectRegister, PostIncrementRegister, PostDecrementRegister
+from register import PreIncrementRegister, PlusWRegister
+
+MAX_OPS = 64
+UNLIMITED = sys.maxint
+
+def _uses_pcl(op):
+    """ Check that op accesses PCL, which needs PC of op at run time """
+    if op.__class__ is MOVFF:
+        return PCL in (op.fs, op.fd)
+    return isinstance(op, FileOp) and op.a == 0 and op.addr == PCL
+
+class Block:
+    """ Compiled block of operations """
+    def __init__(self, start, end, function, max_cycles, source, size):
+        self.start = start
+        self.end = end
+        # block may wrap around top of program memory of 'size' bytes
+        length = (end - start) % size
+        self.addrs = frozenset((start + k) % size for k in xrange(0, length, 2))
+        self.function = function
+        self.max_cycles = max_cycles
+        self.source = source
+
+
+# changes of FSR by virtual registers: (before access, after access)
+POINTER_STEPS = {
+    IndirectRegister: (0, 0),
+    PostIncrementRegister: (0, 1),
+    PostDecrementRegister: (0, -1),
+    PreIncrementRegister: (1, 0),
+}
+
+
+class Emitter:
+    """ Source generator of one block """
+    def __init__(self, mcu):
+        self.hooks = mcu.data.hooks
+        self.namespace = {'program': mcu.program, 'data': mcu.data, 'ram': mcu.data.ram,
+                          'hooks': mcu.data.hooks,
+                          'read': mcu.data.read_target, 'write': mcu.data.write_target,
+                          'ADD_FLAGS': ADD_FLAGS, 'NZ_FLAGS': NZ_FLAGS}
+        self.pointers = 0
+        # address and op being compiled, guards of PCL leave block through it
+        self.site = None
+        self.program_size = mcu.program.SIZE
+        self.lines = []
+        self.indent = 2
+        # cycles of unconditional path and of conditionally executed ops
+        self.cycles = self.extra = self.max_cycles = 0
+
+    def const(self, obj):
+        """ Bind object into namespace of block and return its name """
+        name = '_c%d' % len(self.namespace)
+        self.namespace[name] = obj
+        return name
+
+    def line(self, text):
+        self.lines.append('    ' * self.indent + text)
+
+    def is_plain(self, addr):
+        """ Check that cell 'addr' may be accessed as bytearray item """
+        reg = self.hooks[addr]
+        return reg is None or type(reg) is ByteRegister
+
+    def is_indirect(self, addr):
+        reg = self.hooks[addr]
+        return reg is not None and reg.indirect
+
+    def is_inline(self, addr):
+        """ Check that virtual register 'addr' is resolved by inline FSR arithmetic """
+        reg = self.hooks[addr]
+        return (self.is_plain(reg.fsr) and self.is_plain(reg.fsr + 1) and
+                self.is_plain(WREG) and
+                (reg.__class__ in POINTER_STEPS or reg.__class__ is PlusWRegister))
+
+    def may_use_pcl(self, op):
+        """ Check that banked or indirect operand of 'op' may be PCL at run time """
+        if op.__class__ is MOVFF:
+            return self.is_indirect(op.fs) or self.is_indirect(op.fd)
+        if not isinstance(op, FileOp):
+            return False
+        if op.a == 0:
+            return self.is_indirect(op.addr)
+        return op.addr == PCL & 0xff or self.is_indirect(0x0f00 | op.addr)
+
+    def needs_call(self, op):
+        """ Check that op accessing PCL can't be guarded inside block """
+        if _uses_pcl(op):
+            return True
+        if op.__class__ is MOVFF:
+            # pointer of destination is checked after source was accessed
+            addrs = [addr for addr in (op.fs, op.fd) if self.is_indirect(addr)]
+            return len(addrs) == 2 or not all(map(self.is_inline, addrs))
+        if not isinstance(op, FileOp):
+            return False
+        addr = op.addr if op.a == 0 else 0x0f00 | op.addr
+        return self.is_indirect(addr) and not self.is_inline(addr)
+
+    def guard(self, addr):
+        """ Emit leaving of block by execution of current op when 'addr' is PCL
+
+        Op reading or writing PC this way is executed before any of its
+        effects, so it's done once.
+        """
+        site, op = self.site
+        self.max_cycles = max(self.max_cycles, self.cycles + self.extra + op.CYCLES + 1)
+        self.line('if %s == %d:' % (addr, PCL))
+        self.line('    pc.value = %d' % site)
+        self.line('    return n + %d + %s.execute(cpu)' % (self.cycles, self.const(op)))
+
+    def operand(self, op):
+        """ Return address of operand of 'op' as constant or as name of variable
+
+        Virtual registers of indirect addressing are resolved once, so that
+        operand may be read and written. Operand which may be PCL at run time
+        is guarded.
+        """
+        if op.a == 0:
+            return self.pointer(op.addr) if self.is_indirect(op.addr) else op.addr
+        self.line('addr = data.bank | %d' % op.addr)
+        if op.addr == PCL & 0xff:
+            self.guard('addr')
+        if self.is_indirect(0x0f00 | op.addr):
+            self.line('if addr == %d:' % (0x0f00 | op.addr))
+            self.indent += 1
+            self.line('addr = %s' % self.pointer(0x0f00 | op.addr))
+            self.indent -= 1
+        return 'addr'
+
+    def pointer(self, addr):
+        """ Emit resolution of virtual register 'addr' of indirect addressing
+
+        Return name of variable holding address of pointed cell. FSR is
+        accessed inline, ops whose FSR has hook aren't compiled (see
+        needs_call). Pointer to PCL is guarded before FSR is modified.
+        """
+        reg = self.hooks[addr]
+        name = 'p%d' % self.pointers
+        self.pointers += 1
+        fsr = reg.fsr
+        steps = POINTER_STEPS.get(reg.__class__)
+        load = '(ram[%d] | ((ram[%d] & 15) << 8))' % (fsr, fsr + 1)
+        if steps is None:
+            self.line('%s = (%s + ram[%d] - ((ram[%d] & 128) << 1)) & 4095' % (
+                    name, load, WREG, WREG))
+            self.guard(name)
+            return name
+        pre, post = steps
+        if pre:
+            self.line('%s = (%s + %d) & 4095' % (name, load, pre))
+            stored = name
+        else:
+            self.line('%s = %s' % (name, load))
+            stored = None
+        self.guard(name)
+        if post:
+            self.line('q = (%s + %d) & 4095' % (name, post))
+            stored = 'q'
+        if stored is not None:
+            self.line('ram[%d] = %s & 255' % (fsr, stored))
+            self.line('ram[%d] = %s >> 8' % (fsr + 1, stored))
+        return name
+
+    def read(self, addr):
+        """ Expression reading byte from cell 'addr' """
+        if not isinstance(addr, int):
+            return '(ram[%s] if hooks[%s] is None else read(%s))' % (addr, addr, addr)
+        if self.is_indirect(addr):
+            return self.read(self.pointer(addr))
+        if self.is_plain(addr) or type(self.hooks[addr]) is Status:
+            return 'ram[%d]' % addr
+        return '%s.get()' % self.const(self.hooks[addr])
+
+    def write(self, addr, expr):
+        """ Emit statement writing expression 'expr' into cell 'addr' """
+        if not isinstance(addr, int):
+            self.line('if hooks[%s] is None: ram[%s] = %s' % (addr, addr, expr))
+            self.line('else: write(%s, %s)' % (addr, expr))
+        elif self.is_indirect(addr):
+            self.write(self.pointer(addr), expr)
+        elif self.is_plain(addr):
+            self.line('ram[%d] = %s' % (addr, expr))
+        else:
+            self.line('%s.put(%s)' % (self.const(self.hooks[addr]), expr))
+
+    def update(self, addr, mask, expr):
+        """ Emit statement replacing bits 'mask' of cell 'addr' by 'expr' """
+        if self.is_plain(addr) or type(self.hooks[addr]) is Status:
+            self.line('ram[%d] = (ram[%d] & %d) | %s' % (addr, addr, ~mask & 0xff, expr))
+        else:
+            self.line('%s.update(%d, %s)' % (self.const(self.hooks[addr]), mask, expr))
+
+
+# emitters of plain operations: emit(em, op)
+def _emit_nop(em, op):
+    pass
+
+def _emit_movlw(em, op):
+    em.write(WREG, '%d' % op.k)
+
+def _emit_movwf(em, op):
+    em.write(em.operand(op), em.read(WREG))
+
+def _emit_btg(em, op):
+    addr = em.operand(op)
+    em.write(addr, '%s ^ %d' % (em.read(addr), 1 << op.b))
+
+def _emit_bcf(em, op):
+    addr = em.operand(op)
+    em.write(addr, '%s & %d' % (em.read(addr), ~(1 << op.b) & 0xff))
+
+def _emit_bsf(em, op):
+    addr = em.operand(op)
+    em.write(addr, '%s | %d' % (em.read(addr), 1 << op.b))
+
+def _emit_movff(em, op):
+    em.write(op.fd, em.read(op.fs))
+
+def _emit_movlb(em, op):
+    em.write(BSR, '%d' % op.k)
+
+def _emit_lfsr(em, op):
+    low, high = FSRS[op.f]
+    em.write(low, '%d' % (op.k & 0xff))
+    em.write(high, '%d' % (op.k >> 8))
+
+def _emit_tblrd(em, op):
+    pre, post = TABLE_STEPS[op.n]
+    em.line('t = ((%s | (%s << 8) | ((%s & 63) << 16)) + %d) & 4194303' % (
+            em.read(TBLPTRL), em.read(TBLPTRH), em.read(TBLPTRU), pre))
+    em.write(TABLAT, 'program.image[t] if t < %d else 0' % em.program_size)
+    if pre or post:
+        em.line('t = (t + %d) & 4194303' % post)
+        em.write(TBLPTRL, 't & 255')
+        em.write(TBLPTRH, '(t >> 8) & 255')
+        em.write(TBLPTRU, 't >> 16')
+
+def _emit_mul(em, x):
+    em.line('v = %s * %s' % (em.read(WREG), x))
+    em.write(PRODL, 'v & 0xff')
+    em.write(PRODH, 'v >> 8')
+
+def _emit_mulwf(em, op):
+    _emit_mul(em, em.read(em.operand(op)))
+
+def _emit_mullw(em, op):
+    _emit_mul(em, '%d' % op.k)
+
+# expressions of ALU functions over 'w', 'x' and carry 'c': result, flags of
+# result 'v', whether carry is used
+ALU_EXPRESSIONS = {
+    _add: ('w + x', 'ADD_FLAGS[(w << 8) | x]', False),
+    _add_carry: ('w + x + c', 'ADD_FLAGS[(c << 16) | (w << 8) | x]', True),
+    _sub: ('x + (w ^ 0xff) + 1', 'ADD_FLAGS[0x10000 | (x << 8) | (w ^ 0xff)]', False),
+    _sub_borrow: ('x + (w ^ 0xff) + c', 'ADD_FLAGS[(c << 16) | (x << 8) | (w ^ 0xff)]', True),
+    _sub_from_w: ('w + (x ^ 0xff) + c', 'ADD_FLAGS[(c << 16) | (w << 8) | (x ^ 0xff)]', True),
+    _and: ('w & x', 'NZ_FLAGS[v]', False),
+    _ior: ('w | x', 'NZ_FLAGS[v]', False),
+    _xor: ('w ^ x', 'NZ_FLAGS[v]', False),
+    _com: ('x ^ 0xff', 'NZ_FLAGS[v]', False),
+    _mov: ('x', 'NZ_FLAGS[v]', False),
+    _inc: ('x + 1', 'ADD_FLAGS[(x << 8) | 1]', False),
+    _dec: ('x + 0xff', 'ADD_FLAGS[0x10000 | (x << 8) | 0xfe]', False),
+    _neg: ('(x ^ 0xff) + 1', 'ADD_FLAGS[0x10000 | (x ^ 0xff)]', False),
+    _rlc: ('(x << 1) | c', 'NZ_FLAGS[v] | (x >> 7)', True),
+    _rlnc: ('(x << 1) | (x >> 7)', 'NZ_FLAGS[v]', False),
+    _rrc: ('(x >> 1) | (c << 7)', 'NZ_FLAGS[v] | (x & 1)', True),
+    _rrnc: ('(x >> 1) | ((x & 1) << 7)', 'NZ_FLAGS[v]', False),
+    _swap: ('(x << 4) | (x >> 4)', '0', False),
+    _clr: ('0', '%d' % Z, False),
+    _set: ('0xff', '0', False),
+}
+
+def _emit_alu(em, op, x):
+    value, flags, carry = ALU_EXPRESSIONS[op.alu]
+    em.line('w = %s' % em.read(WREG))
+    em.line('x = %s' % x)
+    if carry:
+        em.line('c = %s & 1' % em.read(STATUS))
+    em.line('v = (%s) & 0xff' % value)
+    em.line('flags = %s' % flags)
+
+def _emit_byte_alu(em, op):
+    addr = em.operand(op)
+    _emit_alu(em, op, em.read(addr))
+    em.write(WREG if op.d == 0 else addr, 'v')
+    if op.FLAGS:
+        em.update(STATUS, op.FLAGS, 'flags')
+
+def _emit_literal_alu(em, op):
+    _emit_alu(em, op, '%d' % op.k)
+    em.write(WREG, 'v')
+    em.update(STATUS, op.FLAGS, 'flags')
+
+EMITTERS = {
+    NOP: _emit_nop,
+    MOVLW: _emit_movlw,
+    MOVWF: _emit_movwf,
+    BTG: _emit_btg,
+    BCF: _emit_bcf,
+    BSF: _emit_bsf,
+    MOVFF: _emit_movff,
+    MOVLB: _emit_movlb,
+    LFSR: _emit_lfsr,
+    TBLRD: _emit_tblrd,
+    MULWF: _emit_mulwf,
+    MULLW: _emit_mullw,
+    ADDWF: _emit_byte_alu,
+    ADDWFC: _emit_byte_alu,
+    SUBWF: _emit_byte_alu,
+    SUBWFB: _emit_byte_alu,
+    SUBFWB: _emit_byte_alu,
+    ANDWF: _emit_byte_alu,
+    IORWF: _emit_byte_alu,
+    XORWF: _emit_byte_alu,
+    COMF: _emit_byte_alu,
+    MOVF: _emit_byte_alu,
+    INCF: _emit_byte_alu,
+    DECF: _emit_byte_alu,
+    RLCF: _emit_byte_alu,
+    RLNCF: _emit_byte_alu,
+    RRCF: _emit_byte_alu,
+    RRNCF: _emit_byte_alu,
+    SWAPF: _emit_byte_alu,
+    NEGF: _emit_byte_alu,
+    CLRF: _emit_byte_alu,
+    SETF: _emit_byte_alu,
+    ADDLW: _emit_literal_alu,
+    SUBLW: _emit_literal_alu,
+    ANDLW: _emit_literal_alu,
+    IORLW: _emit_literal_alu,
+    XORLW: _emit_literal_alu,
+}
+
+# emitters of skip operations: emit(em, op) returns condition of skip
+def _skip_btfsc(em, op):
+    return 'not %s & %d' % (em.read(em.operand(op)), 1 << op.b)
+
+def _skip_btfss(em, op):
+    return '%s & %d' % (em.read(em.operand(op)), 1 << op.b)
+
+def _skip_compare(relation):
+    return lambda em, op: '%s %s %s' % (em.read(em.operand(op)), relation,
+                                        em.read(WREG))
+
+def _skip_tstfsz(em, op):
+    return 'not %s' % em.read(em.operand(op))
+
+def _skip_count(delta, zero):
+    """ Emitter of incrementing or decrementing skip taken on (non) zero result """
+    def emit(em, op):
+        addr = em.operand(op)
+        em.line('v = (%s + %d) & 0xff' % (em.read(addr), delta))
+        em.write(WREG if op.d == 0 else addr, 'v')
+        return 'not v' if zero else 'v'
+    return emit
+
+SKIPS = {
+    BTFSC: _skip_btfsc,
+    BTFSS: _skip_btfss,
+    DECFSZ: _skip_count(-1, True),
+    DCFSNZ: _skip_count(-1, False),
+    INCFSZ: _skip_count(1, True),
+    INFSNZ: _skip_count(1, False),
+    CPFSEQ: _skip_compare('=='),
+    CPFSGT: _skip_compare('>'),
+    CPFSLT: _skip_compare('<'),
+    TSTFSZ: _skip_tstfsz,
+}
+
+# ops writing program memory end block, as they may drop it
+PROGRAM_WRITES = (TBLWT,)
+
+# unconditional jumps with static target: target(op, addr) returns address
+JUMPS = {
+    GOTO: lambda op, addr: op.k << 1,
+    BRA: lambda op, addr: addr + 2 + (op.n << 1),
+}
+
+
+class BlockCache:
+    """ Cache of compiled blocks of program memory of MCU """
+    def __init__(self, mcu):
+        self.mcu = mcu
+        self.blocks = {}
+        self.owners = {}
+        mcu.program.observers.append(self)
+
+    def __getitem__(self, addr):
+        block = self.blocks.get(addr)
+        if block is None:
+            block = self.compile(addr)
+        return block
+
+    def invalidate(self, i):
+        """ Drop blocks covering word 'i' of program memory """
+        for start in self.owners.pop(i, ()):
+            self.blocks.pop(start, None)
+
+    def compile(self, start):
+        """ Compile block starting at address 'start' """
+        program = self.mcu.program
+        size = self.mcu.pc.MAX_VALUE
+        em = Emitter(self.mcu)
+        addr = start
+        for _ in xrange(MAX_OPS):
+            op = program[addr]
+            cls = op.__class__
+            em.site = (addr, op)
+            if em.needs_call(op):
+                # op reads PC or jumps by write into PCL
+                self._call(em, addr, op)
+                addr = (addr + op.SIZE) % size
+                break
+            elif cls in SKIPS:
+                addr, done = self._skip(em, start, addr, op)
+                if done:
+                    break
+            elif isinstance(op, Branch):
+                self._branch(em, start, addr, op)
+                addr = (addr + op.SIZE) % size
+            elif cls in JUMPS:
+                em.cycles += op.CYCLES
+                self._exit(em, start, JUMPS[cls](op, addr) % self.mcu.pc.MAX_VALUE)
+                addr = (addr + op.SIZE) % size
+                break
+            elif op.JUMP or cls in PROGRAM_WRITES:
+                self._call(em, addr, op)
+                addr = (addr + op.SIZE) % size
+                break
+            elif cls not in EMITTERS:
+                em.line('pc.value = %d' % addr)
+                em.line('%s.execute(cpu)' % em.const(op))
+                em.cycles += op.CYCLES
+                addr = (addr + op.SIZE) % size
+            else:
+                EMITTERS[cls](em, op)
+                em.cycles += op.CYCLES
+                addr = (addr + op.SIZE) % size
+        else:
+            self._exit(em, start, addr)
+        return self._install(em, start, addr)
+
+    def _call(self, em, addr, op):
+        """ Emit leaving of block by execution of op at 'addr' """
+        # cycles are returned by op, skip taken adds one
+        em.line('pc.value = %d' % addr)
+        em.max_cycles = max(em.max_cycles, em.cycles + em.extra + op.CYCLES + 1)
+        em.line('return n + %d + %s.execute(cpu)' % (em.cycles, em.const(op)))
+
+    def _skip(self, em, start, addr, op):
+        """ Emit skip operation
+
+        Return address following compiled code and flag of end of block.
+        """
+        cond = SKIPS[op.__class__](em, op)
+        em.cycles += op.CYCLES
+        size = self.mcu.pc.MAX_VALUE
+        # addresses of following op and of op after it wrap at top of memory
+        after = (addr + op.SIZE) % size
+        skipped = (after + 2) % size
+        following = self.mcu.program[after]
+        cls = following.__class__
+        if (cls in JUMPS or following.JUMP or following.SIZE != 2 or cls not in EMITTERS
+                or em.needs_call(following) or em.may_use_pcl(following)):
+            # skip taken costs one more cycle
+            em.line('if %s:' % cond)
+            em.indent += 1
+            em.cycles += 1
+            self._exit(em, start, skipped)
+            em.cycles -= 1
+            em.indent -= 1
+            if cls not in JUMPS:
+                self._exit(em, start, after)
+                return after, True
+            em.cycles += following.CYCLES
+            self._exit(em, start, JUMPS[cls](following, after) % size)
+            return (after + following.SIZE) % size, True
+        # skip taken costs one cycle, so does following op unless it takes more
+        em.cycles += 1
+        em.line('if not (%s):' % cond)
+        em.indent += 1
+        if following.CYCLES > 1:
+            em.line('n += %d' % (following.CYCLES - 1))
+            em.extra += following.CYCLES - 1
+        EMITTERS[cls](em, following)
+        em.line('pass')
+        em.indent -= 1
+        return skipped, False
+
+    def _branch(self, em, start, addr, op):
+        """ Emit conditional branch, block goes on with not taken branch """
+        status = em.read(STATUS)
+        if op.WHEN:
+            em.line('if %s & %d:' % (status, op.FLAG))
+        else:
+            em.line('if not %s & %d:' % (status, op.FLAG))
+        em.indent += 1
+        em.cycles += 2
+        self._exit(em, start, (addr + 2 + (op.n << 1)) % self.mcu.pc.MAX_VALUE)
+        em.cycles -= 1
+        em.indent -= 1
+
+    def _leave(self, em):
+        """ Emit return from block with PC already set """
+        em.max_cycles = max(em.max_cycles, em.cycles + em.extra)
+        em.line('return n + %d' % em.cycles)
+
+    def _exit(self, em, start, target):
+        """ Emit leaving of block with jump to address 'target' """
+        if target == start:
+            em.max_cycles = max(em.max_cycles, em.cycles + em.extra)
+            em.line('n += %d' % em.cycles)
+            em.line('if n + max_cycles > budget:')
+            em.line('    pc.value = %d' % target)
+            em.line('    return n')
+            em.line('continue')
+        else:
+            em.line('pc.value = %d' % target)
+            self._leave(em)
+
+    def _install(self, em, start, end):
+        source = '\n'.join([
+            'def block(cpu, budget):',
+            '    pc = cpu.pc',
+            '    n = 0',
+            '    while True:'] + em.lines) + '\n'
+        namespace = em.namespace
+        namespace['max_cycles'] = em.max_cycles
+        exec compile(source, '<block %#x>' % start, 'exec') in namespace
+        block = Block(start, end, namespace['block'], em.max_cycles, source,
+                      self.mcu.pc.MAX_VALUE)
+        self.blocks[start] = block
+        for addr in block.addrs:
+            self.owners.setdefault(addr >> 1, set()).add(start)
+        return block
@@ -1,199 +1,48 @@
 #!/usr/bin/python
 
 from cmd import Cmd
+import ihex
 from picmicro import *
 from op import *
-
-# masks to pick out code of commands of operations
-def CMD_COP4(cmd):
-    return (cmd & 0xF000)
-def CMD_COP5(cmd):
-    return (cmd & 0xF800)
-def CMD_COP6(cmd):
-    return (cmd & 0xFC00)
-def CMD_COP7(cmd):
-    return (cmd & 0xFE00)
-def CMD_COP8(cmd):
-    return (cmd & 0xFF00)
-def CMD_COP10(cmd):
-    return (cmd & 0xFFC0)
-def CMD_COP12(cmd):
-    return (cmd & 0xFFF0)
-def CMD_COP15(cmd):
-    return (cmd & 0xFFFE)
-
-# codes of commands of operations
-COP_ADDLW = 0x0F00
-COP_ADDWF = 0x2400
-COP_ADDWFC =0x2000
-COP_ANDLW = 0x0B00
-COP_ANDWF = 0x1400
-COP_BC = 0xE200
-COP_BCF = 0x9000
-COP_BN = 0xE600
-COP_BNC = 0xE300
-COP_BNN = 0xE700
-COP_BNOV = 0xE500
-COP_BNZ = 0xE100
-COP_BOV = 0xE400
-COP_BRA = 0xD000
-COP_BSF = 0x8000
-COP_BTFSC = 0xB000
-COP_BTFSS = 0xA000
-COP_BTG = 0x7000
-COP_BZ = 0xE000
-COP_CALL = 0xEC00
-COP_CLRF = 0x6A00
-COP_CLRWDT = 0x0004
-COP_COMF = 0x1C00
-COP_CPFSEQ = 0x6200
-COP_CPFSGT = 0x6400
-COP_CPFSLT = 0x6000
-COP_DAW = 0x0007
-COP_DECF = 0x0400
-COP_DECFSZ = 0x2C00
-COP_DCFSNZ = 0x4C00
-COP_GOTO = 0xEF00
-COP_INCF = 0x2800
-COP_INCFSZ = 0x3C00
-COP_INFSNZ = 0x4800
-COP_IORLW = 0x0900
-COP_IORWF = 0x1000
-COP_LFSR = 0xEE00
-COP_MOVF = 0x5000
-COP_MOVFF = 0xC000
-COP_MOVLB = 0x0100
-COP_MOVLW = 0x0E00
-COP_MOVWF = 0x6E00
-COP_MULLW = 0x0D00
-COP_MULWF = 0x0200
-COP_NEGF = 0x6C00
-COP_NOP = 0x0000
-COP_NOP2 = 0xF000   # NOP in second word
-COP_POP = 0x0006
-COP_PUSH = 0x0005
-COP_RCALL = 0xD800
-COP_RESET = 0x00FF
-COP_RETFIE = 0x0010
-COP_RETLW = 0x0C00
-COP_RETURN = 0x0012
-COP_RLCF = 0x3400
-COP_RLNCF = 0x4400
-COP_RRCF = 0x3000
-COP_RRNCF = 0x4000
-COP_SETF = 0x6800
-COP_SLEEP = 0x0003
-COP_SUBFWB = 0x5400
-COP_SUBLW = 0x0800
-COP_SUBWF = 0x5C00
-COP_SUBWFB = 0x5800
-COP_SWAPF = 0x3800
-COP_TBLRD = 0x0008
-COP_TBLWT = 0x000C
-COP_TSTFSZ = 0x6600
-COP_XORLW = 0x0A00
-COP_XORWF = 0x1800
-
-def decode_op(opcode, next_opcode):
-    """ Decode code of operation and return op object """
-
-    # 16-bit operations
-    op = opcode
-    if op == COP_CLRWDT:
-        return NOP()
-    elif op == COP_DAW:
-        return NOP()
-    elif op == COP_NOP:
-        return NOP()
-
-    # 15-bit operations
-    op = CMD_COP15(opcode)
-    if op == COP_RETFIE:
-        return NOP()
-    elif op == COP_RETURN:
-        return RETURN(opcode & 1)
-
-    # 12-bit operations
-    op = CMD_COP12(opcode)
-    if op == COP_MOVLB:
-        return NOP()
-
-    # 10-bit operation
-    op = CMD_COP10(opcode)
-    if op == COP_LFSR:
-        return NOP()
-
-    # 8-bit operations
-    op = CMD_COP8(opcode)
-    if op == COP_ADDLW:
-        return NOP()
-    elif op == COP_MOVLW:
-        return MOVLW(opcode & 0xff)
-    elif op == COP_GOTO:
-        return GOTO((opcode & 0xff) | ((next_opcode & 0xfff) << 8))
-
-    # 7-bit operations
-    op = CMD_COP7(opcode)
-    if op == COP_CALL:
-        return CALL((opcode & 0xff) | ((next_opcode & 0xfff) << 8),
-                    (opcode & 0x100) >> 8)
-    elif op == COP_MOVWF:
-        return MOVWF(opcode & 0xff, (opcode & 0x100) >> 8)
-
-    # 6-bit operations
-    op = CMD_COP6(opcode)
-    if op == COP_ADDWF:
-        return NOP()
-    elif op == COP_DECFSZ:
-        return DECFSZ(opcode & 0xff, (opcode & 0x200) >> 9, (opcode & 0x100) >> 8)
-
-    # 5-bit operations
-    op = CMD_COP5(opcode)
-    if op == COP_BRA:
-        return NOP()
-
-    # 4-bit operations
-    op = CMD_COP4(opcode)
-    if op == COP_BTFSC:
-        return BTFSC(opcode & 0xff, (opcode & 0xe00) >> 9, (opcode & 0x100) >> 8)
-    elif op == COP_BTG:
-        return BTG(opcode & 0xff, (opcode & 0xe00) >> 9, (opcode & 0x100) >> 8)
-
-    return NOP()
+from decoder import *
+from vcd import VCDWriter
+from profiler import Profiler
+from stats import SelfProfiler
 
 def load_hex(hexfile, pic):
-    higher_addr = 0
-    for line in hexfile:
-        data_len = int(line[1:3], 16)
-        start_addr = int(line[3:7], 16)
-        type_rec = int(line[7:9], 16)
-        data = line[9:(9 + 2*data_len)]
-        if type_rec == 0:
-            # copy chunk of bytes into program memory of MC
-            for i in xrange(0, data_len, 2):
-                byte1 = int(data[2*i:(2*i + 2)], 16)
-                byte2 = int(data[(2*i + 2):(2*i + 4)], 16)
-                if i + 2 < data_len:
-                    byte3 = int(data[(2*i + 4):(2*i + 6)], 16)
-                    byte4 = int(data[(2*i + 6):(2*i + 8)], 16)
-                else:
-                    byte3, byte4 = 0, 0
-                opcode = (byte2 << 8) | byte1
-                next_opcode = (byte4 << 8) | byte3
-                addr = ((higher_addr << 16) | start_addr) + i
-                pic.program[addr] = decode_op(opcode, next_opcode)
-        elif type_rec == 1:
-            return
-        elif type_rec == 4:
-            # specify higher-order bytes of address
-            higher_addr = int(data, 16)
+    """ Load program image in Intel HEX format into program memory of MCU """
+    return ihex.load(hexfile, pic.program)
 
 
 class CLI(Cmd):
     """Command processor for pic microcontroller"""
 
     prompt = 'minipic> '
-    pic = MCU()
+    breakpoints = set()
+    vcd = None
+    profiler = None
+    stats = SelfProfiler()
+
+    def __init__(self, *args, **kwargs):
+        Cmd.__init__(self, *args, **kwargs)
+        # untraced MCU runs compiled blocks, VCD dump switches it to traced one
+        self.pic = MCU(blocks=True)
+
+    def retrace(self, level):
+        """ Move state of MCU into new MCU traced at 'level' """
+        old = self.pic
+        pic = self.pic = MCU(level, blocks=True)
+        pic.program.image = old.program.image
+        pic.data.restore(old.data.snapshot())
+        pic.stack.restore(old.stack.snapshot())
+        pic.pc.value, pic.cycles, pic.sleeping = old.pc.value, old.cycles, old.sleeping
+        if self.profiler is not None:
+            # profile collected so far goes on
+            profiler = self.profiler
+            profiler.stop()
+            self.profiler = Profiler(pic)
+            for name in ('tally', 'sites', 'starts', 'edges', 'recursive'):
+                setattr(self.profiler, name, getattr(profiler, name))
 
     def do_load(self , hexfile):
         """
@@ -204,25 +53,117 @@ class CLI(Cmd):
             load_hex(f, self.pic)
 
     def do_step(self, line):
+        """
+        step [n]
+        Execute n operations printing each op, registers changed by it and state
+        """
         if line == '':
             num_steps = 1
         else:
             num_steps = int(line)
+        pic = self.pic
+        ram = pic.data.ram
         for _ in xrange(num_steps):
-            current_op = self.pic.program[self.pic.pc.value]
-            self.pic.trace.add_event((
-                'opcode_fetch', 
-                current_op.__class__.__name__, 
-                tuple(map(hex, reversed(current_op.__dict__.values()))))
-                ) 
-            current_op.execute(self.pic)
-            for log_record in self.pic.trace:
-                print log_record
-            print 'WREG = ' + str(self.pic.data[WREG].value), \
-                  'STATUS = ' + str(self.pic.data[STATUS].value), \
-                  'PC = ' + str(self.pic.pc.value)
+            # changes are found by comparison of data memory, MCU isn't traced
+            before = ram[:]
+            op = pic.program[pic.pc.value]
+            pic.step()
+            print ('opcode_fetch', op)
+            for addr in xrange(len(ram)):
+                if ram[addr] != before[addr]:
+                    print ('register_write', addr, ram[addr])
+            self.print_state()
             print
 
+    def do_run(self, line):
+        """
+        run [max_cycles]
+        Run program from reset vector until breakpoint or cycle budget
+        """
+        self.pic.pc.value = 0
+        self.do_continue(line)
+
+    def do_continue(self, line):
+        """
+        continue [max_cycles]
+        Continue program from current PC until breakpoint or cycle budget
+        """
+        max_cycles = int(line, 0) if line else None
+        reason, cycles = self.pic.run(max_cycles, breakpoints=self.breakpoints)
+        # trace of the whole run is not reported
+        self.pic.trace.reader.skip()
+        print 'stopped:', reason, 'after', cycles, 'cycles'
+        self.print_state()
+
+    def do_break(self, line):
+        """
+        break [addr]
+        Set breakpoint at program address or list breakpoints
+        """
+        if line == '':
+            for addr in sorted(self.breakpoints):
+                print hex(addr)
+        else:
+            self.breakpoints.add(int(line, 0))
+
+    def do_delete(self, line):
+        """
+        delete addr
+        Remove breakpoint from program address
+        """
+        self.breakpoints.discard(int(line, 0))
+
+    def do_vcd(self, line):
+        """
+        vcd [file]
+        Start dumping PC and core registers into VCD file or stop dumping
+        """
+        if self.vcd is not None:
+            self.vcd.close()
+            self.vcd = None
+        if line:
+            if self.pic.trace_level < TRACE_WRITES:
+                self.retrace(TRACE_WRITES)
+            self.vcd = VCDWriter(self.pic, line)
+        elif self.pic.trace_level != TRACE_OFF:
+            self.retrace(TRACE_OFF)
+
+    def do_profile(self, line):
+        """
+        profile [start|stop]
+        Start or stop profiling of program, print profile without argument
+        """
+        if line == 'start':
+            if self.profiler is None:
+                self.profiler = Profiler(self.pic)
+        elif line == 'stop':
+            if self.profiler is not None:
+                self.profiler.stop()
+                self.profiler = None
+        elif self.profiler is not None:
+            self.profiler.report()
+        else:
+            print 'profiler is not started'
+
+    def do_stats(self, line):
+        """
+        stats [start|stop|reset]
+        Control sampling of time spent by simulator subsystems, print it without argument
+        """
+        if line == 'start':
+            self.stats.start()
+        elif line == 'stop':
+            self.stats.stop()
+        elif line == 'reset':
+            self.stats.reset()
+        else:
+            self.stats.report()
+
+    def print_state(self):
+        print 'WREG = ' + str(self.pic.data[WREG].value), \
+              'STATUS = ' + str(self.pic.data[STATUS].value), \
+              'PC = ' + str(self.pic.pc.value)
+
     def do_addwf(self, line):
         """
         addwf f[,d[,a]]
@@ -247,6 +188,9 @@ class CLI(Cmd):
         print '*** Starting CLI:'
 
     def postloop(self):
+        self.stats.stop()
+        if self.vcd is not None:
+            self.vcd.close()
         print '*** Done'
 
 
@@ -0,0 +1,256 @@
+"""
+Decoder of PIC18F opcodes
+
+Dispatch table indexed by opcode word is built once at import. Every entry
+is an extractor that picks operands out of opcode and builds op object.
+Op objects are immutable, so identical instructions share one interned
+instance.
+"""
+from op import *
+
+# masks to pick out code of commands of operations
+MASK_COP4 = 0xF000
+MASK_COP5 = 0xF800
+MASK_COP6 = 0xFC00
+MASK_COP7 = 0xFE00
+MASK_COP8 = 0xFF00
+MASK_COP10 = 0xFFC0
+MASK_COP12 = 0xFFF0
+MASK_COP14 = 0xFFFC
+MASK_COP15 = 0xFFFE
+MASK_COP16 = 0xFFFF
+
+# codes of commands of operations
+COP_ADDLW = 0x0F00
+COP_ADDWF = 0x2400
+COP_ADDWFC =0x2000
+COP_ANDLW = 0x0B00
+COP_ANDWF = 0x1400
+COP_BC = 0xE200
+COP_BCF = 0x9000
+COP_BN = 0xE600
+COP_BNC = 0xE300
+COP_BNN = 0xE700
+COP_BNOV = 0xE500
+COP_BNZ = 0xE100
+COP_BOV = 0xE400
+COP_BRA = 0xD000
+COP_BSF = 0x8000
+COP_BTFSC = 0xB000
+COP_BTFSS = 0xA000
+COP_BTG = 0x7000
+COP_BZ = 0xE000
+COP_CALL = 0xEC00
+COP_CLRF = 0x6A00
+COP_CLRWDT = 0x0004
+COP_COMF = 0x1C00
+COP_CPFSEQ = 0x6200
+COP_CPFSGT = 0x6400
+COP_CPFSLT = 0x6000
+COP_DAW = 0x0007
+COP_DECF = 0x0400
+COP_DECFSZ = 0x2C00
+COP_DCFSNZ = 0x4C00
+COP_GOTO = 0xEF00
+COP_INCF = 0x2800
+COP_INCFSZ = 0x3C00
+COP_INFSNZ = 0x4800
+COP_IORLW = 0x0900
+COP_IORWF = 0x1000
+COP_LFSR = 0xEE00
+COP_MOVF = 0x5000
+COP_MOVFF = 0xC000
+COP_MOVLB = 0x0100
+COP_MOVLW = 0x0E00
+COP_MOVWF = 0x6E00
+COP_MULLW = 0x0D00
+COP_MULWF = 0x0200
+COP_NEGF = 0x6C00
+COP_NOP = 0x0000
+COP_NOP2 = 0xF000   # NOP in second word
+COP_POP = 0x0006
+COP_PUSH = 0x0005
+COP_RCALL = 0xD800
+COP_RESET = 0x00FF
+COP_RETFIE = 0x0010
+COP_RETLW = 0x0C00
+COP_RETURN = 0x0012
+COP_RLCF = 0x3400
+COP_RLNCF = 0x4400
+COP_RRCF = 0x3000
+COP_RRNCF = 0x4000
+COP_SETF = 0x6800
+COP_SLEEP = 0x0003
+COP_SUBFWB = 0x5400
+COP_SUBLW = 0x0800
+COP_SUBWF = 0x5C00
+COP_SUBWFB = 0x5800
+COP_SWAPF = 0x3800
+COP_TBLRD = 0x0008
+COP_TBLWT = 0x000C
+COP_TSTFSZ = 0x6600
+COP_XORLW = 0x0A00
+COP_XORWF = 0x1800
+
+# extractors of operands for formats of opcodes
+def _no_operands(cls):
+    return lambda opcode, next_opcode: cls()
+
+def _k(cls):
+    return lambda opcode, next_opcode: cls(opcode & 0xff)
+
+def _s(cls):
+    return lambda opcode, next_opcode: cls(opcode & 1)
+
+def _n2(cls):
+    return lambda opcode, next_opcode: cls(opcode & 3)
+
+def _f_a(cls):
+    return lambda opcode, next_opcode: cls(opcode & 0xff, (opcode >> 8) & 1)
+
+def _f_d_a(cls):
+    return lambda opcode, next_opcode: cls(opcode & 0xff, (opcode >> 9) & 1,
+                                           (opcode >> 8) & 1)
+
+def _f_b_a(cls):
+    return lambda opcode, next_opcode: cls(opcode & 0xff, (opcode >> 9) & 7,
+                                           (opcode >> 8) & 1)
+
+def _n8(cls):
+    return lambda opcode, next_opcode: cls((opcode & 0xff) - ((opcode & 0x80) << 1))
+
+def _n11(cls):
+    return lambda opcode, next_opcode: cls((opcode & 0x7ff) - ((opcode & 0x400) << 1))
+
+def _fs_fd(cls):
+    return lambda opcode, next_opcode: cls(opcode & 0xfff, next_opcode & 0xfff)
+
+def _lfsr(cls):
+    return lambda opcode, next_opcode: cls((opcode >> 4) & 3,
+                                           ((opcode & 0xf) << 8) | (next_opcode & 0xff))
+
+def _n20(cls):
+    return lambda opcode, next_opcode: cls((opcode & 0xff) | ((next_opcode & 0xfff) << 8))
+
+def _n20_s(cls):
+    return lambda opcode, next_opcode: cls((opcode & 0xff) | ((next_opcode & 0xfff) << 8),
+                                           (opcode >> 8) & 1)
+
+# implemented operations: code of command, mask of code, extractor
+OPCODES = [
+    (COP_NOP, MASK_COP16, _no_operands(NOP)),
+    (COP_RETURN, MASK_COP15, _s(RETURN)),
+    (COP_SLEEP, MASK_COP16, _no_operands(SLEEP)),
+    (COP_MOVLW, MASK_COP8, _k(MOVLW)),
+    (COP_GOTO, MASK_COP8, _n20(GOTO)),
+    (COP_CALL, MASK_COP7, _n20_s(CALL)),
+    (COP_MOVWF, MASK_COP7, _f_a(MOVWF)),
+    (COP_DECFSZ, MASK_COP6, _f_d_a(DECFSZ)),
+    (COP_BTFSC, MASK_COP4, _f_b_a(BTFSC)),
+    (COP_BTG, MASK_COP4, _f_b_a(BTG)),
+    (COP_ADDWF, MASK_COP6, _f_d_a(ADDWF)),
+    (COP_ADDWFC, MASK_COP6, _f_d_a(ADDWFC)),
+    (COP_SUBWF, MASK_COP6, _f_d_a(SUBWF)),
+    (COP_SUBWFB, MASK_COP6, _f_d_a(SUBWFB)),
+    (COP_SUBFWB, MASK_COP6, _f_d_a(SUBFWB)),
+    (COP_ANDWF, MASK_COP6, _f_d_a(ANDWF)),
+    (COP_IORWF, MASK_COP6, _f_d_a(IORWF)),
+    (COP_XORWF, MASK_COP6, _f_d_a(XORWF)),
+    (COP_ADDLW, MASK_COP8, _k(ADDLW)),
+    (COP_SUBLW, MASK_COP8, _k(SUBLW)),
+    (COP_ANDLW, MASK_COP8, _k(ANDLW)),
+    (COP_IORLW, MASK_COP8, _k(IORLW)),
+    (COP_XORLW, MASK_COP8, _k(XORLW)),
+    (COP_COMF, MASK_COP6, _f_d_a(COMF)),
+    (COP_MOVF, MASK_COP6, _f_d_a(MOVF)),
+    (COP_INCF, MASK_COP6, _f_d_a(INCF)),
+    (COP_DECF, MASK_COP6, _f_d_a(DECF)),
+    (COP_RLCF, MASK_COP6, _f_d_a(RLCF)),
+    (COP_RLNCF, MASK_COP6, _f_d_a(RLNCF)),
+    (COP_RRCF, MASK_COP6, _f_d_a(RRCF)),
+    (COP_RRNCF, MASK_COP6, _f_d_a(RRNCF)),
+    (COP_SWAPF, MASK_COP6, _f_d_a(SWAPF)),
+    (COP_INCFSZ, MASK_COP6, _f_d_a(INCFSZ)),
+    (COP_DCFSNZ, MASK_COP6, _f_d_a(DCFSNZ)),
+    (COP_INFSNZ, MASK_COP6, _f_d_a(INFSNZ)),
+    (COP_NEGF, MASK_COP7, _f_a(NEGF)),
+    (COP_CLRF, MASK_COP7, _f_a(CLRF)),
+    (COP_SETF, MASK_COP7, _f_a(SETF)),
+    (COP_MULWF, MASK_COP7, _f_a(MULWF)),
+    (COP_CPFSEQ, MASK_COP7, _f_a(CPFSEQ)),
+    (COP_CPFSGT, MASK_COP7, _f_a(CPFSGT)),
+    (COP_CPFSLT, MASK_COP7, _f_a(CPFSLT)),
+    (COP_TSTFSZ, MASK_COP7, _f_a(TSTFSZ)),
+    (COP_MOVFF, MASK_COP4, _fs_fd(MOVFF)),
+    (COP_BCF, MASK_COP4, _f_b_a(BCF)),
+    (COP_BSF, MASK_COP4, _f_b_a(BSF)),
+    (COP_BTFSS, MASK_COP4, _f_b_a(BTFSS)),
+    (COP_BC, MASK_COP8, _n8(BC)),
+    (COP_BNC, MASK_COP8, _n8(BNC)),
+    (COP_BN, MASK_COP8, _n8(BN)),
+    (COP_BNN, MASK_COP8, _n8(BNN)),
+    (COP_BOV, MASK_COP8, _n8(BOV)),
+    (COP_BNOV, MASK_COP8, _n8(BNOV)),
+    (COP_BZ, MASK_COP8, _n8(BZ)),
+    (COP_BNZ, MASK_COP8, _n8(BNZ)),
+    (COP_BRA, MASK_COP5, _n11(BRA)),
+    (COP_RCALL, MASK_COP5, _n11(RCALL)),
+    (COP_RETLW, MASK_COP8, _k(RETLW)),
+    (COP_RETFIE, MASK_COP15, _s(RETFIE)),
+    (COP_PUSH, MASK_COP16, _no_operands(PUSH)),
+    (COP_POP, MASK_COP16, _no_operands(POP)),
+    (COP_RESET, MASK_COP16, _no_operands(RESET)),
+    (COP_CLRWDT, MASK_COP16, _no_operands(CLRWDT)),
+    (COP_DAW, MASK_COP16, _no_operands(DAW)),
+    (COP_MOVLB, MASK_COP12, _k(MOVLB)),
+    (COP_MULLW, MASK_COP8, _k(MULLW)),
+    (COP_LFSR, MASK_COP10, _lfsr(LFSR)),
+    (COP_TBLRD, MASK_COP14, _n2(TBLRD)),
+    (COP_TBLWT, MASK_COP14, _n2(TBLWT)),
+]
+
+# operations taking two words of program memory
+LONG_OPCODES = [
+    (COP_CALL, MASK_COP7),
+    (COP_GOTO, MASK_COP8),
+    (COP_LFSR, MASK_COP10),
+    (COP_MOVFF, MASK_COP4),
+]
+
+def _codes(cop, mask):
+    """ Range of all opcodes matching code of command 'cop' under 'mask' """
+    return xrange(cop, cop + (~mask & 0xffff) + 1)
+
+def _build_tables():
+    decoders = [_no_operands(NOP)] * 0x10000
+    # more specific masks override less specific ones
+    for cop, mask, extractor in sorted(OPCODES, key=lambda entry: entry[1]):
+        for opcode in _codes(cop, mask):
+            decoders[opcode] = extractor
+    long_ops = bytearray(0x10000)
+    for cop, mask in LONG_OPCODES:
+        for opcode in _codes(cop, mask):
+            long_ops[opcode] = 1
+    return decoders, long_ops
+
+_decoders, _long_ops = _build_tables()
+_interned = {}
+
+def is_long_op(opcode):
+    """ Check whether operation with code 'opcode' takes two words """
+    return _long_ops[opcode] == 1
+
+def decode_op(opcode, next_opcode=0xffff):
+    """ Decode code of operation and return shared op object """
+    key = (next_opcode << 16) | opcode if _long_ops[opcode] else opcode
+    op = _interned.get(key)
+    if op is None:
+        op = _interned[key] = _decoders[opcode](opcode, next_opcode)
+    return op
+
+def decode_many(words):
+    """ Decode sequence of opcode words, return list of op objects per word """
+    words = list(words)
+    next_words = words[1:]
+    next_words.append(0xffff)
+    return map(decode_op, words, next_words)
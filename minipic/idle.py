@@ -0,0 +1,103 @@
+"""
+Detection of idle MCU
+
+Firmware waits for peripherals in polling loops like
+
+    loop:   BTFSS   flag, b
+            BRA     loop
+
+or in SLEEP. Their addresses are added to stop addresses of run loop, MCU.run
+then skips cycles up to the next event of scheduler instead of executing
+the loop: data memory can't change between events while MCU only polls it.
+Registers computing their value on read (like TMR0L) and indirect
+operands are polled as usual, loops polling them in access bank are dropped
+from idle points once they are seen.
+"""
+from op import BTFSC, BTFSS, GOTO, BRA, SLEEP, _operand_addr
+from scheduler import NEVER
+
+# polling ops: value of tested bit keeping loop running
+POLLING_OPS = {
+    BTFSC: 1,
+    BTFSS: 0,
+}
+
+# jumps closing polling loop: target(op, addr) returns address of target
+LOOP_JUMPS = {
+    GOTO: lambda op, addr: op.k << 1,
+    BRA: lambda op, addr: addr + 2 + (op.n << 1),
+}
+
+
+class IdleDetector:
+    """ Finder of idle points of program of MCU """
+    def __init__(self, mcu):
+        self.mcu = mcu
+        self.sleeps = self.loops = None
+        mcu.program.observers.append(self)
+
+    def invalidate(self, i):
+        self.sleeps = self.loops = None
+
+    def points(self):
+        """ Return pair of sets of addresses of SLEEP ops and polling loops """
+        if self.sleeps is None:
+            program = self.mcu.program
+            program.predecode()
+            self.sleeps, self.loops = set(), set()
+            for i, op in program.ops.items():
+                if op.__class__ is SLEEP:
+                    self.sleeps.add(i << 1)
+                elif op.__class__ in POLLING_OPS and self._jump_back(i << 1, op) is not None:
+                    self.loops.add(i << 1)
+        return self.sleeps, self.loops
+
+    def _jump_back(self, addr, test):
+        """ Op jumping from after test at 'addr' back to it or None """
+        jump = self.mcu.program[addr + test.SIZE]
+        target = LOOP_JUMPS.get(jump.__class__)
+        if target is not None and target(jump, addr + test.SIZE) == addr:
+            return jump
+        return None
+
+    def skip(self, budget, stops):
+        """ Skip whole iterations of polling loop at PC waiting for event
+
+        Return number of elapsed cycles (skipped ones not more than 'budget',
+        interrupt taken at the end adds its own) or None when loop waits for
+        ever.
+        """
+        mcu = self.mcu
+        addr = mcu.pc.value
+        test = mcu.program[addr]
+        spin = POLLING_OPS.get(test.__class__)
+        if spin is None:
+            return 0
+        jump = self._jump_back(addr, test)
+        if jump is None or addr in stops or addr + test.SIZE in stops:
+            return 0
+        f = _operand_addr(mcu, test)
+        reg = mcu.data.hooks[f]
+        if reg is not None and (reg.indirect or getattr(reg, 'read', None) is not None):
+            if not test.a:
+                # register of access bank stays volatile, so loop is never
+                # skipped and run loop needn't stop at it any more
+                self.points()[1].discard(addr)
+            return 0
+        if (mcu.data.ram[f] >> test.b) & 1 != spin:
+            return 0
+        scheduler = mcu.scheduler
+        time = scheduler.peek()
+        if time == NEVER:
+            return None
+        # event is seen by the first iteration started after it
+        period = test.CYCLES + jump.CYCLES
+        n = min(-((mcu.cycles - time) // period), budget // period)
+        if n <= 0:
+            return 0
+        start = mcu.cycles
+        mcu.cycles += n * period
+        if mcu.cycles >= scheduler.next_time:
+            scheduler.run_due(mcu.cycles)
+        # events may take cycles too (vectoring of interrupt)
+        return mcu.cycles - start
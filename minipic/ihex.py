@@ -0,0 +1,67 @@
+"""
+Loader of program images in Intel HEX format
+
+Records are streamed from any object with readline (file, mmap) or from
+iterable of lines, every record is checked against its checksum and data is
+written straight into image of program memory.
+"""
+import binascii
+
+# types of records
+DATA, EOF, EXT_SEGMENT_ADDR, START_SEGMENT_ADDR, EXT_LINEAR_ADDR, START_LINEAR_ADDR = range(6)
+
+class HexError(ValueError):
+    """ Malformed or corrupt Intel HEX image """
+    def __init__(self, lineno, message):
+        ValueError.__init__(self, 'line %d: %s' % (lineno, message))
+        self.lineno = lineno
+
+def records(stream):
+    """ Yield records of stream as tuples (line number, type, address, data) """
+    lines = iter(stream.readline, '') if hasattr(stream, 'readline') else stream
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != ':':
+            raise HexError(lineno, 'record must start with colon')
+        try:
+            raw = bytearray(binascii.unhexlify(line[1:]))
+        except (TypeError, binascii.Error):
+            raise HexError(lineno, 'record is not hexadecimal string')
+        if len(raw) < 5 or len(raw) != raw[0] + 5:
+            raise HexError(lineno, 'length of record does not match its byte count')
+        if sum(raw) & 0xff != 0:
+            raise HexError(lineno, 'checksum mismatch')
+        yield lineno, raw[3], (raw[1] << 8) | raw[2], raw[4:-1]
+
+def load(stream, program):
+    """ Load Intel HEX image from stream into program memory
+
+    Data outside of program memory (configuration words, EEPROM) is skipped.
+    Return start address given by record of type 3 or 5, or None.
+    """
+    base = lineno = 0
+    start = None
+    for lineno, type_rec, addr, data in records(stream):
+        if type_rec == DATA:
+            addr += base
+            if addr + len(data) <= program.SIZE:
+                program.write_bytes(addr, data)
+        elif type_rec == EOF:
+            return start
+        elif type_rec in (EXT_SEGMENT_ADDR, EXT_LINEAR_ADDR):
+            if len(data) != 2:
+                raise HexError(lineno, 'address record must have 2 bytes of data')
+            base = (data[0] << 8) | data[1]
+            base <<= 4 if type_rec == EXT_SEGMENT_ADDR else 16
+        elif type_rec in (START_SEGMENT_ADDR, START_LINEAR_ADDR):
+            if len(data) != 4:
+                raise HexError(lineno, 'start address record must have 4 bytes of data')
+            if type_rec == START_SEGMENT_ADDR:
+                start = (((data[0] << 8) | data[1]) << 4) + ((data[2] << 8) | data[3])
+            else:
+                start = (data[0] << 24) | (data[1] << 16) | (data[2] << 8) | data[3]
+        else:
+            raise HexError(lineno, 'unknown type of record %d' % type_rec)
+    raise HexError(lineno, 'end of file record is missing')
@@ -1,1310 +1,959 @@
-import picmicro
+from register import WREG, STATUS, BSR, RCON, INTCON, PRODL, PRODH
+from register import FSRS, TABLAT, TBLPTRL, TBLPTRH, TBLPTRU, RESET_VALUES
+from register import N, OV, Z, DC, C, ADD_FLAGS, NZ_FLAGS, ARITHMETIC_FLAGS, LOGIC_FLAGS
 
-def _operand_reg(cpu, f, a):
-    if a == 1:
-        addr = (cpu.data[BSR].get() << 8) | f
-    else:
-        addr = f if f < 0x80 else (0x0f00 | f)
-    return cpu.data[addr]
+def _operand_addr(cpu, op):
+    """ Address of file register operand of 'op' """
+    return cpu.data.bank | op.addr if op.a else op.addr
 
-def _result_reg(cpu, operand_reg, d):
-    return cpu.data[picmicro.WREG] if d == 0 else operand_reg
 
+class Op(object):
+    """ Abstract class of operation of MC
 
-class Op:
-    """ Abstract class of operation of MC """
+    Operands are listed in __slots__ and passed to constructor in the same
+    order. Op objects are immutable so one instance may be shared by all
+    program memories. execute() returns number of instruction cycles taken.
+    """
+    __slots__ = ()
     SIZE = 2
+    CYCLES = 1      # cycles of operation, skip taken adds one more
+    JUMP = False    # operation may change PC other than by its size
+    def __init__(self, *operands):
+        assert len(operands) == len(self.__slots__)
+        for name, value in zip(self.__slots__, operands):
+            object.__setattr__(self, name, value)
+    def __setattr__(self, name, value):
+        raise AttributeError("'%s' object is immutable" % self.__class__.__name__)
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self.operands() == other.operands()
+    def __ne__(self, other):
+        return not self == other
+    def __hash__(self):
+        return hash((self.__class__, self.operands()))
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(map(hex, self.operands())))
+    def operands(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
     def execute(self, cpu):
         raise NotImplementedError()
 
+class FileOp(Op):
+    """ Abstract operation on file register 'f' in access bank (a = 0) or BSR bank
+
+    Slot 'addr' follows operands and is filled when op is made: it's absolute
+    address of access bank operand or 'f' to be combined with bank base kept
+    by data memory (data.bank) for banked one. Ops reading and writing operand
+    resolve virtual register of indirect addressing first, so that FSR is
+    modified once.
+    """
+    __slots__ = ()
+    def __init__(self, *operands):
+        fields = dict(zip(self.__slots__, operands))
+        f, a = fields['f'], fields['a']
+        Op.__init__(self, *(operands + (f if a or f < 0x80 else 0x0f00 | f,)))
+    def operands(self):
+        return Op.operands(self)[:-1]
+
 class NOP(Op):
     """ No operation """
+    __slots__ = ()
+    def execute(self, cpu):
+        cpu.pc.inc(self.SIZE)
+        return 1
+
+class SLEEP(Op):
+    """ Go into sleep mode until event of peripheral """
+    __slots__ = ()
     def execute(self, cpu):
+        # power-down bit is cleared, time-out bit is set
+        data = cpu.data
+        reg = data.hooks[RCON]
+        value = ((data.ram[RCON] if reg is None else reg.get()) & ~0x04) | 0x08
+        if reg is None:
+            data.ram[RCON] = value
+        else:
+            reg.put(value)
+        cpu.sleeping = True
         cpu.pc.inc(self.SIZE)
+        return 1
 
 class MOVLW(Op):
     """ Move constant to WREG """
-    def __init__(self, k):
-        self.k = k
+    __slots__ = ('k',)
     def execute(self, cpu):
-        cpu.data[picmicro.WREG].put(self.k)
+        cpu.data.hooks[WREG].put(self.k)
         cpu.pc.inc(self.SIZE)
+        return 1
 
-class MOVWF(Op):
+class MOVWF(FileOp):
     """ Mov WREG to 'f' """
-    def __init__(self, f, a):
-        self.f = f
-        self.a = a
+    __slots__ = ('f', 'a', 'addr')
     def execute(self, cpu):
-        wreg_value = cpu.data[picmicro.WREG].get()
-        dest = _operand_reg(cpu, self.f, self.a)
-        dest.put(wreg_value) 
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        value = data.hooks[WREG].get()
+        reg = data.hooks[addr]
         cpu.pc.inc(self.SIZE)
+        if reg is None:
+            data.ram[addr] = value
+        else:
+            reg.put(value)
+        return 1
 
-class BTG(Op):
+class BTG(FileOp):
     """ Inverse bit in 'f' """
-    def __init__(self, f, b, a):
-        self.f = f
-        self.b = b
-        self.a = a
+    __slots__ = ('f', 'b', 'a', 'addr')
     def execute(self, cpu):
-        reg = _operand_reg(cpu, self.f, self.a)
-        reg[self.a] ^= 1
-        cpu.pc.inc(self.SIZE)
-
-class BTFSC(Op):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        if reg is None:
+            cpu.pc.inc(self.SIZE)
+            data.ram[addr] ^= 1 << self.b
+        else:
+            value = reg.get() ^ (1 << self.b)
+            cpu.pc.inc(self.SIZE)
+            reg.put(value)
+        return 1
+
+class BTFSC(FileOp):
     """ Test bit and skip next instruction if it's equal 0 """
-    def __init__(self, f, b, a):
-        self.f = f
-        self.b = b
-        self.a = a
+    __slots__ = ('f', 'b', 'a', 'addr')
+    JUMP = True
     def execute(self, cpu):
-        reg = _operand_reg(cpu, self.f, self.a)
-        if reg[self.b] == 0:
-            cpu.pc.inc(2)
-        cpu.pc.inc(self.SIZE)
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        value = data.ram[addr] if reg is None else reg.get()
+        pc = cpu.pc
+        if (value >> self.b) & 1:
+            pc.value = (pc.value + 2) % pc.MAX_VALUE
+            return 1
+        pc.value = (pc.value + 4) % pc.MAX_VALUE
+        return 2
 
 class CALL(Op):
     """ Goto subroutine in all range of memory """
+    __slots__ = ('n', 's')
     SIZE = 4
-    def __init__(self, n, s):
-        self.n = n
-        self.s = s
+    CYCLES = 2
+    JUMP = True
     def execute(self, cpu):
         cpu.stack.push(cpu.pc.value + 4)
         cpu.pc.value = self.n << 1
         if self.s == 1:
-            cpu.stack.ws = cpu.data[picmicro.WREG].get()
-            cpu.stack.statuss = cpu.data[picmicro.STATUS].get()
-            cpu.stack.bsrs = cpu.data[picmicro.BSR].get()
+            hooks = cpu.data.hooks
+            cpu.stack.ws = hooks[WREG].get()
+            cpu.stack.statuss = hooks[STATUS].get()
+            cpu.stack.bsrs = hooks[BSR].get()
+        return 2
 
-class DECFSZ(Op):
+class DECFSZ(FileOp):
     """ Decrement 'f', skip next instruction if result is equal 0 """
-    def __init__(self, f, d, a):
-        self.f = f
-        self.d = d
-        self.a = a
+    __slots__ = ('f', 'd', 'a', 'addr')
+    JUMP = True
     def execute(self, cpu):
-        src = _operand_reg(cpu, self.f, self.a)
-        dest = _result_reg(cpu, src, self.d)
-        result = src.get() - 1
-        if result == 0:
-            cpu.pc.inc(2)
-        dest.put(result)
-        cpu.pc.inc(self.SIZE)
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        result = ((data.ram[addr] if reg is None else reg.get()) - 1) & 0xff
+        if self.d == 0:
+            addr = WREG
+            reg = data.hooks[WREG]
+        if reg is None:
+            data.ram[addr] = result
+        else:
+            reg.put(result)
+        pc = cpu.pc
+        if result:
+            pc.value = (pc.value + 2) % pc.MAX_VALUE
+            return 1
+        pc.value = (pc.value + 4) % pc.MAX_VALUE
+        return 2
 
 class GOTO(Op):
     """ Go to specific address """
+    __slots__ = ('k',)
     SIZE = 4
-    def __init__(self, k):
-        self.k = k
+    CYCLES = 2
+    JUMP = True
     def execute(self, cpu):
         cpu.pc.value = self.k << 1
+        return 2
 
 class RETURN(Op):
     """ Return from subroutine """
-    SIZE = 1
-    def __init__(self, s):
-        self.s = s
+    __slots__ = ('s',)
+    CYCLES = 2
+    JUMP = True
     def execute(self, cpu):
         cpu.pc.value = cpu.stack.pop()
         if self.s == 1:
-            cpu.data[picmicro.WREG].set(pic.stack.ws)
-            cpu.data[picmicro.STATUS].set(pic.stack.statuss)
-            cpu.data[picmicro.BSR].set(pic.stack.bsrs)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-# bitmasks of flags
-#N, OV, Z, DC, C = 0b10000, 0b01000, 0b00100, 0b00010, 0b00001
-
-#def _add(cpu, resAddr, arg1, arg2):
-    #"""Internal procedure that performs addition 'arg1' and 'arg2' and saving result by address 'resAddr'
-    #This operation affects C, DC, Z, OV, N flags
-    #cpu: core of PIC18F
-    #resAddr: address of saving result
-    #arg1: first argument of operation
-    #arg2: second argument of operation
-    #"""
-    #result = arg1 + arg2
-
-    #carry = (result & 0x100) >> 8
-    #set_bits = carry
-    #decCarry = (((arg1 & 0xf) + (arg2 & 0xf)) & 0x10) >> 4
-    #set_specificbits |= decCarry << 1
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #signCarry = (((arg1 & 0x7f) + (arg2 & 0x7f)) & 0x80) >> 7
-    #set_bits |= (signCarry ^ carry) << 3
-    #sign = (result & 0x80) >> 7
-    #set_bits |= sign << 4
-
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#def _and(cpu, resAddr, arg1, arg2):
-    #"""Internal procedure that performs bitwise conjuction 'arg1' with 'arg2' and saving result by address 'resAddr'
-    #This operation affects Z and N flags
-    #cpu: core of PIC18F
-    #resAddr: address of result
-    #arg1: first argument of operation
-    #arg2: second argument of operation
-    #"""
-    #result = arg1 & arg2
-    #set_bits = 0
-    #if result == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #cpu.data[resAddr] = result
-    #cpu.affectStatusBits(N | Z, set_bits)
-
-#def _ior(cpu, resAddr, arg1, arg2):
-    #"""Internal procedure for bitwise disjunction between 'arg1' and 'arg2' and saving result by address 'resAddr'
-    #This operation affects Z and N flags
-    #cpu: core of PIC18F
-    #resAddr: address for result
-    #arg1: first argument
-    #arg2: second argument
-    #"""
-    #result = arg1 | arg2
-    #set_bits = 0
-    #if result == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #cpu.data[resAddr] = result
-    #cpu.affectStatusBits(N | Z, set_bits)
-
-#def _xor(cpu, resAddr, arg1, arg2):
-    #"""Internal procedure for exclusive disjunction between 'arg1' and 'arg2' and saving result in memory cell by address 'resAddr'
-    #This operation affects Z and N flags
-    #cpu: core of PIC18F
-    #resAddr: address for result
-    #arg1: first argument
-    #arg2: second argument
-    #"""
-    #result = arg1 ^ arg2
-    #set_bits = 0
-    #if result == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #cpu.data[resAddr] = result
-    #cpu.affectStatusBits(N | Z, set_bits)
-
-#########################################
-## Byte oriented commands with registers
-#########################################
-#def addwf(cpu, f, d, a):
-    #"""Add WREG with 'f'
-    #affect C, DC, Z, OV, N
-    #cpu: core of PIC18F
-    #f: part of register address of second term of sum
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying address of second term of sum (if a = 1 then address defined BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = argAddr if d == 1 else WREG
-    #_add(cpu, resAddr, pic.wreg, pic.data[argAddr])
-
-#addwf.size = 2
-
-
-#def addwfc(cpu, f, d, a):
-    #"""Add WREG with 'f' and with bit C
-    #affect C, DC, Z, OV, N
-    #cpu: core of PIC18F
-    #f: part of register address of second term of sum
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying address of second term of sum (if a = 1 then address defined BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #carryFlag = cpu.status & C
-    #arg1, arg2 = cpu.wreg, pic.data[argAddr]
-    #result = arg1 + arg2 + carryFlag
-
-    #carry = (result & 0x100) >> 8
-    #set_bits = carry
-    #decCarry = (((arg1 & 0xf) + (arg2 & 0xf) + carryFlag) & 0x10) >> 4
-    #set_bits |= decCarry << 1
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #signCarry = (((arg1 & 0x7f) + (arg2 & 0x7f) + carryFlag) & 0x80) >> 7
-    #set_bits |= (signCarry ^ carry) << 3
-    #sign = (result & 0x80) >> 7
-    #set_bits |= sign << 4
-
-    #resAddr = WREG if d == 0 else argAddr
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
- 
-#addwfc.size = 2
-
-
-#def andwf(cpu, f, d, a):
-    #"""Conjunction between WREG and 'f'
-    #affect Z, N
-    #cpu: core of PIC18F
-    #f: part of register address of second term of conjunction
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying address of second term of conjuction (if a = 1 then address defined BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-    #_and(cpu, resAddr, pic.wreg, pic.data[argAddr]) 
-    
-#andwf.size = 2
-
-
-#def clrf(cpu, f, a):
-    #"""Clear register 'f'
-    #affect Z
-    #cpu: core of PIC18F
-    #f: part of register address
-    #a: flag specifying register address (if a = 1 then address defined BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #cpu.data[argAddr] = 0
-    #cpu.affectStatusBits(Z, Z)
-
-#clrf.size = 2
-
-
-#def comf(cpu, f, d, a):
-    #"""Inverse register 'f'
-    #affect Z, N
-    #cpu: core of PIC18F
-    #f: part of register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = ~cpu.data[argAddr] & 0xff
-    #set_bits = 0
-    #if result == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #cpu.data[resAddr] = result
-    #cpu.affectStatusBits(N | Z, set_bits)
-
-#comf.size = 2
-
-
-#def cpfseq(cpu, f, a):
-    #"""Compare WREG and 'f'; skip next instuction if they are equal
-    #cpu: core of PIC18F
-    #f: part of register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #if cpu.data[argAddr] == pic.wreg:
-        #cpu.incPC(2)
-
-#cpfseq.size = 2
-
-
-#def cpfsgt(cpu, f, a):
-    #"""Compare WREG and 'f'; if WREG > 'f' then skip next instruction
-    #cpu: core of PIC18F
-    #f: part of register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #if cpu.data[argAddr] < pic.wreg:
-        #cpu.incPC(2)
-
-#cpfsgt.size = 2
-
-
-#def cpfslt(cpu,f, a):
-    #"""Compare WREG and 'f'; if WREG < 'f' then skip next instruction
-    #cpu: core of PIC18F
-    #f: part of register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #if cpu.data[argAddr] > pic.wreg:
-        #cpu.incPC(2)
-
-#cpfslt.size = 2
-
-
-#def decf(cpu, f, d, a):
-    #"""Decrement 'f'
-    #affect C, DC, Z, OV, N flags
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg = cpu.data[argAddr]
-    #result = arg - 1
-    #set_bits = 0
-    #if arg != 0:
-        #set_bits |= C
-    #if (arg & 0xf) != 0:
-        #set_bits |= DC
-    #if result == 0:
-        #set_bits |= Z
-    #if result == 0x7f:
-        #set_bits |= OV
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#decf.size = 2
-
-
-#def decfsz(cpu, f, d, a):
-    #"""Decrement 'f'; skip next instruction if result is equal zero
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = cpu.data[argAddr] - 1
-    #if result == 0:
-        #cpu.incPC(2)
-    #cpu.data[resAddr] = result & 0xff
-
-#decf.size = 2
-
-
-#def dcfsnz(cpu, f, d, a):
-    #"""Decrement 'f'; skip next instruction if result is not equal zero
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = cpu.data[argAddr] - 1
-    #if result != 0:
-        #cpu.incPC(2)
-    #cpu.data[resAddr] = result & 0xff
-
-#dcfsnz.size = 2
-
-
-#def incf(cpu, f, d, a):
-    #"""Increment 'f'
-    #affect C, DC, Z, OV, N flags
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg = cpu.data[argAddr]
-    #result = arg + 1
-    #set_bits = 0
-    #if arg == 0xff:
-        #set_bits |= C
-    #if (arg & 0xf) == 0xf:
-        #set_bits |= DC
-    #if (result & 0xff) == 0:
-        #set_bits |= Z
-    #if result == 0x80:
-        #set_bits |= OV
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#incf.size = 2
-
-
-#def incfsz(cpu, f, d, a):
-    #"""Increment 'f'; skip next instruction if result is equal zero
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = (cpu.data[argAddr] + 1) & 0xff
-    #if result == 0:
-        #cpu.incPC(2)
-    #cpu.data[resAddr] = result
-
-#incfsz.size = 2
-
-
-#def infsnz(cpu, f, d, a):
-    #"""Increment 'f'; skip next instruction if result is not equal zero
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = (cpu.data[argAddr] + 1) & 0xff
-    #if result != 0:
-        #cpu.incPC(2)
-    #cpu.data[resAddr] = result
-
-#infsnz.size = 2
-
-
-#def iorwf(cpu, f, d, a):
-    #"""Logic disjunction between WREG and 'f';
-    #Flags Z and N are affected
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-    #_ior(cpu, resAddr, pic.wreg, pic.data[argAddr])
-
-#iorwf.size = 2
-
-
-#def movf(cpu, f, d, a):
-    #"""Move 'f'
-    #Flags Z and N are affected
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-    #cpu.data[resAddr] = pic.data[argAddr]
-
-#movf.size = 2
-
-
-#def movff(cpu, fs, fd):
-    #"""Move source 'fs' to destination 'fd'
-    #cpu: core of PIC18F
-    #fs: address of source
-    #fd: address of destination
-    #"""
-    #assert fs != PCL and fs != TOSU and fs != TOSH and fs != TOSL
-    #cpu.data[fd] = pic.data[fs]
-
-#movff.size = 4
-
-
-#def movwf(cpu, f, a):
-    #"""Move WREG to 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #cpu.data[argAddr] = pic.wreg
-
-#movwf.size = 2
-
-
-#def mulwf(cpu, f, a):
-    #"""Multiply WREG and 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #result = cpu.wreg * pic.data[argAddr]
-    #cpu.prodl = result & 0xff
-    #cpu.prodh = (result & 0xff00) >> 8
-
-#mulwf.size = 2
-
-
-#def negf(cpu, f, a):
-    #"""Negative value of 'f'
-    #Flags C, DC, Z, OV, N are affected
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-
-    #result = (~cpu.data[argAddr] + 1) & 0xff
-    #set_bits = 0
-    #if result & 0x80 > 0:
-        #set_bits |= N
-    #if result == 0:
-        #set_bits |= (C | Z)
-    #if result & 0xf == 0:
-        #set_bits |= DC
-    #if result == 0x80:
-        #set_bits |= OV
-    #cpu.data[argAddr] = result
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#negf.size = 2
-
-
-#def rlcf(cpu, f, d, a):
-    #"""Left shift with carry
-    #Flags C, Z, N are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = cpu.data[argAddr] << 1
-    #result |= cpu.status & C
-    #set_bits = (result & 0x100) >> 8
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(C | Z | N, set_bits)
-
-#rlcf.size = 2
-
-
-#def rlncf(cpu, f, d, a):
-    #"""Left shift without carry
-    #Flags Z, N are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #result = cpu.data[argAddr] << 1
-    #result |= (result >> 8)
-    #set_bits = 0
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(Z | N, set_bits)
-
-#rlncf.size = 2
-
-
-#def rrcf(cpu, f, d, a):
-    #"""Right shift with carry
-    #Flags C, Z, N are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg = cpu.data[argAddr]
-    #set_bits = arg & 0x1
-    #result = (arg >> 1) | ((cpu.status & C) << 7)
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result
-    #cpu.affectStatusBits(C | Z | N, set_bits)
-
-#rrcf.size = 2
-
-
-#def rrncf(cpu, f, d, a):
-    #"""Right shift without carry
-    #Flags Z, N are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg = cpu.data[argAddr]
-    #arg |= ((arg & 0b1) << 8)
-    #result = arg >> 1
-    #set_bits = 0
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result
-    #cpu.affectStatusBits(Z | N, set_bits)
-
-#rrncf.size = 2
-
-
-#def setf(cpu, f, a):
-    #"""Set all bits of 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #cpu.data[argAddr] = 0xff
-
-#setf.size = 2
-
-
-#def subfwb(cpu, f, d, a):
-    #"""Substitute 'f' from WREG with borrow
-    #Flags Z, N, OV, DC, C are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg1 = cpu.wreg
-    #arg2 = (-cpu.data[argAddr]) & 0xff
-    #arg3 = 0 if (cpu.status & C == 1) else 0xff
-    #result = arg1 + arg2 + arg3
-
-    #set_bits = 0
-    #if result & 0xf00 > 0:
-        #set_bits |= C
-    #if ((arg1 & 0xf) + (arg2 & 0xf) + (arg3 & 0xf)) & 0xf0 > 0:
-        #set_bits |= DC
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #carryIntoSign = ((arg1 & 0x7f) + (arg2 & 0x7f) + (arg3 & 0x7f)) & 0x80
-    #if ((result & 0x100) ^ (carryIntoSign << 1)) > 0:
-        #set_bits |= OV
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#subfwb.size = 2
-
-
-#def subwf(cpu, f, d, a):
-    #"""Substitute WREG from 'f'
-    #Flags Z, N, OV, DC, C are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg1, arg2 = cpu.data[argAddr], (~pic.wreg + 1) & 0xff
-    #result = arg1 + arg2
-
-    #set_bits = 0
-    #if result & 0x100 > 0:
-        #set_bits |= C
-    #if ((arg1 & 0xf) + (arg2 & 0xf)) & 0x10 > 0:
-        #set_bits |= DC
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #if (arg1 & 0x80 == arg2 & 0x80) and (arg1 & 0x80 != result & 0x80):
-        #set_bits |= OV
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#subwf.size = 2
-
-
-#def subwfb(cpu, f, d, a):
-    #"""Substitute WREG from 'f' with borrow
-    #Flags Z, N, OV, DC, C are affects
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg1 = cpu.data[argAddr]
-    #arg2 = (-cpu.wreg) & 0xff
-    #arg3 = 0 if (cpu.status & C == 1) else 0xff
-    #result = arg1 + arg2 + arg3
-
-    #set_bits = 0
-    #if result & 0xf00 > 0:
-        #set_bits |= C
-    #if ((arg1 & 0xf) + (arg2 & 0xf) + (arg3 & 0xf)) & 0xf0 > 0:
-        #set_bits |= DC
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #carryIntoSign = ((arg1 & 0x7f) + (arg2 & 0x7f) + (arg3 & 0x7f)) & 0x80
-    #if ((result & 0x100) ^ (carryIntoSign << 1)) > 0:
-        #set_bits |= OV
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.data[resAddr] = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#subwfb.size = 2
-
-
-#def swapf(cpu, f, d, a):
-    #"""Exchange nibbles in 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = WREG if d == 0 else argAddr
-
-    #arg = cpu.data[argAddr]
-    #nibble1, nibble2 = arg & 0xf, (arg & 0xf0) >> 4
-    #cpu.data[resAddr] = (nibble1 << 4) | nibble2
-
-#swapf.size = 2
-
-
-#def tstfsz(cpu, f, a):
-    #"""Test 'f', skip next instruction if it's equal 0
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #if cpu.data[argAddr] == 0:
-        #cpu.incPC(2)
-
-#tstfsz.size = 2
-
-
-#def xorwf(cpu, f, d, a):
-    #"""Logical exclusive OR between WREG and 'f'
-    #Flags Z and N are affected
-    #f: part of argument register address
-    #d: flag specifying direction of saving result (if d = 0 then result is saved in WREG else in register by address defined 'f')
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #resAddr = argAddr if d == 1 else WREG
-    #_xor(cpu, resAddr, pic.wreg, pic.data[argAddr])
-
-#xorwf.size = 2
-
-
-###################################################
-## Bit oriented operations with registries
-###################################################
-#def bcf(cpu, f, b, a):
-    #"""Reset bit in 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #b: number of bit to be reset
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #cpu.data[argAddr] &= ~(1 << b)
-
-#bcf.size = 2
-
-
-#def bsf(cpu, f, b, a):
-    #"""Set bit in 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #b: number of bit to be set
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #cpu.data[argAddr] |= (1 << b)
-
-#bsf.size = 2
-
-
-#def btfsc(cpu, f, b, a):
-    #"""Test bit; skip next instruction if it's equal '0'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #b: number of bit for testing
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #bit = (cpu.data[argAddr] >> b) & 0x01
-    #if bit == 0:
-        #cpu.incPC(2)
-
-#btfsc.size = 2
-
-
-#def btfss(cpu, f, b, a):
-    #"""Test bit; skip next instruction if it's equal '1'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #b: number of bit for testing
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #bit = (cpu.data[argAddr] >> b) & 0x01
-    #if bit == 1:
-        #cpu.incPC(2)
-
-#btfss.size = 2
-
-
-#def btg(cpu, f, b, a):
-    #"""Inverse bit in 'f'
-    #cpu: core of PIC18F
-    #f: part of argument register address
-    #b: number of bit for testing
-    #a: flag specifying register address (if a = 1 then address is defined with BSR else fast access bank is used)
-    #"""
-    #if a == 1:
-        #argAddr = (cpu.bsr << 8) | f
-    #else:
-        #argAddr = f if f < 0x80 else (0xf00 | f)
-    #arg = cpu.data[argAddr]
-    #cpu.data[argAddr] = (arg | (1 << b)) & ~(arg & (1 << b))
-
-#btg.size = 2
-
-
-##############################################
-## Control instructions
-##############################################
-#def bc(cpu, n):
-    #"""Branch if carry
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & C) > 0:
-        #cpu.incPC(2*n)
-
-#bc.size = 2
-
-
-#def bn(cpu, n):
-    #"""Branch if negative result
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & N) > 0:
-        #cpu.incPC(2*n)
-
-#bn.size = 2
-
-
-#def bnc(cpu, n):
-    #"""Branch if not carry
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & C) == 0:
-        #cpu.incPC(2*n)
-
-#bnc.size = 2
-
-
-#def bnn(cpu, n):
-    #"""Branch if not negative result
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & N) == 0:
-        #cpu.incPC(2*n)
-
-#bnn.size = 2
+            hooks = cpu.data.hooks
+            hooks[WREG].put(cpu.stack.ws)
+            hooks[STATUS].put(cpu.stack.statuss)
+            hooks[BSR].put(cpu.stack.bsrs)
+        return 2
+
+
+# functions of ALU: alu(w, x, status) returns result and flags for WREG 'w',
+# operand 'x' and STATUS register 'status'; flags come from lookup tables
+def _add(w, x, status):
+    return (w + x) & 0xff, ADD_FLAGS[(w << 8) | x]
+
+def _add_carry(w, x, status):
+    c = status.get() & C
+    return (w + x + c) & 0xff, ADD_FLAGS[(c << 16) | (w << 8) | x]
+
+def _sub(w, x, status):
+    """ x - w """
+    w ^= 0xff
+    return (x + w + 1) & 0xff, ADD_FLAGS[0x10000 | (x << 8) | w]
+
+def _sub_borrow(w, x, status):
+    """ x - w - borrow """
+    c = status.get() & C
+    w ^= 0xff
+    return (x + w + c) & 0xff, ADD_FLAGS[(c << 16) | (x << 8) | w]
+
+def _sub_from_w(w, x, status):
+    """ w - x - borrow """
+    c = status.get() & C
+    x ^= 0xff
+    return (w + x + c) & 0xff, ADD_FLAGS[(c << 16) | (w << 8) | x]
+
+def _and(w, x, status):
+    result = w & x
+    return result, NZ_FLAGS[result]
+
+def _ior(w, x, status):
+    result = w | x
+    return result, NZ_FLAGS[result]
+
+def _xor(w, x, status):
+    result = w ^ x
+    return result, NZ_FLAGS[result]
+
+
+class ByteALU(FileOp):
+    """ Abstract ALU operation on WREG and 'f' saving result to WREG (d = 0) or 'f'
+
+    Flags from alu() replace bits FLAGS of STATUS in one store. PC is advanced
+    before result is stored, so result written into PCL makes jump.
+    """
+    __slots__ = ()
+    FLAGS = 0
+    def execute(self, cpu):
+        data = cpu.data
+        ram, hooks = data.ram, data.hooks
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        value = ram[addr] if reg is None else reg.get()
+        status = hooks[STATUS]
+        result, flags = self.alu(hooks[WREG].get(), value, status)
+        cpu.pc.inc(self.SIZE)
+        if self.d == 0:
+            addr = WREG
+            reg = hooks[WREG]
+        if reg is None:
+            ram[addr] = result
+        else:
+            reg.put(result)
+        status.update(self.FLAGS, flags)
+        return 1
+
+class LiteralALU(Op):
+    """ Abstract ALU operation on WREG and constant 'k' saving result to WREG """
+    __slots__ = ()
+    FLAGS = 0
+    def execute(self, cpu):
+        hooks = cpu.data.hooks
+        wreg, status = hooks[WREG], hooks[STATUS]
+        result, flags = self.alu(wreg.get(), self.k, status)
+        wreg.put(result)
+        status.update(self.FLAGS, flags)
+        cpu.pc.inc(self.SIZE)
+        return 1
+
+class ADDWF(ByteALU):
+    """ Add WREG and 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_add)
+
+class ADDWFC(ByteALU):
+    """ Add WREG, 'f' and carry """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_add_carry)
+
+class SUBWF(ByteALU):
+    """ Subtract WREG from 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_sub)
+
+class SUBWFB(ByteALU):
+    """ Subtract WREG and borrow from 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_sub_borrow)
+
+class SUBFWB(ByteALU):
+    """ Subtract 'f' and borrow from WREG """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_sub_from_w)
+
+class ANDWF(ByteALU):
+    """ AND WREG with 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_and)
+
+class IORWF(ByteALU):
+    """ Inclusive OR WREG with 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_ior)
+
+class XORWF(ByteALU):
+    """ Exclusive OR WREG with 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_xor)
+
+class ADDLW(LiteralALU):
+    """ Add constant to WREG """
+    __slots__ = ('k',)
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_add)
+
+class SUBLW(LiteralALU):
+    """ Subtract WREG from constant """
+    __slots__ = ('k',)
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_sub)
+
+class ANDLW(LiteralALU):
+    """ AND constant with WREG """
+    __slots__ = ('k',)
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_and)
+
+class IORLW(LiteralALU):
+    """ Inclusive OR constant with WREG """
+    __slots__ = ('k',)
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_ior)
+
+class XORLW(LiteralALU):
+    """ Exclusive OR constant with WREG """
+    __slots__ = ('k',)
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_xor)
+
+
+def _com(w, x, status):
+    x ^= 0xff
+    return x, NZ_FLAGS[x]
+
+def _mov(w, x, status):
+    return x, NZ_FLAGS[x]
+
+def _inc(w, x, status):
+    return (x + 1) & 0xff, ADD_FLAGS[(x << 8) | 1]
+
+def _dec(w, x, status):
+    return (x + 0xff) & 0xff, ADD_FLAGS[0x10000 | (x << 8) | 0xfe]
+
+def _neg(w, x, status):
+    x ^= 0xff
+    return (x + 1) & 0xff, ADD_FLAGS[0x10000 | x]
+
+def _rlc(w, x, status):
+    result = ((x << 1) | (status.get() & C)) & 0xff
+    return result, NZ_FLAGS[result] | (x >> 7)
+
+def _rlnc(w, x, status):
+    result = ((x << 1) | (x >> 7)) & 0xff
+    return result, NZ_FLAGS[result]
+
+def _rrc(w, x, status):
+    result = (x >> 1) | ((status.get() & C) << 7)
+    return result, NZ_FLAGS[result] | (x & 1)
+
+def _rrnc(w, x, status):
+    result = (x >> 1) | ((x & 1) << 7)
+    return result, NZ_FLAGS[result]
+
+def _swap(w, x, status):
+    return ((x << 4) | (x >> 4)) & 0xff, 0
+
+def _clr(w, x, status):
+    return 0, Z
+
+def _set(w, x, status):
+    return 0xff, 0
+
+class COMF(ByteALU):
+    """ Complement 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_com)
+
+class MOVF(ByteALU):
+    """ Move 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_mov)
+
+class INCF(ByteALU):
+    """ Increment 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_inc)
+
+class DECF(ByteALU):
+    """ Decrement 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_dec)
+
+class RLCF(ByteALU):
+    """ Rotate left 'f' through carry """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS | C
+    alu = staticmethod(_rlc)
+
+class RLNCF(ByteALU):
+    """ Rotate left 'f' (no carry) """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_rlnc)
+
+class RRCF(ByteALU):
+    """ Rotate right 'f' through carry """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS | C
+    alu = staticmethod(_rrc)
+
+class RRNCF(ByteALU):
+    """ Rotate right 'f' (no carry) """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    FLAGS = LOGIC_FLAGS
+    alu = staticmethod(_rrnc)
+
+class SWAPF(ByteALU):
+    """ Swap nibbles in 'f' """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    alu = staticmethod(_swap)
+
+class NEGF(ByteALU):
+    """ Negate 'f' """
+    __slots__ = ('f', 'a', 'addr')
+    d = 1
+    FLAGS = ARITHMETIC_FLAGS
+    alu = staticmethod(_neg)
+
+class CLRF(ByteALU):
+    """ Clear 'f' """
+    __slots__ = ('f', 'a', 'addr')
+    d = 1
+    FLAGS = Z
+    alu = staticmethod(_clr)
+
+class SETF(ByteALU):
+    """ Set all bits of 'f' """
+    __slots__ = ('f', 'a', 'addr')
+    d = 1
+    alu = staticmethod(_set)
+
+def _read(data, addr):
+    reg = data.hooks[addr]
+    return data.ram[addr] if reg is None else reg.get()
+
+def _write(data, addr, value):
+    reg = data.hooks[addr]
+    if reg is None:
+        data.ram[addr] = value
+    else:
+        reg.put(value)
 
+class MOVFF(Op):
+    """ Move 'fs' to 'fd' in all range of data memory """
+    __slots__ = ('fs', 'fd')
+    SIZE = 4
+    CYCLES = 2
+    def execute(self, cpu):
+        data = cpu.data
+        value = _read(data, self.fs)
+        cpu.pc.inc(self.SIZE)
+        _write(data, self.fd, value)
+        return 2
 
-#def bnov(cpu, n):
-    #"""Branch if not overflow
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & OV) == 0:
-        #cpu.incPC(2*n)
+class MULWF(FileOp):
+    """ Multiply WREG and 'f' into PRODH:PRODL """
+    __slots__ = ('f', 'a', 'addr')
+    def execute(self, cpu):
+        data = cpu.data
+        product = data.hooks[WREG].get() * _read(data, data.bank | self.addr if self.a else self.addr)
+        _write(data, PRODL, product & 0xff)
+        _write(data, PRODH, product >> 8)
+        cpu.pc.inc(self.SIZE)
+        return 1
 
-#bnov.size = 2
+class MULLW(Op):
+    """ Multiply WREG and constant into PRODH:PRODL """
+    __slots__ = ('k',)
+    def execute(self, cpu):
+        data = cpu.data
+        product = data.hooks[WREG].get() * self.k
+        _write(data, PRODL, product & 0xff)
+        _write(data, PRODH, product >> 8)
+        cpu.pc.inc(self.SIZE)
+        return 1
 
+class BCF(FileOp):
+    """ Clear bit in 'f' """
+    __slots__ = ('f', 'b', 'a', 'addr')
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        if reg is None:
+            cpu.pc.inc(self.SIZE)
+            data.ram[addr] &= ~(1 << self.b)
+        else:
+            value = reg.get() & ~(1 << self.b)
+            cpu.pc.inc(self.SIZE)
+            reg.put(value)
+        return 1
+
+class BSF(FileOp):
+    """ Set bit in 'f' """
+    __slots__ = ('f', 'b', 'a', 'addr')
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        if reg is None:
+            cpu.pc.inc(self.SIZE)
+            data.ram[addr] |= 1 << self.b
+        else:
+            value = reg.get() | (1 << self.b)
+            cpu.pc.inc(self.SIZE)
+            reg.put(value)
+        return 1
+
+class BTFSS(FileOp):
+    """ Test bit and skip next instruction if it's equal 1 """
+    __slots__ = ('f', 'b', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        value = data.ram[addr] if reg is None else reg.get()
+        pc = cpu.pc
+        if (value >> self.b) & 1:
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class CPFSEQ(FileOp):
+    """ Compare 'f' with WREG, skip next instruction if 'f' = WREG """
+    __slots__ = ('f', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        value = data.ram[addr] if reg is None else reg.get()
+        pc = cpu.pc
+        if value == data.hooks[WREG].get():
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class CPFSGT(FileOp):
+    """ Compare 'f' with WREG, skip next instruction if 'f' > WREG """
+    __slots__ = ('f', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        value = data.ram[addr] if reg is None else reg.get()
+        pc = cpu.pc
+        if value > data.hooks[WREG].get():
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class CPFSLT(FileOp):
+    """ Compare 'f' with WREG, skip next instruction if 'f' < WREG """
+    __slots__ = ('f', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        value = data.ram[addr] if reg is None else reg.get()
+        pc = cpu.pc
+        if value < data.hooks[WREG].get():
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class TSTFSZ(FileOp):
+    """ Test 'f', skip next instruction if it's equal 0 """
+    __slots__ = ('f', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        value = data.ram[addr] if reg is None else reg.get()
+        pc = cpu.pc
+        if value == 0:
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class INCFSZ(FileOp):
+    """ Increment 'f', skip next instruction if result is equal 0 """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        result = ((data.ram[addr] if reg is None else reg.get()) + 1) & 0xff
+        if self.d == 0:
+            addr = WREG
+            reg = data.hooks[WREG]
+        if reg is None:
+            data.ram[addr] = result
+        else:
+            reg.put(result)
+        pc = cpu.pc
+        if result:
+            pc.value = (pc.value + 2) % pc.MAX_VALUE
+            return 1
+        pc.value = (pc.value + 4) % pc.MAX_VALUE
+        return 2
+
+class DCFSNZ(FileOp):
+    """ Decrement 'f', skip next instruction if result isn't equal 0 """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        result = ((data.ram[addr] if reg is None else reg.get()) - 1) & 0xff
+        if self.d == 0:
+            addr = WREG
+            reg = data.hooks[WREG]
+        if reg is None:
+            data.ram[addr] = result
+        else:
+            reg.put(result)
+        pc = cpu.pc
+        if result:
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class INFSNZ(FileOp):
+    """ Increment 'f', skip next instruction if result isn't equal 0 """
+    __slots__ = ('f', 'd', 'a', 'addr')
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        addr = data.bank | self.addr if self.a else self.addr
+        reg = data.hooks[addr]
+        if reg is not None and reg.indirect:
+            addr, reg = reg.target()
+        result = ((data.ram[addr] if reg is None else reg.get()) + 1) & 0xff
+        if self.d == 0:
+            addr = WREG
+            reg = data.hooks[WREG]
+        if reg is None:
+            data.ram[addr] = result
+        else:
+            reg.put(result)
+        pc = cpu.pc
+        if result:
+            pc.value = (pc.value + 4) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class Branch(Op):
+    """ Abstract conditional branch taken when bits FLAG of STATUS are WHEN
+
+    Target is relative to the next op by 'n' words.
+    """
+    __slots__ = ()
+    JUMP = True
+    FLAG = WHEN = 0
+    def execute(self, cpu):
+        pc = cpu.pc
+        if cpu.data.hooks[STATUS].get() & self.FLAG == self.WHEN:
+            pc.value = (pc.value + 2 + (self.n << 1)) % pc.MAX_VALUE
+            return 2
+        pc.value = (pc.value + 2) % pc.MAX_VALUE
+        return 1
+
+class BC(Branch):
+    """ Branch if carry """
+    __slots__ = ('n',)
+    FLAG = WHEN = C
+
+class BNC(Branch):
+    """ Branch if not carry """
+    __slots__ = ('n',)
+    FLAG = C
+
+class BN(Branch):
+    """ Branch if negative """
+    __slots__ = ('n',)
+    FLAG = WHEN = N
+
+class BNN(Branch):
+    """ Branch if not negative """
+    __slots__ = ('n',)
+    FLAG = N
+
+class BOV(Branch):
+    """ Branch if overflow """
+    __slots__ = ('n',)
+    FLAG = WHEN = OV
+
+class BNOV(Branch):
+    """ Branch if not overflow """
+    __slots__ = ('n',)
+    FLAG = OV
+
+class BZ(Branch):
+    """ Branch if zero """
+    __slots__ = ('n',)
+    FLAG = WHEN = Z
+
+class BNZ(Branch):
+    """ Branch if not zero """
+    __slots__ = ('n',)
+    FLAG = Z
+
+class BRA(Op):
+    """ Branch unconditionally by 'n' words """
+    __slots__ = ('n',)
+    CYCLES = 2
+    JUMP = True
+    def execute(self, cpu):
+        pc = cpu.pc
+        pc.value = (pc.value + 2 + (self.n << 1)) % pc.MAX_VALUE
+        return 2
+
+class RCALL(Op):
+    """ Call subroutine by relative address """
+    __slots__ = ('n',)
+    CYCLES = 2
+    JUMP = True
+    def execute(self, cpu):
+        pc = cpu.pc
+        cpu.stack.push(pc.value + 2)
+        pc.value = (pc.value + 2 + (self.n << 1)) % pc.MAX_VALUE
+        return 2
+
+class RETLW(Op):
+    """ Return from subroutine with constant in WREG """
+    __slots__ = ('k',)
+    CYCLES = 2
+    JUMP = True
+    def execute(self, cpu):
+        cpu.data.hooks[WREG].put(self.k)
+        cpu.pc.value = cpu.stack.pop()
+        return 2
 
-#def bnz(cpu, n):
-    #"""Branch if not zero
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & Z) == 0:
-        #cpu.incPC(2*n)
+class RETFIE(Op):
+    """ Return from interrupt enabling interrupts """
+    __slots__ = ('s',)
+    CYCLES = 2
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        cpu.pc.value = cpu.stack.pop()
+        if self.s == 1:
+            hooks = data.hooks
+            hooks[WREG].put(cpu.stack.ws)
+            hooks[STATUS].put(cpu.stack.statuss)
+            hooks[BSR].put(cpu.stack.bsrs)
+        # GIE or, with priorities, GIEH when it's clear and GIEL otherwise
+        intcon = _read(data, INTCON)
+        if _read(data, RCON) & 0x80 and intcon & 0x80:
+            _write(data, INTCON, intcon | 0x40)
+        else:
+            _write(data, INTCON, intcon | 0x80)
+        return 2
+
+class PUSH(Op):
+    """ Push address of the next op on top of stack """
+    __slots__ = ()
+    def execute(self, cpu):
+        cpu.stack.push(cpu.pc.value + 2)
+        cpu.pc.inc(self.SIZE)
+        return 1
 
-#bnz.size = 2
+class POP(Op):
+    """ Discard top of stack """
+    __slots__ = ()
+    def execute(self, cpu):
+        cpu.stack.pop()
+        cpu.pc.inc(self.SIZE)
+        return 1
 
+class RESET(Op):
+    """ Software reset: SFRs get their reset values, MCU starts at 0
 
-#def bov(cpu, n):
-    #"""Branch if overflow
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & OV) > 0:
-        #cpu.incPC(2*n)
+    SFRs are written through their hooks, so timers are stopped and pending
+    interrupt is dropped by their own registers. WREG, STATUS, FSRs, general
+    purpose registers and counters of timers keep their values as on chip.
+    """
+    __slots__ = ()
+    JUMP = True
+    def execute(self, cpu):
+        data = cpu.data
+        for addr, keep, value in RESET_VALUES:
+            _write(data, addr, (_read(data, addr) & keep) | value)
+        # RI bit is cleared
+        _write(data, RCON, _read(data, RCON) & ~0x10)
+        cpu.sleeping = False
+        cpu.pc.value = 0
+        return 1
+
+class CLRWDT(Op):
+    """ Clear watchdog timer """
+    __slots__ = ()
+    def execute(self, cpu):
+        # time-out and power-down bits are set
+        data = cpu.data
+        _write(data, RCON, _read(data, RCON) | 0x0c)
+        cpu.pc.inc(self.SIZE)
+        return 1
 
-#bov.size = 2
+class DAW(Op):
+    """ Decimal adjust WREG after addition of packed BCD numbers """
+    __slots__ = ()
+    def execute(self, cpu):
+        hooks = cpu.data.hooks
+        wreg, status = hooks[WREG], hooks[STATUS]
+        w, flags = wreg.get(), status.get()
+        result = w
+        if w & 0x0f > 9 or flags & DC:
+            result += 0x06
+        if w > 0x99 or flags & C:
+            result += 0x60
+        wreg.put(result & 0xff)
+        status.update(C, C if result > 0xff or flags & C else 0)
+        cpu.pc.inc(self.SIZE)
+        return 1
 
+class MOVLB(Op):
+    """ Move constant to BSR """
+    __slots__ = ('k',)
+    def execute(self, cpu):
+        cpu.data.hooks[BSR].put(self.k)
+        cpu.pc.inc(self.SIZE)
+        return 1
 
-#def bra(cpu, n):
-    #"""Unconditional branch
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #cpu.incPC(2*n)
-
-#bra.size = 2
+class LFSR(Op):
+    """ Move 12-bit constant to FSR 'f' """
+    __slots__ = ('f', 'k')
+    SIZE = 4
+    CYCLES = 2
+    def execute(self, cpu):
+        data = cpu.data
+        low, high = FSRS[self.f]
+        _write(data, low, self.k & 0xff)
+        _write(data, high, self.k >> 8)
+        cpu.pc.inc(self.SIZE)
+        return 2
 
 
-#def bz(cpu, n):
-    #"""Branch if zero
-    #cpu: core of PIC18F
-    #n: number of jumps (instructions in both directions)
-    #"""
-    #if (cpu.status & Z) > 0:
-        #cpu.incPC(2*n)
-
-#bz.size = 2
-
-
-#def call(cpu, n, s):
-    #"""Goto subroutine in all range of memory:
-        #* return address (PC + 4) is saved in stack
-        #* if s = 1 then WREG, STATUS, BSR is saved in fast access registers
-        #* PC<20:1> is uploaded into the stack
-    #"""
-    #pass
-
-#call.size = 4
-
-
-#def clrwdt(cpu):
-    #"""Reset watcdog"""
-    #pass
-
-#def daw(cpu):
-    #"""Decimal correction of WREG"""
-    #pass
-
-#def goto(cpu, n):
-    #"""Goto to address"""
-    #pass
-
-#def nop(cpu):
-    #"""No operation"""
-    #pass
-
-#def pop(cpu):
-    #"""Read the top of stack TOS"""
-    #pass
-
-#def push(cpu):
-    #"""Record into the top of stack TOS"""
-    #pass
-
-#def rcall(cpu, n):
-    #"""Short branch to subroutine"""
-    #pass
-
-#def reset(cpu):
-    #"""Program reset"""
-    #pass
-
-#def retfie(cpu, s):
-    #"""Return from subroutine with permit of interruption"""
-    #pass
-
-#def retlw(cpu, k):
-    #"""Return from subroutine with loading of WREG"""
-    #pass
-
-#def return_(cpu, s):
-    #"""Return from subroutine"""
-    #pass
-
-#def sleep(cpu):
-    #"""Goto sleep mode"""
-    #pass
-
-#############################################
-## Operations with constants
-#############################################
-#def addlw(cpu, k):
-    #"""Add WREG with constant 'k'
-    #affect C, DC, Z, OV, N
-    #cpu: core of PIC18F
-    #k: constant value to be added
-    #"""
-    #_add(cpu, WREG, pic.wreg, k)
-
-#addlw.size = 2
-
-#def andlw(cpu, k):
-    #"""Logical conjunction WREG with constant 'k'
-    #affect Z and N
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #_and(cpu, WREG, pic.wreg, k)
-
-#def iorlw(cpu, k):
-    #"""Logical disjunction WREG with constant 'k'
-    #affect Z and N
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #_ior(cpu, WREG, pic.wreg, k)
-
-#def lfsr(cpu, f, k):
-    #"""Put constant value (12 bit) to FSR (2 words)
-    #cpu: core of PIC18F
-    #f: number of FSR register (0-3)
-    #k: constant value (12 bit)
-    #"""
-    #if f == 0:
-        #cpu.fsr0l = k & 0xff
-        #cpu.fsr0h = (k & 0x0f00) >> 8
-    #elif f == 1:
-        #cpu.fsr1l = k & 0xff
-        #cpu.fsr1h = (k & 0x0f00) >> 8
-    #elif f == 2:
-        #cpu.fsr2l = k & 0xff
-        #cpu.fsr2h = (k & 0x0f00) >> 8
-
-#def movlb(cpu, k):
-    #"""Move constant value to BSR<3:0>
-    #cpu: core of PIC18F
-    #k: constant value (0-0x0f)
-    #"""
-    #cpu.bsr = k
-
-#def movlw(cpu, k):
-    #"""Move constant to WREG
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #cpu.wreg = k
-
-#def mullw(cpu, k):
-    #"""Multiplication constant value with WREG
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #result = cpu.wreg * k
-    #cpu.prodl = result & 0xff
-    #cpu.prodh = (result & 0xff00) >> 8
-
-#def retlw(cpu, k):
-    #"""Return from subroutine with loading WREG
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #pass
-
-#def sublw(cpu, k):
-    #"""Substitute WREG from constant value
-    #affect C, DC, Z, OV, N flags
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #arg = (~cpu.wreg + 1) & 0xff
-    #result = k + arg
-
-    #set_bits = 0
-    #if result & 0x100 > 0:
-        #set_bits |= C
-    #if ((k & 0xf) + (arg & 0xf)) & 0x10 > 0:
-        #set_bits |= DC
-    #if result & 0xff == 0:
-        #set_bits |= Z
-    #if (k & 0x80 == arg & 0x80) and (arg & 0x80 != result & 0x80):
-        #set_bits |= OV
-    #if result & 0x80 > 0:
-        #set_bits |= N
-
-    #cpu.wreg = result & 0xff
-    #cpu.affectStatusBits(0x1f, set_bits)
-
-#def xorlw(cpu, k):
-    #"""Logical exclusive dijunction between constant and WREG
-    #affect Z and N flags
-    #cpu: core of PIC18F
-    #k: constant value
-    #"""
-    #_xor(cpu, WREG, pic.wreg, k)
-    
 ##############################################
 ## Operations: data memory <-> program memory
 ##############################################
 
-#def tblrd_ask(cpu):
-    #"""Table read"""
-    #pass
-
-#def tblrd_ask_plus(cpu):
-    #"""Table read with post-increment"""
-    #pass
+# changes of TBLPTR by mode 'n' of table operation: (before access, after access)
+TABLE_STEPS = [(0, 0), (0, 1), (0, -1), (1, 0)]
 
-#def tblrd_ask_minus(cpu):
-    #"""Table read with post-decrement"""
-    #pass
+def _table_pointer(data):
+    """ Value of 22-bit TBLPTR """
+    return (_read(data, TBLPTRL) | (_read(data, TBLPTRH) << 8) |
+            ((_read(data, TBLPTRU) & 0x3f) << 16))
 
-#def tblrd_plus_ask(cpu):
-    #"""Table read with pred-increment"""
-    #pass
+def _set_table_pointer(data, pointer):
+    _write(data, TBLPTRL, pointer & 0xff)
+    _write(data, TBLPTRH, (pointer >> 8) & 0xff)
+    _write(data, TBLPTRU, pointer >> 16)
 
-#def tblwt_ask(cpu):
-    #"""Table write"""
-    #pass
+class TableOp(Op):
+    """ Abstract access of byte of program memory pointed by TBLPTR
 
-#def tblwt_ask_plus(cpu):
-    #"""Table write with post-increment"""
-    #pass
-
-#def tblwt_ask_minus(cpu):
-    #"""Table write with post-decrement"""
-    #pass
-
-#def tblwt_plus_ask(cpu):
-    #"""Table write with pred-increment"""
-    #pass
+    Mode 'n' is one of TBLxx* (0), TBLxx*+ (1), TBLxx*- (2) and TBLxx+* (3).
+    Space above program memory (IDs, configuration) reads as 0 and isn't
+    written.
+    """
+    __slots__ = ()
+    CYCLES = 2
+    def execute(self, cpu):
+        data = cpu.data
+        pre, post = TABLE_STEPS[self.n]
+        pointer = (_table_pointer(data) + pre) & 0x3fffff
+        self.access(cpu, pointer)
+        if pre or post:
+            _set_table_pointer(data, (pointer + post) & 0x3fffff)
+        cpu.pc.inc(self.SIZE)
+        return 2
+
+class TBLRD(TableOp):
+    """ Read byte of program memory into TABLAT """
+    __slots__ = ('n',)
+    def access(self, cpu, pointer):
+        image = cpu.program.image
+        _write(cpu.data, TABLAT, image[pointer] if pointer < len(image) else 0)
+
+class TBLWT(TableOp):
+    """ Write TABLAT into byte of program memory
+
+    Byte is programmed at once, ops and blocks decoded from its word are
+    dropped.
+    """
+    __slots__ = ('n',)
+    def access(self, cpu, pointer):
+        program = cpu.program
+        if pointer < program.SIZE:
+            program.write_bytes(pointer, chr(_read(cpu.data, TABLAT)))
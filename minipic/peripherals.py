@@ -0,0 +1,250 @@
+"""
+Peripherals of PIC18F driven by scheduler of MCU
+
+Timers don't tick on every instruction: value of counter is computed from
+cycles elapsed since it was last written or reconfigured, and overflow is
+scheduled event which sets interrupt flag and schedules the next overflow.
+Only internal clock (Fosc/4) is simulated, timer switched to external clock
+stops.
+
+Interrupt controller isn't polled by run loop either: writes into its
+registers (including flags set by peripherals) recompute pending request and
+schedule event vectoring MCU after the current op.
+
+Peripheral is added by MCU.attach(), e.g. pic.attach(Timer0(pic)).
+"""
+from register import *
+
+
+class PeripheralRegister(ByteRegister):
+    """ Register whose reads and writes are served by peripheral
+
+    read() returns value of register, write(value) is called after value is
+    stored into data memory. Without read() value is kept in data memory.
+    """
+    def __init__(self, addr, memory, trace, read, write):
+        ByteRegister.__init__(self, addr, memory, trace)
+        self.read = read
+        self.write = write
+    def put(self, value):
+        assert 0 <= value <= 0xff
+        self.memory[self.addr] = value
+        self.write(value)
+    def get(self):
+        if self.read is not None:
+            self.memory[self.addr] = self.read()
+        return self.memory[self.addr]
+    def __setitem__(self, i, bit):
+        assert (0 <= i <= 7) and (bit in (0, 1))
+        value = PeripheralRegister.get(self)
+        PeripheralRegister.put(self, (value & ~(1 << i)) | (bit << i))
+    def __getitem__(self, i):
+        assert 0 <= i <= 7
+        return (PeripheralRegister.get(self) >> i) & 1
+    def update(self, mask, bits):
+        PeripheralRegister.put(self, (PeripheralRegister.get(self) & ~mask) | bits)
+
+def set_flag(data, addr, bit):
+    """ Set interrupt flag through hook of its register if there is one """
+    reg = data.hooks[addr]
+    if reg is None:
+        data.ram[addr] |= 1 << bit
+    else:
+        reg[bit] = 1
+
+
+class Timer(object):
+    """ Counter of instruction cycles with prescaler and overflow event """
+    FLAG = None     # (address, bit) of interrupt flag set by overflow
+    def __init__(self, mcu):
+        self.mcu = mcu
+        self.data = mcu.data
+        self.scheduler = mcu.scheduler
+        self.on = False
+        self.prescale = 1
+        self.mask = 0xffff
+        # value of counter at cycle 'since'
+        self.base = self.since = 0
+        # high byte buffered by 16-bit reads and writes
+        self.latch = 0
+    def value(self):
+        """ Current value of counter """
+        if not self.on:
+            return self.base
+        return (self.base + (self.mcu.cycles - self.since) // self.prescale) & self.mask
+    def load(self, value):
+        """ Write counter, prescaler is cleared """
+        self.base = value & self.mask
+        self.since = self.mcu.cycles
+        self._schedule()
+    def configure(self, on, prescale, bits):
+        value = self.value()
+        self.on, self.prescale, self.mask = on, prescale, (1 << bits) - 1
+        self.load(value)
+    def _schedule(self):
+        if self.on:
+            overflow = self.since + (self.mask + 1 - self.base) * self.prescale
+            self.scheduler.schedule(self, overflow)
+        else:
+            self.scheduler.cancel(self)
+    def fire(self, time):
+        """ Overflow of counter """
+        self.base, self.since = 0, time
+        self._schedule()
+        set_flag(self.data, *self.FLAG)
+    def snapshot(self):
+        return self.on, self.prescale, self.mask, self.base, self.since, self.latch
+    def restore(self, state):
+        self.on, self.prescale, self.mask, self.base, self.since, self.latch = state
+
+    # access to counter by low and high bytes
+    def read_low(self):
+        value = self.value()
+        self.latch = value >> 8
+        return value & 0xff
+    def write_low(self, value):
+        if self.mask == 0xff:
+            self.load(value)
+        else:
+            self.load((self.latch << 8) | value)
+    def read_high(self):
+        return self.latch
+    def write_high(self, value):
+        self.latch = value
+
+
+class Timer0(Timer):
+    """ Timer0: 8 or 16-bit timer with prescaler 1:2 .. 1:256 """
+    FLAG = (INTCON, 2)      # TMR0IF
+    def __init__(self, mcu):
+        Timer.__init__(self, mcu)
+        data = self.data
+        data.attach(PeripheralRegister, TMR0L, data.ram, data.trace,
+                    self.read_low, self.write_low)
+        data.attach(PeripheralRegister, TMR0H, data.ram, data.trace,
+                    self.read_high, self.write_high)
+        self.control = data.attach(PeripheralRegister, T0CON, data.ram, data.trace,
+                                   None, self.write_control)
+        # reset value: 16-bit timer clocked from T0CKI pin
+        data.ram[T0CON] = 0xff
+    def write_control(self, value):
+        # TMR0ON, T08BIT, T0CS, PSA, T0PS2:T0PS0
+        on = bool(value & 0x80) and not value & 0x20
+        prescale = 1 if value & 0x08 else 2 << (value & 0x07)
+        self.configure(on, prescale, 8 if value & 0x40 else 16)
+
+
+class Timer1(Timer):
+    """ Timer1: 16-bit timer with prescaler 1:1 .. 1:8 """
+    FLAG = (PIR1, 0)        # TMR1IF
+    def __init__(self, mcu):
+        Timer.__init__(self, mcu)
+        data = self.data
+        data.attach(PeripheralRegister, TMR1L, data.ram, data.trace,
+                    self.read_low, self.write_low)
+        data.attach(PeripheralRegister, TMR1H, data.ram, data.trace,
+                    self.read_high, self.write_high)
+        self.control = data.attach(PeripheralRegister, T1CON, data.ram, data.trace,
+                                   None, self.write_control)
+    def write_control(self, value):
+        # RD16, T1RUN, T1CKPS1:T1CKPS0, T1OSCEN, T1SYNC, TMR1CS, TMR1ON
+        on = bool(value & 0x01) and not value & 0x02
+        self.configure(on, 1 << ((value >> 4) & 3), 16)
+    def read_high(self):
+        if self.data.ram[T1CON] & 0x80:
+            return self.latch
+        return self.value() >> 8
+    def write_high(self, value):
+        if self.data.ram[T1CON] & 0x80:
+            self.latch = value
+        else:
+            self.load((value << 8) | (self.value() & 0xff))
+
+
+# interrupt vectors of high and low priority
+HIGH_VECTOR, LOW_VECTOR = 0x08, 0x18
+
+class InterruptController(object):
+    """ Interrupt logic: INTCON, INTCON2, INTCON3, PIR/PIE/IPR 1 and 2, RCON.IPEN
+
+    Without priorities (IPEN = 0) interrupt enabled by GIE (and PEIE for
+    peripherals) goes to vector 0x08. With priorities high ones are enabled
+    by GIEH and go to 0x08, low ones by GIEL and go to 0x18. Taken interrupt
+    pushes PC, saves WREG, STATUS and BSR into fast register stack and clears
+    GIE/GIEH or GIEL. Enabled flag wakes sleeping MCU regardless of GIE.
+    """
+    CYCLES = 2      # cycles of vectoring
+    REGISTERS = (INTCON, INTCON2, INTCON3, PIR1, PIE1, IPR1, PIR2, PIE2, IPR2, RCON)
+    def __init__(self, mcu):
+        self.mcu = mcu
+        self.data = data = mcu.data
+        self.ram = data.ram
+        self.scheduler = mcu.scheduler
+        self.vectoring = False
+        for addr in self.REGISTERS:
+            data.attach(PeripheralRegister, addr, data.ram, data.trace, None, self.changed)
+        # reset values: all sources of high priority
+        data.ram[INTCON2], data.ram[INTCON3] = 0xf5, 0xc0
+        data.ram[IPR1] = data.ram[IPR2] = 0xff
+        mcu.interrupts = self
+    def changed(self, value):
+        """ Register of interrupt logic is written """
+        mcu = self.mcu
+        if mcu.sleeping and self.wakes():
+            mcu.sleeping = False
+        if self.request() is None:
+            self.scheduler.cancel(self)
+        elif self.scheduler.time_of(self) is None:
+            self.scheduler.schedule(self, mcu.cycles)
+    def _sources(self):
+        """ Flags masked by their enable bits: core, INT1/INT2, PIR1, PIR2 """
+        ram = self.ram
+        intcon, intcon3 = ram[INTCON], ram[INTCON3]
+        # TMR0IF, INT0IF, RBIF by TMR0IE, INT0IE, RBIE
+        return (intcon & (intcon >> 3) & 0x07, intcon3 & (intcon3 >> 3) & 0x03,
+                ram[PIR1] & ram[PIE1], ram[PIR2] & ram[PIE2])
+    def wakes(self):
+        """ Some interrupt flag is set and enabled """
+        return any(self._sources())
+    def request(self):
+        """ Vector of interrupt to be taken or None """
+        ram = self.ram
+        intcon = ram[INTCON]
+        if not intcon & 0x80:
+            return None
+        core, external, first, second = self._sources()
+        if not ram[RCON] & 0x80:
+            if core or external or (intcon & 0x40 and (first or second)):
+                return HIGH_VECTOR
+            return None
+        # INT0 has always high priority
+        if ((core & (ram[INTCON2] & 0x05 | 0x02)) or (external & (ram[INTCON3] >> 6)) or
+                (first & ram[IPR1]) or (second & ram[IPR2])):
+            return HIGH_VECTOR
+        if intcon & 0x40 and (core or external or first or second):
+            return LOW_VECTOR
+        return None
+    def fire(self, time):
+        """ Take pending interrupt """
+        vector = self.request()
+        if vector is None:
+            return
+        mcu = self.mcu
+        hooks = self.data.hooks
+        stack = mcu.stack
+        pc, mcu.pc.value = mcu.pc.value, vector
+        # profiler tells pushes of vectoring from calls by this flag
+        self.vectoring = True
+        stack.push(pc)
+        self.vectoring = False
+        stack.ws = hooks[WREG].get()
+        stack.statuss = hooks[STATUS].get()
+        stack.bsrs = hooks[BSR].get()
+        mcu.sleeping = False
+        mcu.cycles += self.CYCLES
+        # GIE/GIEH or GIEL, high priority request may follow low one at once
+        hooks[INTCON][7 if vector == HIGH_VECTOR else 6] = 0
+    def snapshot(self):
+        return None
+    def restore(self, state):
+        pass
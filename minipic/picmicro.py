@@ -2,36 +2,216 @@
 Definition of basic components of PIC18F simulator
 
 DataMemory: memory for storing General Purpose Registers and Specific Purpose Registers
-ProgramMemory: memory for storing operation objects corresponding to opcodes
+ProgramMemory: memory for storing opcodes and decoded operation objects
 Stack: stack memory
 PC: program counter structure
 MCU: main class describing core of PIC18F
 """
-from op import NOP
+import weakref
+from blocks import BlockCache, UNLIMITED
+from decoder import decode_op
+from idle import IdleDetector
+from scheduler import Scheduler, NEVER
 from register import *
+from tracebuf import *
+
+# levels of tracing fixed when MCU is built
+TRACE_OFF, TRACE_INSTR, TRACE_WRITES, TRACE_FULL = 0, 1, 2, 3
+
+# default frequency of oscillator, one instruction cycle takes 4 of its periods
+FOSC = 4000000
+CLOCKS_PER_CYCLE = 4
+
+# reasons of stopping MCU.run
+STOP_MAX_CYCLES, STOP_UNTIL_PC, STOP_BREAKPOINT = 'max_cycles', 'until_pc', 'breakpoint'
+# MCU sleeps or polls memory and no event of peripheral may wake it
+STOP_IDLE = 'idle'
 
 class DataMemory:
-    """ Data memory of PIC """
-    def __init__(self, trace):
+    """ Data memory of PIC
+
+    Whole file register space is kept in one bytearray. Only special function
+    registers with side effects get register objects (hooks), other cells are
+    accessed by index. When register accesses are traced every cell gets
+    tracing hook, so untraced memory does no trace work at all. Base address
+    of bank selected by BSR is kept in 'bank', BSR is to be written through
+    its hook.
+    """
+    SIZE = 0x1000
+    def __init__(self, trace, level=TRACE_OFF):
         self.trace = trace
-        self.memory = {
-                WREG: ByteRegister(WREG, trace),
-                BSR: ByteRegister(BSR, trace),
-                STATUS: Status(trace),
-                STKPTR: ByteRegister(STKPTR, trace)
-                }
+        self.level = level
+        self.ram = bytearray(self.SIZE)
+        self.hooks = [None] * self.SIZE
+        self.views = {}
+        self.bank = 0
+        if level >= TRACE_WRITES:
+            for addr in xrange(self.SIZE):
+                self.attach(ByteRegister, addr, self.ram, trace)
+        self.attach(ByteRegister, WREG, self.ram, trace)
+        self.attach(BankSelectRegister, self, self.ram, trace)
+        self.attach(Status, self.ram, trace)
+        self.attach(ByteRegister, STKPTR, self.ram, trace)
+        # virtual registers of indirect addressing aren't specialised for tracing
+        for (fsr, _), indf in zip(FSRS, INDFS):
+            for offset, cls in enumerate(INDIRECT_REGISTERS):
+                self.hooks[indf - offset] = cls(indf - offset, fsr, self)
+    def specialise(self, cls):
+        """ Return register class 'cls' specialised for level of tracing """
+        if self.level == TRACE_FULL:
+            return traced(cls, ReadWriteTracing)
+        if self.level == TRACE_WRITES:
+            return traced(cls, WriteTracing)
+        return cls
+    def attach(self, cls, *args):
+        """ Create register of class 'cls' and install it as hook for its address """
+        reg = self.specialise(cls)(*args)
+        self.hooks[reg.addr] = reg
+        return reg
     def __getitem__(self, addr):
-        return self.memory.setdefault(addr, ByteRegister(addr, self.trace))
+        reg = self.hooks[addr]
+        if reg is None:
+            reg = self.views.get(addr)
+            if reg is None:
+                reg = self.views[addr] = ByteRegister(addr, self.ram, self.trace)
+        return reg
+    def read(self, addr):
+        """ Read byte from cell 'addr' """
+        reg = self.hooks[addr]
+        if reg is None:
+            return self.ram[addr]
+        return reg.get()
+    def write(self, addr, value):
+        """ Write byte into cell 'addr' """
+        reg = self.hooks[addr]
+        if reg is None:
+            self.ram[addr] = value
+        else:
+            reg.put(value)
+    def read_target(self, addr):
+        """ Read cell 'addr' resolved from operand, virtual register reads as 0 """
+        reg = self.hooks[addr]
+        if reg is None:
+            return self.ram[addr]
+        return 0 if reg.indirect else reg.get()
+    def write_target(self, addr, value):
+        """ Write cell 'addr' resolved from operand, virtual register ignores it """
+        reg = self.hooks[addr]
+        if reg is None:
+            self.ram[addr] = value
+        elif not reg.indirect:
+            reg.put(value)
+    def snapshot(self):
+        """ Return state of memory, whole 4 KB are copied at once """
+        return str(self.ram)
+    def restore(self, state):
+        self.ram[:] = state
+        self.bank = self.ram[BSR] << 8
 
 class ProgramMemory:
-    """ Program memory of PICmicro """
+    """ Program memory of PICmicro
+
+    Flash is kept as image of bytes (opcode words are little-endian), so table
+    reads index it directly. Op objects are decoded on the first fetch and
+    cached. All memories share one erased image until they are written.
+    Snapshots are copy-on-write: page is saved into live snapshots only before
+    its first write after snapshot.
+    """
     SIZE = 0x200000
+    PAGE = 0x100    # words per page of snapshots
+    ERASED = bytearray('\xff') * SIZE
     def __init__(self):
-        self.memory = [NOP()] * (self.SIZE >> 1)
+        self.image = self.ERASED
+        self.ops = {}
+        # objects caching data derived from words, notified by invalidate(i)
+        self.observers = []
+        self.snapshots = weakref.WeakSet()
     def __getitem__(self, addr):
-        return self.memory[addr >> 1]
+        i = addr >> 1
+        op = self.ops.get(i)
+        if op is None:
+            image = self.image
+            first, second = i << 1, ((i + 1) << 1) % self.SIZE
+            op = self.ops[i] = decode_op(image[first] | (image[first + 1] << 8),
+                                         image[second] | (image[second + 1] << 8))
+        return op
     def __setitem__(self, addr, op):
-        self.memory[addr >> 1] = op
+        self.ops[addr >> 1] = op
+        for observer in self.observers:
+            observer.invalidate(addr >> 1)
+    def read_word(self, addr):
+        """ Read opcode word by even address 'addr' """
+        image = self.image
+        return image[addr] | (image[addr + 1] << 8)
+    def write_word(self, addr, word):
+        """ Write opcode word by even address 'addr' """
+        i = addr >> 1
+        self._prepare(i, i + 1)
+        self.image[addr] = word & 0xff
+        self.image[addr + 1] = word >> 8
+        self._changed(i, i + 1)
+    def write_bytes(self, addr, data):
+        """ Write bytes (little-endian words) starting from byte address 'addr' """
+        data = bytearray(data)
+        first, last = addr >> 1, (addr + len(data) + 1) >> 1
+        self._prepare(first, last)
+        self.image[addr:addr + len(data)] = data
+        self._changed(first, last)
+    def flash(self):
+        """ Return memoryview of bytes of program memory
+
+        View stays valid after later writes. It's for reading: writes go
+        through write_word() and write_bytes(), which drop decoded ops.
+        """
+        self._prepare(0, 0)
+        return memoryview(self.image)
+    def predecode(self):
+        """ Decode all programmed (not erased) pages into cache of ops """
+        image = self.image
+        size = self.PAGE << 1
+        erased = self.ERASED[:size]
+        for first in xrange(0, len(image), size):
+            if image[first:first + size] != erased:
+                for addr in xrange(first, first + size, 2):
+                    self[addr]
+    def snapshot(self):
+        """ Take snapshot of words, cost doesn't depend on size of memory """
+        snap = ProgramSnapshot(self)
+        self.snapshots.add(snap)
+        return snap
+    def restore(self, snap):
+        """ Restore words saved in snapshot rewriting only pages changed since it """
+        assert snap.memory is self
+        size = self.PAGE << 1
+        for page, data in snap.pages.items():
+            first = page * self.PAGE
+            self._prepare(first, first + self.PAGE)
+            self.image[page * size:(page + 1) * size] = data
+            self._changed(first, first + self.PAGE)
+    def _prepare(self, first, last):
+        """ Make words from 'first' to 'last' (exclusive) writable """
+        if self.image is self.ERASED:
+            self.image = self.ERASED[:]
+        if self.snapshots:
+            size = self.PAGE << 1
+            for page in xrange(first // self.PAGE, (last - 1) // self.PAGE + 1):
+                for snap in self.snapshots:
+                    if page not in snap.pages:
+                        snap.pages[page] = self.image[page * size:(page + 1) * size]
+    def _changed(self, first, last):
+        """ Drop data derived from words from 'first' to 'last' (exclusive) """
+        # cached op at previous word may be two-word operation
+        for i in xrange(first - 1, last):
+            self.ops.pop(i, None)
+        for observer in self.observers:
+            for i in xrange(first, last):
+                observer.invalidate(i)
+
+class ProgramSnapshot:
+    """ Snapshot of program memory keeping original pages written after it """
+    def __init__(self, memory):
+        self.memory = memory
+        self.pages = {}
 
 class Stack:
     """ Stack memory """
@@ -47,20 +227,36 @@ class Stack:
         stkptr = self.stkptr_reg.get()
         if (stkptr & 0x1f) == 0x1f:
             self.stkptr_reg[self.STKFUL] = 1
-            trace.add_event(('stack_is_full',))
             return
         self.memory[stkptr & 0x1f] = data
         self.stkptr_reg.put(stkptr + 1)
-        self.trace.add_event(('stack_push', data))
     def pop(self):
         stkptr = self.stkptr_reg.get()
         if (stkptr & 0x1f) == 0:
             self.stkptr_reg[self.STKUNF] = 1
-            trace.add_event(('stack_is_unfull',))
-            return
+            return 0
         self.stkptr_reg.put(stkptr - 1)
-        data = self.memory[(stkptr - 1) & 0x1f]
-        self.trace.add_event(('stack_pop', data))
+        return self.memory[(stkptr - 1) & 0x1f]
+    def snapshot(self):
+        return tuple(self.memory), self.ws, self.statuss, self.bsrs
+    def restore(self, state):
+        memory, self.ws, self.statuss, self.bsrs = state
+        self.memory[:] = memory
+
+class TracedStack(Stack):
+    """ Stack memory logging its pushes and pops """
+    def push(self, data):
+        if (self.stkptr_reg.value & 0x1f) == 0x1f:
+            self.trace.add(STACK_IS_FULL)
+        else:
+            self.trace.add(STACK_PUSH, 0, data)
+        Stack.push(self, data)
+    def pop(self):
+        if (self.stkptr_reg.value & 0x1f) == 0:
+            self.trace.add(STACK_IS_UNFULL)
+            return Stack.pop(self)
+        data = Stack.pop(self)
+        self.trace.add(STACK_POP, 0, data)
         return data
 
 class PC: 
@@ -71,48 +267,244 @@ class PC:
     def inc(self, delta):
         self.value = (self.value + delta) % self.MAX_VALUE
 
-class TraceBuf:
-    """ Buffer for saving of trace logs """
-    SIZE = 128
-    def __init__(self):
-        self.buf = [None] * self.SIZE
-        self.index = 0
-        self.iter_index = 0
-    def add_event(self, event):
-        self.buf[self.index] = event
-        self.index = (self.index + 1) % self.SIZE
-        if self.index == self.iter_index:
-            self.iter_index = (self.iter_index + 1) % self.SIZE
-    def __iter__(self):
-        return self
-    def next(self):
-        if self.iter_index == self.index:
-            raise StopIteration()
-        item = self.buf[self.iter_index]
-        self.iter_index = (self.iter_index + 1) % self.SIZE
-        return item
-
-class MCU(object): 
-    """ PIC18F microprocessor core unit """
-    def __init__(self):
-        self.trace = TraceBuf()
-        self.pc = PC()
-        self.data = DataMemory(self.trace)
-        self.program = ProgramMemory()
-        self.stack = Stack(self.data[STKPTR], self.trace)
-
-
-
-
-
-
-
-
+class Snapshot:
+    """ Saved state of MCU """
+    def __init__(self, pc, cycles, sleeping, program, states):
+        self.pc = pc
+        self.cycles = cycles
+        self.sleeping = sleeping
+        self.program = program
+        self.states = states
 
+class MCU(object):
+    """ PIC18F microprocessor core unit
 
+    trace_level: TRACE_OFF, TRACE_INSTR (fetched ops), TRACE_WRITES (also
+    writes into registers and stack) or TRACE_FULL (also reads)
+    blocks: run program through cache of compiled blocks (untraced MCU only)
+    trace_capacity: number of events kept in trace buffer
+    frequency: frequency of oscillator in Hz mapping instruction cycles to time
 
+    Peripherals added by attach() get their events from scheduler, while they
+    are present untraced MCU runs loop keeping cycle counter current instead
+    of compiled blocks. Sleeping MCU and untraced MCU polling data memory in
+    loop skip cycles up to the next event. Interrupts are taken only while
+    InterruptController is attached.
+    """
+    def __init__(self, trace_level=TRACE_OFF, blocks=False, trace_capacity=TraceBuf.SIZE,
+                 frequency=FOSC):
+        self.trace_level = trace_level
+        self.trace = TraceBuf(trace_capacity, self)
+        self.pc = PC()
+        # instruction cycles executed
+        self.cycles = 0
+        self.sleeping = False
+        self.frequency = frequency
+        self.data = DataMemory(self.trace, trace_level)
+        self.data.attach(ProgramCounterLow, self.pc, self.data.ram, self.trace)
+        self.program = ProgramMemory()
+        if trace_level >= TRACE_WRITES:
+            self.stack = TracedStack(self.data[STKPTR], self.trace)
+        else:
+            self.stack = Stack(self.data[STKPTR], self.trace)
+        self.scheduler = Scheduler()
+        self.peripherals = []
+        # interrupt controller, set by InterruptController
+        self.interrupts = None
+        # components saved by snapshot()
+        self.components = [self.data, self.stack, self.scheduler]
+        self.idle = IdleDetector(self)
+        self.blocks = None
+        if trace_level >= TRACE_INSTR:
+            self.step = self.traced_step
+            self._loop = self._step_loop
+        elif blocks:
+            self.blocks = BlockCache(self)
+            self._loop = self._block_loop
+    def attach(self, peripheral):
+        """ Add peripheral saved by snapshot() and driven by scheduler """
+        self.peripherals.append(peripheral)
+        self.components.append(peripheral)
+        if self.trace_level < TRACE_INSTR:
+            self._loop = self._timed_loop
+        return peripheral
+    def step(self):
+        """ Fetch and execute one operation, sleeping MCU waits for event """
+        if self.sleeping:
+            self._sleep(UNLIMITED)
+            return
+        cycles = self.program[self.pc.value].execute(self)
+        self.cycles += cycles
+        if self.cycles >= self.scheduler.next_time:
+            self.scheduler.run_due(self.cycles)
+    def traced_step(self):
+        """ Fetch and execute one operation logging it into trace """
+        if self.sleeping:
+            self._sleep(UNLIMITED)
+            return
+        pc = self.pc.value
+        program = self.program
+        self.trace.add(OPCODE_FETCH, pc, program.read_word(pc))
+        cycles = program[pc].execute(self)
+        self.cycles += cycles
+        if self.cycles >= self.scheduler.next_time:
+            self.scheduler.run_due(self.cycles)
+    @property
+    def time(self):
+        """ Simulated time in seconds """
+        return float(self.cycles) * CLOCKS_PER_CYCLE / self.frequency
+    def snapshot(self):
+        """ Save complete state of MCU """
+        return Snapshot(self.pc.value, self.cycles, self.sleeping, self.program.snapshot(),
+                        [component.snapshot() for component in self.components])
+    def restore(self, snap):
+        """ Restore state saved by snapshot() of this MCU """
+        if snap.program.memory is not self.program:
+            raise ValueError('snapshot was taken from another MCU')
+        self.pc.value = snap.pc
+        self.cycles = snap.cycles
+        self.sleeping = snap.sleeping
+        self.program.restore(snap.program)
+        for component, state in zip(self.components, snap.states):
+            component.restore(state)
+    def run(self, max_cycles=None, until_pc=None, breakpoints=frozenset()):
+        """ Execute operations until stop condition is met
 
+        Stop after 'max_cycles' cycles or when PC reaches 'until_pc' or one of
+        'breakpoints'. Operation at current PC is executed even if it's under
+        breakpoint, so run may be continued after stop. Operation started
+        before budget of cycles runs out is completed, so run may exceed it
+        by one cycle. Run stops with STOP_IDLE when MCU sleeps or polls memory
+        and no event is scheduled.
+        Return pair of stop reason and number of executed cycles.
+        """
+        stops = set(breakpoints)
+        if until_pc is not None:
+            stops.add(until_pc)
+        budget = UNLIMITED if max_cycles is None else max_cycles
+        # run loop stops also at SLEEP ops and polling loops (untraced MCU)
+        sleeps, loops = self.idle.points()
+        watch = stops | sleeps
+        if self.trace_level < TRACE_INSTR:
+            watch |= loops
+        cycles = 0
+        while cycles < budget:
+            if self.sleeping:
+                n = self._sleep(budget - cycles)
+            elif self.pc.value in sleeps:
+                # interrupt taken after SLEEP adds its cycles too
+                start = self.cycles
+                self.step()
+                n = self.cycles - start
+            else:
+                n = 0
+                if self.pc.value in loops and self.trace_level < TRACE_INSTR:
+                    n = self.idle.skip(budget - cycles, stops)
+                    if self.pc.value not in loops:
+                        # loop can't be skipped, it's no longer watched
+                        watch = stops | sleeps | loops
+                if n == 0:
+                    _, n = self._loop(budget - cycles, watch)
+            if n is None:
+                return STOP_IDLE, cycles
+            cycles += n
+            if self.pc.value in stops:
+                if self.pc.value == until_pc:
+                    return STOP_UNTIL_PC, cycles
+                return STOP_BREAKPOINT, cycles
+        return STOP_MAX_CYCLES, cycles
+    def _sleep(self, budget):
+        """ Sleep until MCU is woken but not longer than 'budget' cycles
 
+        Without interrupt controller any event wakes MCU, with it only
+        enabled interrupt does. Return number of skipped cycles or None if
+        nothing may wake MCU.
+        """
+        scheduler = self.scheduler
+        interrupts = self.interrupts
+        start = self.cycles
+        if interrupts is not None and interrupts.wakes():
+            self.sleeping = False
+        while self.sleeping:
+            time = scheduler.peek()
+            if time == NEVER:
+                return (self.cycles - start) or None
+            if time - start > budget:
+                self.cycles = start + budget
+                return budget
+            self.cycles = max(time, self.cycles)
+            scheduler.run_due(self.cycles)
+            if interrupts is None:
+                self.sleeping = False
+        return self.cycles - start
+    def _loop(self, budget, stops):
+        """ Run loop fetching ops straight from cache of program memory """
+        pc = self.pc
+        program = self.program
+        ops = program.ops
+        n = 0
+        try:
+            while n < budget:
+                op = ops.get(pc.value >> 1)
+                if op is None:
+                    op = program[pc.value]
+                n += op.execute(self)
+                if pc.value in stops:
+                    return True, n
+            return False, n
+        finally:
+            self.cycles += n
+    def _block_loop(self, budget, stops):
+        """ Run loop executing compiled blocks """
+        pc = self.pc
+        program = self.program
+        blocks = self.blocks.blocks
+        compile_block = self.blocks.compile
+        n = 0
+        try:
+            while n < budget:
+                left = budget - n
+                block = blocks.get(pc.value)
+                if block is None:
+                    block = compile_block(pc.value)
+                if block.max_cycles <= left and (not stops or stops.isdisjoint(block.addrs)):
+                    n += block.function(self, left)
+                else:
+                    n += program[pc.value].execute(self)
+                if pc.value in stops:
+                    return True, n
+            return False, n
+        finally:
+            self.cycles += n
+    def _timed_loop(self, budget, stops):
+        """ Run loop keeping cycle counter current for peripherals """
+        pc = self.pc
+        program = self.program
+        ops = program.ops
+        scheduler = self.scheduler
+        start = self.cycles
+        end = start + budget
+        while self.cycles < end:
+            op = ops.get(pc.value >> 1)
+            if op is None:
+                op = program[pc.value]
+            cycles = op.execute(self)
+            self.cycles += cycles
+            if self.cycles >= scheduler.next_time:
+                scheduler.run_due(self.cycles)
+            if pc.value in stops:
+                return True, self.cycles - start
+        return False, self.cycles - start
+    def _step_loop(self, budget, stops):
+        """ Run loop over MCU.step """
+        pc = self.pc
+        step = self.step
+        start = self.cycles
+        while self.cycles - start < budget:
+            step()
+            if pc.value in stops:
+                return True, self.cycles - start
+        return False, self.cycles - start
 
 
 
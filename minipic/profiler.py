@@ -0,0 +1,281 @@
+"""
+Execution profiler of firmware
+
+Profiler replaces run loop of MCU by loop counting executions and cycles of
+every program address in list indexed by word number, and follows stack
+pointer around stack ops to build call graph. When steps serve peripherals,
+pushes and pops of stack are followed instead, so that interrupts are seen.
+Executions and cycles of word are kept in one number (tally), so that run
+loop updates it by one addition. Per op class and per function figures are
+derived from these counters when report is made, so they cost nothing during
+run. Interrupts taken by InterruptController are calls of their vector from
+caller INTERRUPT. While profiler is attached MCU doesn't run compiled blocks.
+Peripherals should be attached to MCU before profiler.
+"""
+import sys
+
+from op import CALL, RCALL, RETURN, RETLW, RETFIE, PUSH, POP
+from picmicro import ProgramMemory, TRACE_INSTR
+from register import STKPTR
+
+# tally of word: executions above bit COUNT_SHIFT, cycles below it
+COUNT_SHIFT = 40
+COUNT = 1 << COUNT_SHIFT
+CYCLES_MASK = COUNT - 1
+
+# caller of interrupt handlers in call graph
+INTERRUPT = 'interrupt'
+
+# targets of calling operations: target(op, addr) returns address of callee
+CALL_TARGETS = {
+    CALL: lambda op, addr: op.n << 1,
+    RCALL: lambda op, addr: addr + 2 + (op.n << 1),
+}
+
+# operations pushing or popping stack, they are cached apart by profiler
+PUSHING_OPS = set(CALL_TARGETS) | set([PUSH])
+STACK_OPS = PUSHING_OPS | set([RETURN, RETLW, RETFIE, POP])
+
+
+class Profiler:
+    """ Profiler attached to MCU until stop() """
+    def __init__(self, mcu):
+        self.mcu = mcu
+        self.interrupts = mcu.interrupts
+        self.pc = mcu.pc
+        self.ram = mcu.data.ram
+        # executions and cycles of program words
+        self.tally = [0] * (ProgramMemory.SIZE >> 1)
+        # call sites and start cycles of active calls, call site of
+        # interrupt is pair (INTERRUPT, vector)
+        self.sites, self.starts = [], []
+        # (caller site, callee site) -> tally of calls and cycles, and
+        # site -> cycles of its calls nested in active call from same site
+        self.edges = {}
+        self.recursive = {}
+        # ops of program, stack ops apart
+        self.ops, self.stack_ops = {}, {}
+        mcu.program.observers.append(self)
+        self.loop, self.step = mcu._loop, mcu.step
+        mcu.step = self._step
+        self.push = self.pop = None
+        if mcu.trace_level >= TRACE_INSTR or mcu.peripherals:
+            # steps serve events of peripherals, interrupts push stack too
+            stack = mcu.stack
+            self.push, self.pop = stack.push, stack.pop
+            stack.push, stack.pop = self._push, self._pop
+            mcu._loop = self._step_loop
+        else:
+            # run loop follows stack pointer around stack ops
+            mcu._loop = self._loop
+
+    def stop(self):
+        """ Detach profiler from MCU """
+        mcu = self.mcu
+        mcu._loop, mcu.step = self.loop, self.step
+        if self.push is not None:
+            del mcu.stack.push, mcu.stack.pop
+        mcu.program.observers.remove(self)
+
+    def invalidate(self, i):
+        self.ops.pop(i, None)
+        self.stack_ops.pop(i, None)
+
+    @property
+    def counts(self):
+        """ Executions of program words """
+        return [tally >> COUNT_SHIFT for tally in self.tally]
+
+    @property
+    def cycles(self):
+        """ Cycles of program words """
+        return [tally & CYCLES_MASK for tally in self.tally]
+
+    def _loop(self, budget, stops):
+        # stack ops are cached apart with flag telling pushing ops
+        mcu = self.mcu
+        pc = mcu.pc
+        program = mcu.program
+        ram = self.ram
+        ops, stack_ops = self.ops, self.stack_ops
+        tally = self.tally
+        sites, starts = self.sites, self.starts
+        edges, recursive = self.edges, self.recursive
+        start = mcu.cycles
+        n = 0
+        try:
+            while n < budget:
+                i = pc.value >> 1
+                op = ops.get(i)
+                if op is not None:
+                    c = op.execute(mcu)
+                    tally[i] += COUNT + c
+                    n += c
+                else:
+                    entry = stack_ops.get(i)
+                    if entry is None:
+                        op = program[pc.value]
+                        if op.__class__ in STACK_OPS:
+                            stack_ops[i] = op, op.__class__ in PUSHING_OPS
+                        else:
+                            ops[i] = op
+                        continue
+                    op, pushing = entry
+                    if pushing:
+                        if (ram[STKPTR] & 0x1f) != 0x1f:
+                            sites.append(i << 1)
+                            starts.append(start + n)
+                        c = op.execute(mcu)
+                        tally[i] += COUNT + c
+                        n += c
+                    elif sites and (ram[STKPTR] & 0x1f):
+                        c = op.execute(mcu)
+                        tally[i] += COUNT + c
+                        n += c
+                        # return, see _leave
+                        site = sites.pop()
+                        cycles = start + n - starts.pop()
+                        key = (sites[-1] if sites else None, site)
+                        edges[key] = edges.get(key, 0) + COUNT + cycles
+                        if site in sites:
+                            recursive[site] = recursive.get(site, 0) + cycles
+                    else:
+                        c = op.execute(mcu)
+                        tally[i] += COUNT + c
+                        n += c
+                if pc.value in stops:
+                    return True, n
+            return False, n
+        finally:
+            mcu.cycles += n
+
+    def _step_loop(self, budget, stops):
+        mcu = self.mcu
+        pc = mcu.pc
+        step = self._step
+        start = mcu.cycles
+        while mcu.cycles - start < budget:
+            step()
+            if pc.value in stops:
+                return True, mcu.cycles - start
+        return False, mcu.cycles - start
+
+    def _step(self):
+        mcu = self.mcu
+        addr = self.pc.value
+        depth = self.ram[STKPTR] & 0x1f
+        start = mcu.cycles
+        self.step()
+        self.tally[addr >> 1] += COUNT + mcu.cycles - start
+        if self.push is None:
+            self._follow(addr, start, depth)
+
+    def _follow(self, site, start, depth):
+        # op at site started at cycle start moved stack pointer from depth
+        now = self.ram[STKPTR] & 0x1f
+        if now > depth:
+            self.sites.append(site)
+            self.starts.append(start)
+        elif now < depth and self.sites:
+            self._leave(self.mcu.cycles)
+
+    def _push(self, data):
+        if (self.ram[STKPTR] & 0x1f) != 0x1f:
+            interrupts = self.interrupts
+            if interrupts is not None and interrupts.vectoring:
+                # interrupt is taken after interrupted op, PC is at vector
+                self.sites.append((INTERRUPT, self.pc.value))
+            else:
+                self.sites.append(self.pc.value)
+            self.starts.append(self.mcu.cycles)
+        self.push(data)
+
+    def _pop(self):
+        if self.sites and (self.ram[STKPTR] & 0x1f) != 0:
+            # returning op at PC is part of call
+            self._leave(self.mcu.cycles + self.mcu.program[self.pc.value].CYCLES)
+        return self.pop()
+
+    def _leave(self, end):
+        # return from innermost call at cycle end
+        sites = self.sites
+        site = sites.pop()
+        cycles = end - self.starts.pop()
+        key = (sites[-1] if sites else None, site)
+        self.edges[key] = self.edges.get(key, 0) + COUNT + cycles
+        if site in sites:
+            # inner activation of recursive call is part of outer one
+            self.recursive[site] = self.recursive.get(site, 0) + cycles
+
+    def callee(self, site):
+        """ Address of function called from call site 'site' """
+        if isinstance(site, tuple):
+            return site[1]
+        op = self.mcu.program[site]
+        target = CALL_TARGETS.get(op.__class__)
+        return site if target is None else target(op, site)
+
+    def flat(self):
+        """ Return list of (address, op, executions, cycles) sorted by cycles """
+        program = self.mcu.program
+        result = [(i << 1, program[i << 1], tally >> COUNT_SHIFT, tally & CYCLES_MASK)
+                  for i, tally in enumerate(self.tally) if tally]
+        result.sort(key=lambda row: (-row[3], row[0]))
+        return result
+
+    def by_op(self):
+        """ Return mapping of op class name to [executions, cycles] """
+        result = {}
+        for _, op, count, cycles in self.flat():
+            row = result.setdefault(op.__class__.__name__, [0, 0])
+            row[0] += count
+            row[1] += cycles
+        return result
+
+    def call_graph(self):
+        """ Return mapping of (caller, callee) functions to [calls, cycles]
+
+        Caller of calls made outside of any function is None, caller of
+        interrupt handlers is INTERRUPT.
+        """
+        result = {}
+        for (caller, site), tally in self.edges.items():
+            if isinstance(site, tuple):
+                caller = INTERRUPT
+            elif caller is not None:
+                caller = self.callee(caller)
+            key = (caller, self.callee(site))
+            row = result.setdefault(key, [0, 0])
+            row[0] += tally >> COUNT_SHIFT
+            row[1] += tally & CYCLES_MASK
+        return result
+
+    def functions(self):
+        """ Return list of (function, calls, inclusive cycles) sorted by cycles """
+        calls, cycles = {}, {}
+        for (_, site), tally in self.edges.items():
+            func = self.callee(site)
+            calls[func] = calls.get(func, 0) + (tally >> COUNT_SHIFT)
+            cycles[func] = cycles.get(func, 0) + (tally & CYCLES_MASK)
+        for site, n in self.recursive.items():
+            func = self.callee(site)
+            cycles[func] -= n
+        result = [(func, calls[func], cycles[func]) for func in calls]
+        result.sort(key=lambda row: (-row[2], row[0]))
+        return result
+
+    def report(self, out=sys.stdout, limit=20):
+        """ Print flat, per op and inclusive profiles """
+        total = sum(tally & CYCLES_MASK for tally in self.tally) or 1
+        print >> out, '%8s  %-24s %12s %12s %6s' % ('addr', 'op', 'count', 'cycles', '%')
+        for addr, op, count, cycles in self.flat()[:limit]:
+            print >> out, '%#8x  %-24r %12d %12d %6.2f' % (
+                    addr, op, count, cycles, 100.0 * cycles / total)
+        print >> out
+        print >> out, '%-10s %12s %12s %6s' % ('op', 'count', 'cycles', '%')
+        for name, (count, cycles) in sorted(self.by_op().items(), key=lambda row: -row[1][1]):
+            print >> out, '%-10s %12d %12d %6.2f' % (name, count, cycles, 100.0 * cycles / total)
+        print >> out
+        print >> out, '%8s %10s %12s %6s' % ('function', 'calls', 'inclusive', '%')
+        for func, calls, cycles in self.functions()[:limit]:
+            print >> out, '%#8x %10d %12d %6.2f' % (func, calls, cycles, 100.0 * cycles / total)
@@ -1,13 +1,70 @@
 """
 Definition of registers
 """
+from tracebuf import REGISTER_READ, REGISTER_WRITE, REGISTER_READ_BIT, REGISTER_WRITE_BIT
 
 # special function registers addresses contants
 WREG, STATUS, BSR = 0xfe8, 0xfd8, 0xfe0
 STKPTR = 0xffc
+PCL, PCLATH, PCLATU = 0xff9, 0xffa, 0xffb
+PRODL, PRODH = 0xff3, 0xff4
+TABLAT, TBLPTRL, TBLPTRH, TBLPTRU = 0xff5, 0xff6, 0xff7, 0xff8
+FSR0L, FSR0H = 0xfe9, 0xfea
+FSR1L, FSR1H = 0xfe1, 0xfe2
+FSR2L, FSR2H = 0xfd9, 0xfda
+INDF0, POSTINC0, POSTDEC0, PREINC0, PLUSW0 = 0xfef, 0xfee, 0xfed, 0xfec, 0xfeb
+INDF1, POSTINC1, POSTDEC1, PREINC1, PLUSW1 = 0xfe7, 0xfe6, 0xfe5, 0xfe4, 0xfe3
+INDF2, POSTINC2, POSTDEC2, PREINC2, PLUSW2 = 0xfdf, 0xfde, 0xfdd, 0xfdc, 0xfdb
+# FSR registers and their INDF by number
+FSRS = [(FSR0L, FSR0H), (FSR1L, FSR1H), (FSR2L, FSR2H)]
+INDFS = [INDF0, INDF1, INDF2]
+RCON = 0xfd0
+INTCON, INTCON2, INTCON3 = 0xff2, 0xff1, 0xff0
+PIR1, PIE1, IPR1 = 0xf9e, 0xf9d, 0xf9f
+PIR2, PIE2, IPR2 = 0xfa1, 0xfa0, 0xfa2
+T0CON, TMR0L, TMR0H = 0xfd5, 0xfd6, 0xfd7
+T1CON, TMR1L, TMR1H = 0xfcd, 0xfce, 0xfcf
 
-class Register:
+# SFRs set by RESET instruction as (address, mask of unchanged bits, value),
+# interrupt control goes first so that nothing is requested meanwhile
+RESET_VALUES = ((INTCON, 0x01, 0), (INTCON2, 0, 0xf5), (INTCON3, 0, 0xc0),
+                (PIE1, 0, 0), (PIR1, 0, 0), (IPR1, 0, 0xff),
+                (PIE2, 0, 0), (PIR2, 0, 0), (IPR2, 0, 0xff),
+                (T0CON, 0, 0xff), (TMR0H, 0, 0), (T1CON, 0x40, 0),
+                (STKPTR, 0xc0, 0), (BSR, 0, 0), (PCLATU, 0, 0), (PCLATH, 0, 0),
+                (TBLPTRU, 0, 0), (TBLPTRH, 0, 0), (TBLPTRL, 0, 0), (TABLAT, 0, 0))
+
+# bits of STATUS
+N, OV, Z, DC, C = 0x10, 0x08, 0x04, 0x02, 0x01
+# flags affected by arithmetic and by logic operations
+ARITHMETIC_FLAGS = N | OV | Z | DC | C
+LOGIC_FLAGS = N | Z
+
+def _nz_flags():
+    return bytearray((Z if r == 0 else 0) | (N if r & 0x80 else 0) for r in xrange(0x100))
+
+# flags N, Z of 8-bit result
+NZ_FLAGS = _nz_flags()
+
+def _add_flags():
+    table = bytearray(0x20000)
+    for c in (0, 1):
+        for a in xrange(0x100):
+            first = (c << 16) | (a << 8)
+            table[first:first + 0x100] = bytearray(
+                    NZ_FLAGS[(a + b + c) & 0xff] | ((a + b + c) >> 8) |
+                    (((a & 0xf) + (b & 0xf) + c) >> 4 << 1) |
+                    (((a ^ (a + b + c)) & (b ^ (a + b + c)) & 0x80) >> 4)
+                    for b in xrange(0x100))
+    return table
+
+# flags N, OV, Z, DC, C of a + b + c indexed by (c << 16) | (a << 8) | b;
+# subtraction a - b with borrow !c is addition a + (b ^ 0xff) + c
+ADD_FLAGS = _add_flags()
+
+class Register(object):
     """ Abstract class of register with bit-vector operations support """
+    indirect = False    # virtual register of indirect addressing
     def put(self, value):
         raise NotImplementedError()
     def get(self):
@@ -18,44 +75,248 @@ class Register:
         raise NotImplementedError()
 
 class ByteRegister(Register):
-    """ Concrete class of register storing byte value """
-    def __init__(self, addr, trace):
-        self.value = 0
+    """ Concrete class of register storing byte value in cell of data memory """
+    def __init__(self, addr, memory, trace):
         self.addr = addr
+        self.memory = memory
         self.trace = trace
+    @property
+    def value(self):
+        return self.memory[self.addr]
     def put(self, value):
         assert 0 <= value <= 0xff
-        self.value = value
-        self.trace.add_event(('register_write', self.addr, value))
+        self.memory[self.addr] = value
     def get(self):
-        self.trace.add_event(('register_read', self.addr, self.value))
-        return self.value
+        return self.memory[self.addr]
     def __setitem__(self, i, bit):
         assert (0 <= i <= 7) and (bit in (0, 1))
         bit_pattern = 1 << i
-        self.value = (self.value & ~bit_pattern) | (bit << i)
-        self.trace.add_event(('register_write_bit', self.addr, i, bit))
+        self.memory[self.addr] = (self.memory[self.addr] & ~bit_pattern) | (bit << i)
     def __getitem__(self, i):
         assert 0 <= i <= 7
-        bit = (self.value & (1 << i)) >> i
-        self.trace.add_event(('register_read_bit', self.addr, i, bit))
-        return bit
+        return (self.memory[self.addr] >> i) & 1
+    def update(self, mask, bits):
+        """ Replace bits of 'mask' by 'bits' in one store """
+        self.memory[self.addr] = (self.memory[self.addr] & ~mask) | bits
 
 class Status(ByteRegister):
-    """ Status register """
-    def __init__(self, trace):
-        ByteRegister.__init__(self, STATUS, trace)
+    """ Status register, bits 7..5 are unimplemented and read as 0
+
+    ALU ops set flags by update(mask, flags) with flags taken from tables
+    NZ_FLAGS and ADD_FLAGS.
+    """
+    def __init__(self, memory, trace):
+        ByteRegister.__init__(self, STATUS, memory, trace)
     def put(self, value):
-        pass
+        assert 0 <= value <= 0xff
+        self.memory[STATUS] = value & 0x1f
     def __setitem__(self, i, bit):
-        pass
+        if i < 5:
+            ByteRegister.__setitem__(self, i, bit)
     def put_N(self, bit):
-        pass
+        self[4] = bit
     def put_OV(self, bit):
-        pass
+        self[3] = bit
     def put_Z(self, bit):
-        pass
+        self[2] = bit
     def put_DC(self, bit):
-        pass
+        self[1] = bit
     def put_C(self, bit):
+        self[0] = bit
+
+class ProgramCounterLow(ByteRegister):
+    """ PCL: low byte of PC
+
+    Read returns low byte of address of the next op and latches its upper
+    bytes into PCLATH and PCLATU, write jumps to PCLATU:PCLATH:PCL. Ops advance
+    PC before storing result, so written PC is kept.
+    """
+    def __init__(self, pc, memory, trace):
+        ByteRegister.__init__(self, PCL, memory, trace)
+        self.pc = pc
+    def get(self):
+        memory, value = self.memory, self.pc.value + 2
+        memory[PCLATH] = (value >> 8) & 0xff
+        memory[PCLATU] = value >> 16
+        memory[PCL] = value & 0xff
+        return memory[PCL]
+    def put(self, value):
+        assert 0 <= value <= 0xff
+        memory = self.memory
+        memory[PCL] = value & 0xfe
+        self.pc.value = ((memory[PCLATU] & 0x1f) << 16) | (memory[PCLATH] << 8) | memory[PCL]
+    def __setitem__(self, i, bit):
+        ProgramCounterLow.put(self, (ProgramCounterLow.get(self) & ~(1 << i)) | (bit << i))
+    def __getitem__(self, i):
+        return (ProgramCounterLow.get(self) >> i) & 1
+    def update(self, mask, bits):
+        ProgramCounterLow.put(self, (ProgramCounterLow.get(self) & ~mask) | bits)
+
+class BankSelectRegister(ByteRegister):
+    """ BSR: bank select register, bits 7..4 are unimplemented and read as 0
+
+    Base address of selected bank is kept in attribute 'bank' of data memory,
+    so banked operands are resolved without reading BSR.
+    """
+    def __init__(self, data, memory, trace):
+        ByteRegister.__init__(self, BSR, memory, trace)
+        self.data = data
+    def put(self, value):
+        assert 0 <= value <= 0xff
+        self.memory[BSR] = value & 0x0f
+        self.data.bank = (value & 0x0f) << 8
+    def __setitem__(self, i, bit):
+        assert (0 <= i <= 7) and (bit in (0, 1))
+        BankSelectRegister.put(self, (self.memory[BSR] & ~(1 << i)) | (bit << i))
+    def update(self, mask, bits):
+        BankSelectRegister.put(self, (self.memory[BSR] & ~mask) | bits)
+
+class NullRegister(Register):
+    """ Unimplemented cell: reads as 0, writes are ignored """
+    def put(self, value):
         pass
+    def get(self):
+        return 0
+    def __setitem__(self, i, bit):
+        pass
+    def __getitem__(self, i):
+        return 0
+    def update(self, mask, bits):
+        pass
+
+NULL_REGISTER = NullRegister()
+
+class IndirectRegister(Register):
+    """ INDFn: virtual register accessing cell pointed by 12-bit FSRn
+
+    resolve() returns address of pointed cell and modifies FSR as register
+    does on access, so ops modifying operand resolve it once and then access
+    the cell. Virtual registers aren't traced themselves, accesses of FSR and
+    of pointed cells are.
+    """
+    indirect = True
+    def __init__(self, addr, fsr, data):
+        self.addr = addr
+        self.fsr = fsr
+        self.data = data
+        self.memory = data.ram
+        self.hooks = data.hooks
+    def load(self):
+        """ Value of FSR """
+        fsr = self.fsr
+        if self.hooks[fsr] is None:
+            memory = self.memory
+            return memory[fsr] | ((memory[fsr + 1] & 0x0f) << 8)
+        data = self.data
+        return data.read(fsr) | ((data.read(fsr + 1) & 0x0f) << 8)
+    def store(self, pointer):
+        """ Write FSR """
+        fsr = self.fsr
+        if self.hooks[fsr] is None:
+            memory = self.memory
+            memory[fsr] = pointer & 0xff
+            memory[fsr + 1] = pointer >> 8
+        else:
+            self.data.write(fsr, pointer & 0xff)
+            self.data.write(fsr + 1, pointer >> 8)
+    def resolve(self):
+        return self.load()
+    def target(self):
+        """ Resolve operand, return address and register (None for plain cell)
+
+        Virtual register pointed by FSR is replaced by NULL_REGISTER: such
+        access reads 0 and writes nothing.
+        """
+        addr = self.resolve()
+        reg = self.hooks[addr]
+        if reg is not None and reg.indirect:
+            return addr, NULL_REGISTER
+        return addr, reg
+    def get(self):
+        addr, reg = self.target()
+        return self.memory[addr] if reg is None else reg.get()
+    def put(self, value):
+        assert 0 <= value <= 0xff
+        addr, reg = self.target()
+        if reg is None:
+            self.memory[addr] = value
+        else:
+            reg.put(value)
+    def __setitem__(self, i, bit):
+        assert (0 <= i <= 7) and (bit in (0, 1))
+        self.update(1 << i, bit << i)
+    def __getitem__(self, i):
+        assert 0 <= i <= 7
+        return (self.get() >> i) & 1
+    def update(self, mask, bits):
+        addr, reg = self.target()
+        if reg is None:
+            self.memory[addr] = (self.memory[addr] & ~mask) | bits
+        else:
+            reg.update(mask, bits)
+
+class PostIncrementRegister(IndirectRegister):
+    """ POSTINCn: access cell pointed by FSRn, then increment FSRn """
+    def resolve(self):
+        pointer = self.load()
+        self.store((pointer + 1) & 0xfff)
+        return pointer
+
+class PostDecrementRegister(IndirectRegister):
+    """ POSTDECn: access cell pointed by FSRn, then decrement FSRn """
+    def resolve(self):
+        pointer = self.load()
+        self.store((pointer - 1) & 0xfff)
+        return pointer
+
+class PreIncrementRegister(IndirectRegister):
+    """ PREINCn: increment FSRn, then access cell pointed by it """
+    def resolve(self):
+        pointer = (self.load() + 1) & 0xfff
+        self.store(pointer)
+        return pointer
+
+class PlusWRegister(IndirectRegister):
+    """ PLUSWn: access cell at FSRn offset by signed WREG, FSRn is kept """
+    def resolve(self):
+        w = self.memory[WREG]
+        return (self.load() + w - ((w & 0x80) << 1)) & 0xfff
+
+# virtual registers of FSRn by offset downwards from INDFn
+INDIRECT_REGISTERS = (IndirectRegister, PostIncrementRegister, PostDecrementRegister,
+                      PreIncrementRegister, PlusWRegister)
+INDIRECT_ADDRS = frozenset(indf - offset for indf in INDFS
+                           for offset in xrange(len(INDIRECT_REGISTERS)))
+
+class WriteTracing(object):
+    """ Mixin logging writes into register """
+    def put(self, value):
+        # value stored by register may be masked
+        super(WriteTracing, self).put(value)
+        self.trace.add(REGISTER_WRITE, self.addr, self.memory[self.addr])
+    def __setitem__(self, i, bit):
+        super(WriteTracing, self).__setitem__(i, bit)
+        self.trace.add(REGISTER_WRITE_BIT, self.addr, (self.memory[self.addr] >> i) & 1, i)
+    def update(self, mask, bits):
+        super(WriteTracing, self).update(mask, bits)
+        self.trace.add(REGISTER_WRITE, self.addr, self.memory[self.addr])
+
+class ReadWriteTracing(WriteTracing):
+    """ Mixin logging reads and writes of register """
+    def get(self):
+        value = super(ReadWriteTracing, self).get()
+        self.trace.add(REGISTER_READ, self.addr, value)
+        return value
+    def __getitem__(self, i):
+        bit = super(ReadWriteTracing, self).__getitem__(i)
+        self.trace.add(REGISTER_READ_BIT, self.addr, bit, i)
+        return bit
+
+_traced_classes = {}
+
+def traced(cls, mixin):
+    """ Return subclass of register class 'cls' extended by tracing 'mixin' """
+    key = (cls, mixin)
+    if key not in _traced_classes:
+        _traced_classes[key] = type(mixin.__name__ + cls.__name__, (mixin, cls), {})
+    return _traced_classes[key]
@@ -0,0 +1,62 @@
+"""
+Scheduler of peripheral events keyed on cycle counter of MCU
+
+Every source of events (peripheral) has at most one pending event. Events
+are kept in heap ordered by their cycle, rescheduled or cancelled events
+stay in heap and are skipped when they reach its top.
+"""
+import heapq
+import sys
+
+NEVER = sys.maxint
+
+
+class Scheduler:
+    """ Queue of timed events of peripherals
+
+    Source of event is object with method fire(time) called when cycle
+    counter reaches time of its event.
+    """
+    def __init__(self):
+        self.heap = []
+        # source -> (time, sequence number) of its pending event
+        self.pending = {}
+        self.seq = 0
+        # time of the earliest event, checked by run loop after every op
+        self.next_time = NEVER
+    def schedule(self, source, time):
+        """ Set event of 'source' at cycle 'time' replacing its pending event """
+        self.seq += 1
+        self.pending[source] = (time, self.seq)
+        heapq.heappush(self.heap, (time, self.seq, source))
+        if time < self.next_time:
+            self.next_time = time
+    def cancel(self, source):
+        """ Drop pending event of 'source' """
+        self.pending.pop(source, None)
+    def time_of(self, source):
+        """ Time of pending event of 'source' or None """
+        event = self.pending.get(source)
+        return None if event is None else event[0]
+    def peek(self):
+        """ Time of the earliest pending event or NEVER """
+        heap, pending = self.heap, self.pending
+        while heap and pending.get(heap[0][2]) != heap[0][:2]:
+            heapq.heappop(heap)
+        self.next_time = heap[0][0] if heap else NEVER
+        return self.next_time
+    def run_due(self, now):
+        """ Fire events with time up to cycle 'now' in order of their time """
+        heap, pending = self.heap, self.pending
+        while self.peek() <= now:
+            time, seq, source = heapq.heappop(heap)
+            del pending[source]
+            source.fire(time)
+        return self.next_time
+    def snapshot(self):
+        return list(self.heap), dict(self.pending), self.seq
+    def restore(self, state):
+        heap, pending, self.seq = state
+        self.heap[:] = heap
+        self.pending = dict(pending)
+        self.peek()
@@ -0,0 +1,141 @@
+"""
+Sampling self-profiler of simulator
+
+SelfProfiler samples stack of main thread on real time (SIGALRM) timer, so
+the breakdown is of wall time including time blocked on output to terminal
+or files, and charges every sample to subsystem of the innermost simulator
+frame:
+    fetch     decoding and fetching of ops from ProgramMemory
+    execute   Op.execute and compiled blocks
+    data      DataMemory, registers and stack
+    trace     trace buffer, its sinks and tracing of registers and stack
+    frontend  CLI and its output
+    loop      run loops of MCU (including their inline fetch and dispatch)
+    wait      waiting for command at prompt of CLI
+    other     samples outside of simulator
+Cost of sampling doesn't depend on speed of simulation, at default rate it
+takes about one percent of time. Works only on Unix in main thread, it
+takes over SIGALRM while sampling.
+"""
+import cmd
+import os
+import signal
+import sys
+import time
+
+import picmicro
+import register
+
+FETCH, EXECUTE, DATA, TRACE, FRONTEND, LOOP, WAIT, OTHER = CATEGORIES = (
+    'fetch', 'execute', 'data', 'trace', 'frontend', 'loop', 'wait', 'other')
+
+# innermost frame of CLI blocked on reading of command
+PROMPT_CODE = cmd.Cmd.cmdloop.func_code
+
+# subsystems of modules and of classes taking precedence over their modules
+MODULES = {
+    'decoder': FETCH,
+    'op': EXECUTE,
+    'blocks': EXECUTE,
+    'register': DATA,
+    'tracebuf': TRACE,
+    'tracelog': TRACE,
+    'vcd': TRACE,
+    'cli': FRONTEND,
+    'picmicro': LOOP,
+    'profiler': LOOP,
+}
+CLASSES = [
+    (picmicro.ProgramMemory, FETCH),
+    (picmicro.DataMemory, DATA),
+    (picmicro.Stack, DATA),
+    (picmicro.TracedStack, TRACE),
+    (register.WriteTracing, TRACE),
+    (register.ReadWriteTracing, TRACE),
+]
+
+def _class_codes():
+    codes = {}
+    for cls, category in CLASSES:
+        for value in vars(cls).values():
+            code = getattr(value, 'func_code', None)
+            if code is not None:
+                codes[code] = category
+    return codes
+
+
+class SelfProfiler:
+    """ Sampler of time spent by subsystems of simulator """
+    INTERVAL = 0.001
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.samples = dict.fromkeys(CATEGORIES, 0)
+        self.codes = _class_codes()
+        self.wall_time = 0.0
+        self.running = False
+    def start(self):
+        """ Start sampling """
+        if self.running:
+            return
+        self.previous = signal.signal(signal.SIGALRM, self._sample)
+        signal.siginterrupt(signal.SIGALRM, False)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        self.started = time.time()
+        self.running = True
+    def stop(self):
+        """ Stop sampling, samples are kept """
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.previous)
+        self.wall_time += time.time() - self.started
+        self.running = False
+    def reset(self):
+        self.samples = dict.fromkeys(CATEGORIES, 0)
+        self.wall_time = 0.0
+        self.started = time.time()
+    def __enter__(self):
+        self.start()
+        return self
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def category(self, code):
+        """ Subsystem of code object or None for code outside of simulator """
+        category = self.codes.get(code, False)
+        if category is False:
+            if code.co_filename.startswith('<block'):
+                category = EXECUTE
+            else:
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                category = MODULES.get(module)
+            self.codes[code] = category
+        return category
+    def _sample(self, signum, frame):
+        if frame is not None and frame.f_code is PROMPT_CODE:
+            self.samples[WAIT] += 1
+            return
+        while frame is not None:
+            category = self.category(frame.f_code)
+            if category is not None:
+                break
+            frame = frame.f_back
+        else:
+            category = OTHER
+        self.samples[category] += 1
+
+    def breakdown(self):
+        """ Return list of (subsystem, samples, share of time) sorted by samples """
+        total = float(sum(self.samples.values()) or 1)
+        result = [(category, n, n / total) for category, n in self.samples.items()]
+        result.sort(key=lambda row: (-row[1], row[0]))
+        return result
+    def report(self, out=sys.stdout):
+        """ Print time breakdown """
+        print >> out, '%-10s %8s %7s' % ('subsystem', 'samples', '%')
+        for category, n, share in self.breakdown():
+            print >> out, '%-10s %8d %7.2f' % (category, n, 100 * share)
+        wall_time = self.wall_time
+        if self.running:
+            wall_time += time.time() - self.started
+        print >> out, '%d samples in %.3f s of wall time' % (sum(self.samples.values()), wall_time)
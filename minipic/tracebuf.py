@@ -0,0 +1,169 @@
+"""
+Ring buffer of trace events
+
+Events are kept as structured records in preallocated typed arrays (event
+code, address, value, bit, cycle), so adding event allocates nothing. Every
+event gets absolute sequence number, readers keep their own cursors over
+these numbers and don't consume events of each other.
+"""
+import struct
+from array import array
+
+# codes of events
+(OPCODE_FETCH, REGISTER_READ, REGISTER_WRITE, REGISTER_READ_BIT,
+ REGISTER_WRITE_BIT, STACK_PUSH, STACK_POP, STACK_IS_FULL, STACK_IS_UNFULL) = range(9)
+
+EVENT_NAMES = ('opcode_fetch', 'register_read', 'register_write', 'register_read_bit',
+               'register_write_bit', 'stack_push', 'stack_pop', 'stack_is_full',
+               'stack_is_unfull')
+EVENT_CODES = dict((name, code) for code, name in enumerate(EVENT_NAMES))
+
+# fields of record and typecodes of their arrays
+FIELDS = (('code', 'B'), ('addr', 'I'), ('value', 'I'), ('bit', 'B'), ('cycle', 'L'))
+
+FILE_MAGIC = 'MPTRACE1'
+
+def event_tuple(code, addr, value, bit):
+    """ Convert record into tuple like ('register_write', addr, value) """
+    name = EVENT_NAMES[code]
+    if code in (REGISTER_READ_BIT, REGISTER_WRITE_BIT):
+        return name, addr, bit, value
+    if code in (OPCODE_FETCH, REGISTER_READ, REGISTER_WRITE):
+        return name, addr, value
+    if code in (STACK_PUSH, STACK_POP):
+        return name, value
+    return name,
+
+
+class _NoClock:
+    cycles = 0
+
+
+class TraceBuf:
+    """ Buffer for saving of trace logs """
+    SIZE = 128
+    def __init__(self, capacity=SIZE, clock=None):
+        self.capacity = capacity
+        # object whose attribute 'cycles' stamps events
+        self.clock = clock if clock is not None else _NoClock()
+        self.codes = array('B', [0]) * capacity
+        self.addrs = array('I', [0]) * capacity
+        self.values = array('I', [0]) * capacity
+        self.bits = array('B', [0]) * capacity
+        self.cycles = array('L', [0]) * capacity
+        self.index = 0
+        # number of all events added since creation
+        self.count = 0
+        self.reader = self.cursor()
+        # consumers with method flush() called whenever ring fills up
+        self.sinks = []
+    def add(self, code, addr=0, value=0, bit=0):
+        """ Add event record """
+        i = self.index
+        self.codes[i] = code
+        self.addrs[i] = addr
+        self.values[i] = value
+        self.bits[i] = bit
+        self.cycles[i] = self.clock.cycles
+        self.count += 1
+        i += 1
+        if i == self.capacity:
+            i = 0
+            for sink in self.sinks:
+                sink.flush()
+        self.index = i
+    def add_event(self, event):
+        """ Add event given as tuple like ('register_write', addr, value) """
+        code = EVENT_CODES[event[0]]
+        if code in (REGISTER_READ_BIT, REGISTER_WRITE_BIT):
+            self.add(code, event[1], event[3], event[2])
+        elif code in (STACK_PUSH, STACK_POP):
+            self.add(code, 0, event[1])
+        else:
+            self.add(code, *event[1:])
+    @property
+    def first(self):
+        """ Sequence number of the oldest event kept in buffer """
+        return max(0, self.count - self.capacity)
+    def records(self, start, stop):
+        """ Return arrays of fields of events with numbers from 'start' to 'stop' """
+        assert self.first <= start <= stop <= self.count
+        begin, end = start % self.capacity, stop % self.capacity
+        chunks = []
+        for name, _ in FIELDS:
+            column = getattr(self, name + 's')
+            if stop - start == 0:
+                chunks.append(column[:0])
+            elif begin < end:
+                chunks.append(column[begin:end])
+            else:
+                chunks.append(column[begin:] + column[:end])
+        return chunks
+    def cursor(self, oldest=False):
+        """ Create reader of events added after now or of the oldest kept ones """
+        return TraceCursor(self, self.first if oldest else self.count)
+    def __iter__(self):
+        return iter(self.reader)
+    def to_numpy(self):
+        """ Return kept events as NumPy structured array """
+        import numpy
+        dtype = [(name, numpy.dtype(typecode)) for name, typecode in FIELDS]
+        columns = self.records(self.first, self.count)
+        result = numpy.zeros(len(columns[0]), dtype=dtype)
+        for (name, _), column in zip(FIELDS, columns):
+            result[name] = column
+        return result
+    def tofile(self, f):
+        """ Write kept events into binary file: header and columns of fields """
+        columns = self.records(self.first, self.count)
+        f.write(FILE_MAGIC + struct.pack('<QQ', self.first, len(columns[0])))
+        for column in columns:
+            f.write(column.tostring())
+
+def fromfile(f):
+    """ Read events written by TraceBuf.tofile, return first number and columns """
+    if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+        raise ValueError('file is not binary trace')
+    first, count = struct.unpack('<QQ', f.read(16))
+    columns = []
+    for _, typecode in FIELDS:
+        column = array(typecode)
+        data = f.read(count * column.itemsize)
+        if len(data) != count * column.itemsize:
+            raise ValueError('binary trace is truncated')
+        column.fromstring(data)
+        columns.append(column)
+    return first, columns
+
+
+class TraceCursor:
+    """ Reader of events of trace buffer independent from other readers """
+    def __init__(self, buf, position):
+        self.buf = buf
+        self.position = position
+        # number of events overwritten before they were read
+        self.lost = 0
+    def _catch_up(self):
+        first = self.buf.first
+        if self.position < first:
+            self.lost += first - self.position
+            self.position = first
+    def read(self):
+        """ Return arrays of fields of all unread events and mark them read """
+        self._catch_up()
+        columns = self.buf.records(self.position, self.buf.count)
+        self.position = self.buf.count
+        return columns
+    def skip(self):
+        """ Mark all events read """
+        self.position = self.buf.count
+    def __iter__(self):
+        return self
+    def next(self):
+        self._catch_up()
+        if self.position == self.buf.count:
+            raise StopIteration()
+        i = self.position % self.buf.capacity
+        self.position += 1
+        buf = self.buf
+        return event_tuple(buf.codes[i], buf.addrs[i], buf.values[i], buf.bits[i])
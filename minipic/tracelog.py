@@ -0,0 +1,187 @@
+"""
+Compressed on-disk log of trace events for long runs
+
+TraceSink takes events out of trace buffer every time the ring fills up and
+hands them to background thread, which packs them into compressed blocks and
+appends them to file. File ends with index of blocks, so TraceLog can seek to
+cycle without decompressing preceding blocks.
+
+File layout:
+    magic, codec name (5 bytes, space padded)
+    blocks: tag, header (first event, count, first cycle, last cycle, size)
+            and compressed columns of fields of events
+    index: tag, size and compressed headers of blocks with their offsets
+    trailer: offset of index and magic
+"""
+import bisect
+import Queue
+import struct
+import threading
+import zlib
+from array import array
+
+from tracebuf import FIELDS, event_tuple
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+LOG_MAGIC = 'MPTRLOG1'
+BLOCK_TAG, INDEX_TAG = 'BLCK', 'INDX'
+BLOCK = struct.Struct('<4sQIQQI')
+INDEX = struct.Struct('<QIQQIQ')
+TRAILER = struct.Struct('<Q8s')
+
+CODECS = {'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress)}
+if lzma is not None:
+    CODECS['lzma'] = (lzma.compress, lzma.decompress)
+
+
+class TraceSink:
+    """ Writer of all events of trace buffer into compressed log file """
+    BLOCK_EVENTS = 1 << 16
+    def __init__(self, trace, path, codec='zlib', block_events=BLOCK_EVENTS, queue_size=64):
+        if codec not in CODECS:
+            raise ValueError('unknown or unavailable codec %r' % codec)
+        self.trace = trace
+        self.compress = CODECS[codec][0]
+        self.block_events = block_events
+        self.file = open(path, 'wb')
+        self.file.write(LOG_MAGIC + codec.ljust(5))
+        self.index = []
+        self.error = None
+        self.cursor = trace.cursor()
+        self.queue = Queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._write_blocks, name='trace-sink')
+        self.thread.daemon = True
+        self.thread.start()
+        trace.sinks.append(self)
+    def flush(self):
+        """ Pass unread events of trace buffer to writing thread """
+        first = self.cursor.position
+        columns = self.cursor.read()
+        if len(columns[0]):
+            self.queue.put((first, columns))
+    def close(self):
+        """ Write remaining events and index, close file """
+        if self not in self.trace.sinks:
+            return
+        self.trace.sinks.remove(self)
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is None:
+            offset = self.file.tell()
+            entries = ''.join(INDEX.pack(*entry) for entry in self.index)
+            index = zlib.compress(entries)
+            self.file.write(INDEX_TAG + struct.pack('<I', len(index)) + index)
+            self.file.write(TRAILER.pack(offset, LOG_MAGIC))
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_blocks(self):
+        pending, first = [], None
+        size = 0
+        while True:
+            item = self.queue.get()
+            if item is not None:
+                if first is None:
+                    first = item[0]
+                pending.append(item[1])
+                size += len(item[1][0])
+            if size and (item is None or size >= self.block_events):
+                try:
+                    self._write_block(first, pending)
+                except Exception, e:
+                    self.error = e
+                pending, first = [], None
+                size = 0
+            if item is None:
+                return
+
+    def _write_block(self, first, chunks):
+        columns = [array(typecode) for _, typecode in FIELDS]
+        for chunk in chunks:
+            for column, part in zip(columns, chunk):
+                column.extend(part)
+        cycles = columns[-1]
+        data = self.compress(''.join(column.tostring() for column in columns))
+        offset = self.file.tell()
+        header = (first, len(cycles), cycles[0], cycles[-1], len(data))
+        self.file.write(BLOCK.pack(BLOCK_TAG, *header) + data)
+        self.index.append(header + (offset,))
+
+
+class TraceLog:
+    """ Reader of log file written by TraceSink """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        if self.file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError('file is not trace log')
+        codec = self.file.read(5).strip()
+        if codec not in CODECS:
+            raise ValueError('unknown or unavailable codec %r' % codec)
+        self.decompress = CODECS[codec][1]
+        self.index = self._read_index()
+        self.last_cycles = [entry[3] for entry in self.index]
+    def _read_index(self):
+        self.file.seek(-TRAILER.size, 2)
+        offset, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != LOG_MAGIC:
+            return self._scan_blocks()
+        self.file.seek(offset)
+        if self.file.read(4) != INDEX_TAG:
+            raise ValueError('index of trace log is corrupt')
+        size, = struct.unpack('<I', self.file.read(4))
+        entries = zlib.decompress(self.file.read(size))
+        return [INDEX.unpack_from(entries, i) for i in xrange(0, len(entries), INDEX.size)]
+    def _scan_blocks(self):
+        """ Rebuild index of log whose writing was not finished """
+        index = []
+        offset = len(LOG_MAGIC) + 5
+        while True:
+            self.file.seek(offset)
+            header = self.file.read(BLOCK.size)
+            if len(header) < BLOCK.size:
+                return index
+            header = BLOCK.unpack(header)
+            if header[0] != BLOCK_TAG:
+                return index
+            header = header[1:]
+            if len(self.file.read(header[-1])) < header[-1]:
+                return index
+            index.append(header + (offset,))
+            offset += BLOCK.size + header[-1]
+    def close(self):
+        self.file.close()
+    def __len__(self):
+        """ Number of events in log """
+        return sum(entry[1] for entry in self.index)
+    def read_block(self, i):
+        """ Return arrays of fields of events of block 'i' """
+        first, count, _, _, size, offset = self.index[i]
+        self.file.seek(offset + BLOCK.size)
+        data = self.decompress(self.file.read(size))
+        columns, pos = [], 0
+        for _, typecode in FIELDS:
+            column = array(typecode)
+            column.fromstring(data[pos:pos + count * column.itemsize])
+            pos += count * column.itemsize
+            columns.append(column)
+        return columns
+    def events(self, from_cycle=0):
+        """ Yield tuples (cycle, event) of events starting at cycle 'from_cycle' """
+        for i in xrange(bisect.bisect_left(self.last_cycles, from_cycle), len(self.index)):
+            codes, addrs, values, bits, cycles = self.read_block(i)
+            start = bisect.bisect_left(cycles, from_cycle)
+            for j in xrange(start, len(codes)):
+                yield cycles[j], event_tuple(codes[j], addrs[j], values[j], bits[j])
@@ -0,0 +1,118 @@
+"""
+Value Change Dump of register and PC activity
+
+VCDWriter is sink of trace buffer: every time ring fills up it turns
+fetches and register writes into value changes of PC and chosen registers
+and appends them to file in one write. Only values that really change are
+dumped. Timescale of VCD is the coarsest unit in which instruction cycle at
+frequency of MCU lasts whole number of ticks, so that 4 MHz MCU is dumped in
+microseconds.
+
+Register writes need MCU traced at least at level TRACE_WRITES.
+"""
+from picmicro import TRACE_WRITES, CLOCKS_PER_CYCLE
+from register import WREG, STATUS, BSR, STKPTR
+from tracebuf import OPCODE_FETCH, REGISTER_WRITE, REGISTER_WRITE_BIT
+
+DEFAULT_REGISTERS = {WREG: 'WREG', STATUS: 'STATUS', BSR: 'BSR', STKPTR: 'STKPTR'}
+PC_SIGNAL = 'PC'
+UNITS = ('s', 'ms', 'us', 'ns', 'ps', 'fs')
+
+def _identifier(n):
+    """ Short identifier of signal made of printable characters """
+    chars = ''
+    while True:
+        chars += chr(33 + n % 94)
+        n //= 94
+        if n == 0:
+            return chars
+
+def _timescale(frequency):
+    """ Timescale and number of its ticks per instruction cycle at frequency """
+    for k, unit in enumerate(UNITS):
+        ticks = CLOCKS_PER_CYCLE * 1000.0 ** k / frequency
+        if ticks >= 1 and ticks == int(ticks):
+            return '1 %s' % unit, int(ticks)
+    return '1 fs', int(round(ticks))
+
+
+class VCDWriter:
+    """ Writer of value changes of MCU into VCD file
+
+    registers: list of data memory addresses or mapping of address to name
+    """
+    def __init__(self, mcu, path, registers=None):
+        if mcu.trace_level < TRACE_WRITES:
+            raise ValueError('VCD needs MCU traced at level TRACE_WRITES or higher')
+        if registers is None:
+            registers = DEFAULT_REGISTERS
+        if not isinstance(registers, dict):
+            registers = dict((addr, DEFAULT_REGISTERS.get(addr, 'r%03x' % addr))
+                             for addr in registers)
+        self.trace = mcu.trace
+        self.cursor = mcu.trace.cursor()
+        self.ids = {PC_SIGNAL: _identifier(0)}
+        self.last = {PC_SIGNAL: mcu.pc.value}
+        signals = [(PC_SIGNAL, 21)]
+        for addr, name in sorted(registers.items()):
+            self.ids[addr] = _identifier(len(self.ids))
+            self.last[addr] = mcu.data.ram[addr]
+            signals.append((addr, 8))
+        self.time = mcu.cycles
+        timescale, self.ticks = _timescale(mcu.frequency)
+        self.file = open(path, 'w')
+        lines = ['$timescale %s $end' % timescale, '$scope module mcu $end']
+        for key, width in signals:
+            name = PC_SIGNAL if key == PC_SIGNAL else registers[key]
+            lines.append('$var wire %d %s %s $end' % (width, self.ids[key], name))
+        lines += ['$upscope $end', '$enddefinitions $end', '#%d' % (self.time * self.ticks),
+                  '$dumpvars']
+        for key, _ in signals:
+            lines.append('b%s %s' % (bin(self.last[key])[2:], self.ids[key]))
+        lines.append('$end')
+        self.file.write('\n'.join(lines) + '\n')
+        mcu.trace.sinks.append(self)
+
+    def flush(self):
+        """ Dump changes logged since last flush """
+        codes, addrs, values, bits, cycles = self.cursor.read()
+        ids, last = self.ids, self.last
+        time = self.time
+        ticks = self.ticks
+        out = []
+        for j in xrange(len(codes)):
+            code = codes[j]
+            if code == OPCODE_FETCH:
+                key, value = PC_SIGNAL, addrs[j]
+            elif code == REGISTER_WRITE:
+                key, value = addrs[j], values[j]
+                if key not in ids:
+                    continue
+            elif code == REGISTER_WRITE_BIT:
+                key = addrs[j]
+                if key not in ids:
+                    continue
+                value = (last[key] & ~(1 << bits[j])) | (values[j] << bits[j])
+            else:
+                continue
+            if last[key] == value:
+                continue
+            last[key] = value
+            if cycles[j] != time:
+                time = cycles[j]
+                out.append('#%d' % (time * ticks))
+            out.append('b%s %s' % (bin(value)[2:], ids[key]))
+        self.time = time
+        if out:
+            self.file.write('\n'.join(out) + '\n')
+
+    def close(self):
+        """ Dump remaining changes and close file """
+        if self in self.trace.sinks:
+            self.trace.sinks.remove(self)
+            self.flush()
+            self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
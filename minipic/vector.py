@@ -0,0 +1,163 @@
+"""
+Lockstep simulation of many instances of one program with NumPy
+
+VectorMCU keeps data memory of N instances (lanes) as 2D uint8 array and
+their PCs as vector. Every step lanes are grouped by PC and each group
+executes its op as one vectorised operation, so lanes split when they
+diverge and merge again when they reach the same PC.
+
+Supported ops: NOP, MOVLW, MOVWF, DECFSZ, BTFSC, BTG, GOTO, CALL, RETURN.
+Indirect addressing (INDFn, POSTINCn, ...) and access to PCL aren't
+supported. Unimplemented bits of BSR and STATUS are cleared on write.
+"""
+import numpy
+
+from op import *
+from picmicro import DataMemory, ProgramMemory, Stack
+from register import WREG, STATUS, BSR, STKPTR, PCL, INDIRECT_ADDRS
+
+# cells whose access isn't supported
+UNSUPPORTED = numpy.zeros(DataMemory.SIZE, dtype=bool)
+UNSUPPORTED[list(INDIRECT_ADDRS) + [PCL]] = True
+
+# implemented bits of cells
+MASKS = numpy.full(DataMemory.SIZE, 0xff, dtype=numpy.uint8)
+MASKS[BSR], MASKS[STATUS] = 0x0f, 0x1f
+
+
+def _operand(vm, lanes, f, a):
+    """ Address of operand: scalar for access bank, vector for banked one """
+    if a == 0:
+        addr = f if f < 0x80 else (0x0f00 | f)
+    else:
+        addr = (vm.ram[lanes, BSR].astype(numpy.intp) << 8) | f
+    if UNSUPPORTED[addr].any():
+        raise NotImplementedError('indirect addressing and PCL are not supported by VectorMCU')
+    return addr
+
+def _store(vm, lanes, addr, values):
+    """ Write 'values' into cell 'addr' of 'lanes' keeping implemented bits """
+    vm.ram[lanes, addr] = values & MASKS[addr]
+
+def _nop(vm, op, lanes):
+    vm.pc[lanes] += op.SIZE
+    return 1
+
+def _movlw(vm, op, lanes):
+    vm.ram[lanes, WREG] = op.k
+    vm.pc[lanes] += op.SIZE
+    return 1
+
+def _movwf(vm, op, lanes):
+    _store(vm, lanes, _operand(vm, lanes, op.f, op.a), vm.ram[lanes, WREG])
+    vm.pc[lanes] += op.SIZE
+    return 1
+
+def _btg(vm, op, lanes):
+    addr = _operand(vm, lanes, op.f, op.a)
+    _store(vm, lanes, addr, vm.ram[lanes, addr] ^ (1 << op.b))
+    vm.pc[lanes] += op.SIZE
+    return 1
+
+def _btfsc(vm, op, lanes):
+    bit = vm.ram[lanes, _operand(vm, lanes, op.f, op.a)] & (1 << op.b)
+    vm.pc[lanes] += numpy.where(bit, op.SIZE, op.SIZE + 2)
+    return numpy.where(bit, 1, 2)
+
+def _decfsz(vm, op, lanes):
+    addr = _operand(vm, lanes, op.f, op.a)
+    result = vm.ram[lanes, addr] - numpy.uint8(1)
+    _store(vm, lanes, WREG if op.d == 0 else addr, result)
+    vm.pc[lanes] += numpy.where(result == 0, op.SIZE + 2, op.SIZE)
+    return numpy.where(result == 0, 2, 1)
+
+def _goto(vm, op, lanes):
+    vm.pc[lanes] = op.k << 1
+    return 2
+
+def _call(vm, op, lanes):
+    stkptr = vm.ram[lanes, STKPTR] & 0x1f
+    full = stkptr == 0x1f
+    vm.ram[lanes[full], STKPTR] |= 1 << Stack.STKFUL
+    pushed, stkptr = lanes[~full], stkptr[~full]
+    vm.stack[pushed, stkptr] = vm.pc[pushed] + op.SIZE
+    vm.ram[pushed, STKPTR] += 1
+    if op.s == 1:
+        vm.shadows[lanes] = vm.ram[lanes][:, SHADOWED]
+    vm.pc[lanes] = op.n << 1
+    return 2
+
+def _return(vm, op, lanes):
+    stkptr = vm.ram[lanes, STKPTR] & 0x1f
+    empty = stkptr == 0
+    vm.ram[lanes[empty], STKPTR] |= 1 << Stack.STKUNF
+    vm.pc[lanes[empty]] = 0
+    popped, stkptr = lanes[~empty], stkptr[~empty]
+    vm.ram[popped, STKPTR] -= 1
+    vm.pc[popped] = vm.stack[popped, stkptr - 1]
+    if op.s == 1:
+        for i, addr in enumerate(SHADOWED):
+            vm.ram[lanes, addr] = vm.shadows[lanes, i]
+    return 2
+
+# registers saved in fast register stack by CALL/RETURN with s = 1
+SHADOWED = [WREG, STATUS, BSR]
+
+HANDLERS = {
+    NOP: _nop,
+    MOVLW: _movlw,
+    MOVWF: _movwf,
+    BTG: _btg,
+    BTFSC: _btfsc,
+    DECFSZ: _decfsz,
+    GOTO: _goto,
+    CALL: _call,
+    RETURN: _return,
+}
+
+
+class VectorMCU(object):
+    """ Many instances of PIC18F core running one program in lockstep """
+    def __init__(self, lanes, program=None):
+        self.lanes = lanes
+        self.program = program if program is not None else ProgramMemory()
+        self.ram = numpy.zeros((lanes, DataMemory.SIZE), dtype=numpy.uint8)
+        self.pc = numpy.zeros(lanes, dtype=numpy.int64)
+        self.stack = numpy.zeros((lanes, Stack.SIZE), dtype=numpy.int64)
+        self.shadows = numpy.zeros((lanes, len(SHADOWED)), dtype=numpy.uint8)
+        self.cycles = numpy.zeros(lanes, dtype=numpy.int64)
+        # lanes still running
+        self.active = numpy.ones(lanes, dtype=bool)
+
+    def step(self, running=None):
+        """ Execute one operation on every active lane or on lanes 'running' """
+        if running is None:
+            running = numpy.flatnonzero(self.active)
+        if len(running) == 0:
+            return
+        pcs, group = numpy.unique(self.pc[running], return_inverse=True)
+        for i, addr in enumerate(pcs):
+            op = self.program[int(addr)]
+            handler = HANDLERS.get(op.__class__)
+            if handler is None:
+                raise NotImplementedError('%s is not supported by VectorMCU' %
+                                          op.__class__.__name__)
+            lanes = running[group == i]
+            self.cycles[lanes] += handler(self, op, lanes)
+        self.pc[running] %= ProgramMemory.SIZE
+
+    def run(self, max_cycles, until_pc=None):
+        """ Run lanes for 'max_cycles' cycles; lanes reaching 'until_pc' stop
+
+        Like MCU.run, lane may exceed budget by one cycle of its last op.
+        Return number of lanes still running.
+        """
+        start = self.cycles.copy()
+        while True:
+            running = numpy.flatnonzero(self.active & (self.cycles - start < max_cycles))
+            if len(running) == 0:
+                break
+            self.step(running)
+            if until_pc is not None:
+                self.active &= self.pc != until_pc
+        return int(self.active.sum())
@@ -11,6 +11,7 @@ config = {
         'author_email': 'milyutinma@gmail.com',
         'version': '0.1',
         'install_requires': ['nose'],
+        'extras_require': {'vector': ['numpy']},
         'packages': ['minipic'],
         'scripts': [],
         'name': 'minipic'
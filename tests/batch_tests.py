@@ -0,0 +1,27 @@
+import os
+import tempfile
+from nose.tools import *
+from minipic.batch import run_batch
+
+# 0: MOVLW 3; 2: MOVWF 0x20; 4: DECFSZ 0x20,f; 6: GOTO 4; 10: BTG 0x21,0; 12: GOTO 0
+IMAGE = [':10000000030E206E202E02EF00F0217000EF00F0B2',
+         ':00000001FF']
+
+def setup():
+    global hexfile
+    fd, hexfile = tempfile.mkstemp('.hex')
+    os.write(fd, '\n'.join(IMAGE) + '\n')
+    os.close(fd)
+
+def teardown():
+    os.remove(hexfile)
+
+def test_run_batch():
+    scenarios = [{'id': n, 'pc': 4, 'ram': {'0x20': n}, 'until_pc': 10,
+                  'registers': [0x20]} for n in range(1, 9)]
+    for jobs in (1, 2):
+        results = list(run_batch(hexfile, scenarios, jobs))
+        assert_equal([r['id'] for r in results], range(1, 9))
+        assert_equal([r['cycles'] for r in results], [3 * n for n in range(1, 9)])
+        assert_equal(set(r['reason'] for r in results), set(['until_pc']))
+        assert_equal(results[0]['registers'], {'0x20': 0})
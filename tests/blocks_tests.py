@@ -0,0 +1,149 @@
+from nose.tools import *
+from minipic.picmicro import *
+
+# 0: MOVLW 3; 2: MOVWF 0x20; 4: DECFSZ 0x20,f; 6: GOTO 4; 10: BTG 0x21,0; 12: GOTO 0
+PROGRAM = [0x0E03, 0x6E20, 0x2E20, 0xEF02, 0xF000, 0x7021, 0xEF00, 0xF000]
+
+def _mcu(blocks):
+    pic = MCU(blocks=blocks)
+    for i, word in enumerate(PROGRAM):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+def test_blocks_match_interpreter():
+    for budget in (1, 5, 9, 10, 11, 100, 1001):
+        plain, compiled = _mcu(False), _mcu(True)
+        assert_equal(plain.run(budget), compiled.run(budget))
+        assert_equal(plain.pc.value, compiled.pc.value)
+        assert_equal(plain.data.ram, compiled.data.ram)
+
+def test_loop_block():
+    pic = _mcu(True)
+    assert_equal(pic.run(until_pc=10), (STOP_UNTIL_PC, 11))
+    block = pic.blocks[4]
+    assert_equal(block.addrs, frozenset([4, 6, 8]))
+    assert_true('continue' in block.source)
+
+def test_breakpoint_inside_block():
+    pic = _mcu(True)
+    assert_equal(pic.run(breakpoints=set([6])), (STOP_BREAKPOINT, 3))
+
+def test_write_invalidates_block():
+    pic = _mcu(True)
+    pic.run(until_pc=10)
+    assert_true(4 in pic.blocks.blocks)
+    pic.program.write_word(6, 0xEF05)
+    assert_false(4 in pic.blocks.blocks)
+    pic.pc.value = 4
+    pic.data.ram[0x20] = 2
+    assert_equal(pic.run(until_pc=10), (STOP_UNTIL_PC, 3))
+
+def test_block_wraps_at_top_of_memory():
+    # 0x1ffff8: MOVLW 3; ADDWF 0x20; BTFSC 0x20, 0; BTG 0x21, 0
+    # 0: INCF 0x22; 2: GOTO 0x1ffff8
+    words = {0x1ffff8: [0x0E03, 0x2620, 0xB020, 0x7021], 0: [0x2A22, 0xEFFC, 0xFFFF]}
+    for budget in (1, 4, 7, 100, 1001):
+        pics = []
+        for blocks in (False, True):
+            pic = MCU(blocks=blocks)
+            for addr, code in words.items():
+                for i, word in enumerate(code):
+                    pic.program.write_word(addr + 2 * i, word)
+            pic.pc.value = 0x1ffff8
+            pics.append((pic.run(budget), pic.pc.value, pic.data.ram[0x20:0x23]))
+        assert_equal(pics[0], pics[1])
+    assert_equal(pic.blocks[0x1ffff8].addrs, frozenset([0x1ffff8, 0x1ffffa, 0x1ffffc,
+                                                         0x1ffffe, 0, 2, 4]))
+
+def test_alu_blocks_match_interpreter():
+    import random
+    rand = random.Random(20)
+    # ALU ops on WREG and cells 0x20..0x21, loop closed by DECFSZ 0x22
+    codes = [0x2400, 0x2000, 0x5C00, 0x5800, 0x5400, 0x1400, 0x1000, 0x1800]
+    literals = [0x0F00, 0x0800, 0x0B00, 0x0900, 0x0A00]
+    for _ in xrange(20):
+        words = []
+        for _ in xrange(12):
+            if rand.random() < 0.3:
+                words.append(rand.choice(literals) | rand.randrange(0x100))
+            else:
+                words.append(rand.choice(codes) | rand.randrange(2) << 9 | 0x20 | rand.randrange(2))
+        words += [0x2E22, 0xEF00, 0xF000]
+        pics = [MCU(blocks=blocks) for blocks in (False, True)]
+        for pic in pics:
+            for i, word in enumerate(words):
+                pic.program.write_word(2 * i, word)
+            pic.data.ram[0x20:0x23] = bytearray([0x7f, 0x80, 0x00])
+            pic.run(1000)
+        assert_equal(pics[0].data.ram, pics[1].data.ram)
+        assert_equal(pics[0].pc.value, pics[1].pc.value)
+
+def test_instruction_set_blocks_match_interpreter():
+    import random
+    rand = random.Random(21)
+    # byte ops, bit ops and skips on cells 0x20..0x21
+    codes = [0x1C00, 0x5000, 0x2800, 0x0400, 0x3400, 0x4400, 0x3000, 0x4000, 0x3800,
+             0x3C00, 0x4C00, 0x4800, 0x2400]
+    fixed = [0x6C00, 0x6A00, 0x6800, 0x6200, 0x6400, 0x6000, 0x6600, 0x0200]
+    bits = [0x9000, 0x8000, 0xA000, 0xB000, 0x7000]
+    literals = [0x0D00, 0x0F00, 0x0E00]
+    # BZ, BNZ, BC, BNC, BN, BNN, BOV, BNOV, BRA
+    branches = [0xE000, 0xE100, 0xE200, 0xE300, 0xE600, 0xE700, 0xE400, 0xE500, 0xD000]
+    for _ in xrange(25):
+        words = []
+        for _ in xrange(16):
+            f = 0x20 | rand.randrange(2)
+            kind = rand.random()
+            if kind < 0.1:
+                words.append(rand.choice(branches) | rand.randrange(3))
+            elif kind < 0.2:
+                words.append(rand.choice(literals) | rand.randrange(0x100))
+            elif kind < 0.4:
+                words.append(rand.choice(bits) | rand.randrange(8) << 9 | f)
+            elif kind < 0.6:
+                words.append(rand.choice(fixed) | f)
+            else:
+                words.append(rand.choice(codes) | rand.randrange(2) << 9 | f)
+        # DECFSZ 0x22, f; GOTO 0
+        words += [0x2E22, 0xEF00, 0xF000]
+        pics = [MCU(blocks=blocks) for blocks in (False, True)]
+        for pic in pics:
+            for i, word in enumerate(words):
+                pic.program.write_word(2 * i, word)
+            pic.data.ram[0x20:0x23] = bytearray([0x7f, 0x80, 0x00])
+            pic.run(1000)
+        assert_equal(pics[0].data.ram, pics[1].data.ram)
+        assert_equal((pics[0].pc.value, pics[0].cycles), (pics[1].pc.value, pics[1].cycles))
+
+def test_banked_and_indirect_pcl_blocks_match_interpreter():
+    import random
+    rand = random.Random(6)
+    # MOVF, ADDWF, DECF, BTG, MOVWF; skips DECFSZ, TSTFSZ, BTFSC
+    codes = [0x5000, 0x2400, 0x0400, 0x7000, 0x6E00]
+    skips = [0x2C00, 0x6600, 0xB000]
+    # PCL banked with BSR 15, INDF0, POSTINC0, POSTDEC0, PLUSW0, cell 0x20
+    regs = [(0xF9, 1), (0xEF, 0), (0xEE, 0), (0xED, 0), (0xEB, 0), (0xEF, 1), (0x20, 0)]
+    for _ in xrange(40):
+        # MOVLB 0 or 15; LFSR 0, pointer near PCL
+        words = [0x0100 | rand.choice([0, 15]), 0xEE0F, 0xF0F8 | rand.randrange(3)]
+        for _ in xrange(12):
+            f, a = rand.choice(regs)
+            kind = rand.random()
+            if kind < 0.2:
+                words.append(rand.choice(skips) | a << 8 | f)
+            elif kind < 0.3:
+                # MOVFF between indirect register and PCL
+                fs, fd = rand.choice([(0xFEE, 0x020), (0x020, 0xFED), (0xFEF, 0xFEE)])
+                words += [0xC000 | fs, 0xF000 | fd]
+            else:
+                words.append(rand.choice(codes) | rand.randrange(2) << 9 | a << 8 | f)
+        # DECFSZ 0x22, f; GOTO 0
+        words += [0x2E22, 0xEF00, 0xF000]
+        pics = [MCU(blocks=blocks) for blocks in (False, True)]
+        for pic in pics:
+            for i, word in enumerate(words):
+                pic.program.write_word(2 * i, word)
+            pic.data.ram[0x20:0x23] = bytearray([0x7f, 0x08, 0x10])
+            pic.run(1000)
+        assert_equal(pics[0].data.ram, pics[1].data.ram)
+        assert_equal((pics[0].pc.value, pics[0].cycles), (pics[1].pc.value, pics[1].cycles))
@@ -0,0 +1,29 @@
+from nose.tools import *
+from minipic.decoder import *
+
+def test_decode_operands():
+    assert_equal(decode_op(0x0E05), MOVLW(5))
+    assert_equal(decode_op(0x2E20), DECFSZ(0x20, 1, 0))
+    assert_equal(decode_op(0xB711), BTFSC(0x11, 3, 1))
+    assert_equal(decode_op(0xED34, 0xF012), CALL(0x1234, 1))
+    assert_equal(decode_op(0x0013), RETURN(1))
+
+def test_decode_interns_ops():
+    assert_true(decode_op(0x0E05) is decode_op(0x0E05))
+    assert_true(decode_op(0xEF02, 0xF000) is not decode_op(0xEF02, 0xF001))
+
+def test_long_ops():
+    assert_true(is_long_op(0xEF00))
+    assert_true(is_long_op(0xC123))
+    assert_true(is_long_op(0xEE10))
+    assert_false(is_long_op(0x0E05))
+
+def test_decode_many():
+    ops = decode_many([0x0E05, 0xEF02, 0xF000])
+    assert_equal(ops, [MOVLW(5), GOTO(2), NOP()])
+
+def test_access_bank_address():
+    assert_equal(decode_op(0x6E20).addr, 0x20)
+    assert_equal(decode_op(0x6E80).addr, 0xf80)
+    assert_equal(decode_op(0x6F80).addr, 0x80)
+    assert_equal(repr(decode_op(0x6E80)), 'MOVWF(0x80, 0x0)')
@@ -0,0 +1,90 @@
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.peripherals import Timer0
+
+def _mcu(words, level=TRACE_OFF):
+    pic = MCU(level)
+    for i, word in enumerate(words):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+# 0: SLEEP; 2: BTG 0x20, 0; 4: GOTO 0
+SLEEPER = [0x0003, 0x7020, 0xEF00, 0xF000]
+# 0: BTFSC INTCON, 2; 2: GOTO 0; 6: BTG 0x20, 0
+POLLER = [0xB4F2, 0xEF00, 0xF000, 0x7020]
+
+def test_sleep_waits_for_event():
+    states = []
+    for level in (TRACE_OFF, TRACE_INSTR):
+        pic = _mcu(SLEEPER, level)
+        pic.attach(Timer0(pic))
+        # on, 8-bit, prescaler 1:256
+        pic.data.write(T0CON, 0xC7)
+        assert_equal(pic.run(10 ** 7), (STOP_MAX_CYCLES, 10 ** 7))
+        assert_equal(pic.data.ram[RCON] & 0x0c, 0x08)
+        states.append((pic.cycles, pic.pc.value, pic.sleeping, pic.data.ram[0x20]))
+    assert_equal(states[0], states[1])
+    # woken 10 ** 7 // 0x10000 times
+    assert_equal(states[0][1:], (2, True, 0))
+
+def test_sleep_without_events_stops_run():
+    pic = _mcu(SLEEPER)
+    assert_equal(pic.run(), (STOP_IDLE, 1))
+    assert pic.sleeping
+    snap = pic.snapshot()
+    pic.sleeping = False
+    pic.restore(snap)
+    assert pic.sleeping
+
+def test_polling_loop_is_skipped():
+    states = []
+    for level in (TRACE_OFF, TRACE_INSTR):
+        pic = _mcu(POLLER, level)
+        pic.attach(Timer0(pic))
+        # 16-bit, prescaler 1:2
+        pic.data.write(T0CON, 0x80)
+        pic.data.ram[INTCON] = 0x04
+        pic.run(100001)
+        pic.data.ram[INTCON] = 0
+        pic.run(5)
+        states.append((pic.cycles, pic.pc.value, pic.data.read(TMR0L), pic.data.ram[0x20]))
+    assert_equal(states[0], states[1])
+    assert_equal(states[0][3], 1)
+
+def test_long_polling_takes_no_time():
+    pic = _mcu(POLLER)
+    pic.attach(Timer0(pic))
+    # 16-bit, prescaler 1:256
+    pic.data.write(T0CON, 0x87)
+    pic.data.ram[INTCON] = 0x04
+    assert_equal(pic.run(10 ** 9), (STOP_MAX_CYCLES, 10 ** 9))
+    pic.scheduler.cancel(pic.peripherals[0])
+    assert_equal(pic.run()[0], STOP_IDLE)
+
+def test_polling_volatile_register_runs():
+    # 0: BTFSC TMR0L, 7; 2: GOTO 0
+    pic = _mcu([0xBED6, 0xEF00, 0xF000])
+    pic.attach(Timer0(pic))
+    pic.data.write(T0CON, 0xC8)
+    pic.data.write(TMR0L, 0x80)
+    reason, cycles = pic.run(1000, until_pc=6)
+    assert_equal(reason, STOP_UNTIL_PC)
+    assert_equal(pic.data.read(TMR0L), cycles + 0x80 - 0x100)
+
+def test_volatile_polling_loop_is_not_watched():
+    # 0: BTFSS TMR0L, 7; 2: GOTO 0
+    pic = _mcu([0xAED6, 0xEF00, 0xF000])
+    pic.attach(Timer0(pic))
+    # 8-bit, prescaler 1:256
+    pic.data.write(T0CON, 0xC7)
+    loops = []
+    loop = pic._loop
+    def counted_loop(budget, stops):
+        loops.append(budget)
+        return loop(budget, stops)
+    pic._loop = counted_loop
+    assert_equal(pic.run(1000), (STOP_MAX_CYCLES, 1000))
+    assert_equal(pic.pc.value, 2)
+    # loop is found volatile before run loop starts, which then polls it
+    assert_equal(len(loops), 1)
+    assert_equal(pic.idle.points()[1], set())
@@ -0,0 +1,44 @@
+from nose.tools import *
+from minipic.picmicro import ProgramMemory
+from minipic.ihex import *
+
+def _record(type_rec, addr, data):
+    raw = bytearray([len(data), addr >> 8, addr & 0xff, type_rec]) + bytearray(data)
+    raw.append(-sum(raw) & 0xff)
+    return ':' + str(raw).encode('hex').upper() + '\n'
+
+def test_load_words():
+    program = ProgramMemory()
+    lines = [_record(EXT_LINEAR_ADDR, 0, [0x00, 0x01]),
+             _record(DATA, 0x0010, [0x05, 0x0E, 0x20, 0x6E, 0x7F]),
+             _record(START_LINEAR_ADDR, 0, [0x00, 0x01, 0x00, 0x10]),
+             _record(EOF, 0, [])]
+    assert_equal(load(lines, program), 0x10010)
+    assert_equal(program.read_word(0x10010), 0x0E05)
+    assert_equal(program.read_word(0x10012), 0x6E20)
+    assert_equal(program.read_word(0x10014), 0xFF7F)
+
+def test_segment_address_and_odd_offset():
+    program = ProgramMemory()
+    lines = [_record(EXT_SEGMENT_ADDR, 0, [0x10, 0x00]),
+             _record(DATA, 0x0001, [0x12, 0x34]),
+             _record(EOF, 0, [])]
+    load(lines, program)
+    assert_equal(program.read_word(0x10000), 0x12FF)
+    assert_equal(program.read_word(0x10002), 0xFF34)
+
+def test_load_invalidates_decoded_ops():
+    program = ProgramMemory()
+    program.write_word(0, 0x0E05)
+    program[0]
+    load([_record(DATA, 0, [0x06, 0x0E]), _record(EOF, 0, [])], program)
+    assert_equal(program[0].k, 6)
+
+@raises(HexError)
+def test_checksum_mismatch():
+    line = _record(DATA, 0, [0x05, 0x0E])
+    load([line[:-3] + '00\n', _record(EOF, 0, [])], ProgramMemory())
+
+@raises(HexError)
+def test_missing_eof():
+    load([_record(DATA, 0, [0x05, 0x0E])], ProgramMemory())
@@ -0,0 +1,113 @@
+from nose.tools import *
+from minipic.picmicro import *
+
+def _fsr(pic, n):
+    low, high = FSRS[n]
+    return pic.data.ram[low] | (pic.data.ram[high] << 8)
+
+def _mcu(words, level=TRACE_OFF, blocks=False):
+    pic = MCU(level, blocks=blocks)
+    for i, word in enumerate(words):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+def test_indirect_registers():
+    pic = MCU()
+    data = pic.data
+    data.write(FSR0L, 0xff)
+    data.write(FSR0H, 0x01)
+    data.write(POSTINC0, 0x11)
+    assert_equal((data.ram[0x1ff], _fsr(pic, 0)), (0x11, 0x200))
+    data.write(POSTDEC0, 0x22)
+    assert_equal((data.ram[0x200], _fsr(pic, 0)), (0x22, 0x1ff))
+    assert_equal(data.read(PREINC0), 0x22)
+    assert_equal(data.read(INDF0), 0x22)
+    assert_equal(_fsr(pic, 0), 0x200)
+    # WREG is signed offset
+    data.write(WREG, 0xff)
+    assert_equal(data.read(PLUSW0), 0x11)
+    assert_equal(_fsr(pic, 0), 0x200)
+    # 12-bit FSR wraps
+    data.write(FSR2L, 0xff)
+    data.write(FSR2H, 0x0f)
+    data.write(POSTINC2, 0x33)
+    assert_equal((data.ram[0xfff], _fsr(pic, 2)), (0x33, 0))
+
+def test_read_modify_write_moves_fsr_once():
+    # 0: LFSR 0, 0x120; 4: INCF POSTINC0, f; 6: BSF PREINC0, 7; 8: BTG POSTDEC0, 0
+    words = [0xEE01, 0xF020, 0x2AEE, 0x8EEC, 0x70ED]
+    for level in (TRACE_OFF, TRACE_WRITES):
+        for blocks in (False, True):
+            pic = _mcu(words, level, blocks and level == TRACE_OFF)
+            pic.data.ram[0x120] = 0x41
+            pic.run(5)
+            assert_equal(pic.data.ram[0x120:0x123], bytearray([0x42, 0x00, 0x81]))
+            assert_equal(_fsr(pic, 0), 0x121)
+
+def test_fsr_writes_are_traced():
+    # 0: LFSR 1, 0x80; 4: MOVWF POSTINC1
+    pic = _mcu([0xEE10, 0xF080, 0x6EE6], TRACE_WRITES)
+    pic.data.write(WREG, 0x5a)
+    pic.run(3)
+    events = list(pic.trace)
+    assert_true(('register_write', 0x80, 0x5a) in events)
+    assert_true(('register_write', FSR1L, 0x81) in events)
+
+# 0: LFSR 0, 0x100; 4: LFSR 1, 0x200; 8: MOVLW 16; 10: MOVWF 0x20
+# 12: MOVFF POSTINC0, POSTINC1; 16: DECFSZ 0x20, f; 18: BRA 12; 20: BRA 20
+COPY = [0xEE01, 0xF000, 0xEE12, 0xF000, 0x0E10, 0x6E20,
+        0xCFEE, 0xFFE6, 0x2E20, 0xD7FC, 0xD7FF]
+
+def test_copy_loop():
+    for blocks in (False, True):
+        pic = _mcu(COPY, blocks=blocks)
+        pic.data.ram[0x100:0x110] = bytearray(range(1, 17))
+        assert_equal(pic.run(until_pc=20), (STOP_UNTIL_PC, 6 + 16 * 5 - 1))
+        assert_equal(pic.data.ram[0x200:0x211], bytearray(range(1, 17) + [0]))
+        assert_equal((_fsr(pic, 0), _fsr(pic, 1)), (0x110, 0x210))
+
+def test_indirect_blocks_match_interpreter():
+    import random
+    rand = random.Random(23)
+    # MOVF, ADDWF, INCF, CLRF, MOVWF, BTG on virtual registers of FSR0, FSR2
+    codes = [0x5000, 0x2400, 0x2800, 0x6A00, 0x6E00, 0x7000]
+    regs = [0xEF, 0xEE, 0xED, 0xEC, 0xEB, 0xDF, 0xDE, 0xDD, 0xDC, 0xDB]
+    for _ in xrange(20):
+        # LFSR 0, 0x100; LFSR 2, 0x180
+        words = [0xEE01, 0xF000, 0xEE21, 0xF080]
+        for _ in xrange(12):
+            code = rand.choice(codes)
+            if code in (0x5000, 0x2400, 0x2800):
+                code |= rand.randrange(2) << 9
+            words.append(code | rand.choice(regs))
+        # DECFSZ 0x22, f; BRA 8
+        words += [0x2E22, 0xD7FF - len(words) + 4]
+        cells = bytearray(rand.randrange(0x100) for _ in xrange(0x180))
+        pics = [_mcu(words, blocks=blocks) for blocks in (False, True)]
+        for pic in pics:
+            pic.data.ram[0x80:0x200] = cells
+            pic.data.ram[0x22] = 0x10
+            pic.data.write(WREG, 0xfe)
+            pic.run(2000)
+        assert_equal(pics[0].data.ram, pics[1].data.ram)
+        assert_equal((pics[0].pc.value, pics[0].cycles), (pics[1].pc.value, pics[1].cycles))
+
+def test_pointer_to_virtual_register():
+    # FSR0 points at virtual registers: reads give 0, writes are dropped
+    for indf, start, end in [(INDF0, 0xFEF, 0xFEF), (POSTINC0, 0xFDB, 0xFDE),
+                             (POSTDEC0, 0xFDF, 0xFDC), (PREINC0, 0xFDA, 0xFDD),
+                             (PLUSW0, 0xFDD, 0xFDD)]:
+        f = indf & 0xff
+        # 0: LFSR 0, start; 4: MOVF indf, w; 6: MOVWF indf; 8: INCF indf, f; 10: BRA 10
+        words = [0xEE00 | (start >> 8), 0xF000 | (start & 0xff), 0x5000 | f, 0x6E00 | f,
+                 0x2A00 | f, 0xD7FF]
+        for level, blocks in ((TRACE_OFF, False), (TRACE_FULL, False), (TRACE_OFF, True)):
+            pic = _mcu(words, level, blocks)
+            pic.data.write(WREG, 0)
+            pic.data.write(STATUS, N)
+            assert_equal(pic.run(until_pc=10), (STOP_UNTIL_PC, 5))
+            assert_equal(_fsr(pic, 0), end)
+            assert_equal(pic.data.ram[WREG], 0)
+            # flags of INCF of value 0
+            assert_equal(pic.data.ram[STATUS], 0)
+            assert_equal(pic.data.ram[0xfd9:0xfe0], bytearray(7))
@@ -0,0 +1,204 @@
+from nose.tools import *
+from minipic.picmicro import *
+
+def _flags(a, b, c):
+    """ Reference flags of a + b + c computed bit by bit """
+    result = a + b + c
+    flags = C if result > 0xff else 0
+    if (a & 0xf) + (b & 0xf) + c > 0xf:
+        flags |= DC
+    if result & 0xff == 0:
+        flags |= Z
+    if result & 0x80:
+        flags |= N
+    signed = lambda x: x - 0x100 if x & 0x80 else x
+    if not -0x80 <= signed(a) + signed(b) + c <= 0x7f:
+        flags |= OV
+    return flags
+
+def test_add_flags_table():
+    for c in (0, 1):
+        for a in xrange(0, 0x100, 3):
+            for b in xrange(0x100):
+                assert_equal(ADD_FLAGS[(c << 16) | (a << 8) | b], _flags(a, b, c))
+
+def test_status_register():
+    for level in (TRACE_OFF, TRACE_WRITES):
+        pic = MCU(level)
+        status = pic.data[STATUS]
+        status.put(0xff)
+        assert_equal(status.get(), 0x1f)
+        status.put_Z(0)
+        status[7] = 1
+        assert_equal(status.get(), 0x1b)
+        status.update(N | OV | C, OV)
+        assert_equal(status.get(), 0x0a)
+    assert_equal(list(pic.trace)[-1], ('register_write', STATUS, 0x0a))
+
+def _run(words, wreg=0, status=0, f=0):
+    pic = MCU()
+    for i, word in enumerate(words):
+        pic.program.write_word(2 * i, word)
+    pic.data.write(WREG, wreg)
+    pic.data.write(STATUS, status)
+    pic.data.ram[0x20] = f
+    pic.run(len(words))
+    return pic.data.ram[WREG], pic.data.ram[STATUS], pic.data.ram[0x20]
+
+def test_arithmetic_ops():
+    # ADDLW 1
+    assert_equal(_run([0x0F01], 0x7f), (0x80, N | OV | DC, 0))
+    # ADDWF 0x20, f
+    assert_equal(_run([0x2620], 0x80, 0, 0x80), (0x80, OV | Z | C, 0))
+    # ADDWFC 0x20, w
+    assert_equal(_run([0x2020], 0x0f, C, 0xf0), (0x00, Z | DC | C, 0xf0))
+    # SUBWF 0x20, f: f - w
+    assert_equal(_run([0x5E20], 0x01, 0, 0x00), (0x01, N, 0xff))
+    # SUBWFB 0x20, w: f - w - borrow
+    assert_equal(_run([0x5820], 0x01, 0, 0x03), (0x01, DC | C, 0x03))
+    # SUBFWB 0x20, w: w - f - borrow
+    assert_equal(_run([0x5420], 0x80, C, 0x01), (0x7f, OV | C, 0x01))
+    # SUBLW 5: 5 - w
+    assert_equal(_run([0x0805], 0x05), (0x00, Z | DC | C, 0))
+
+def test_logic_ops():
+    # ANDLW 0x0f keeps carry
+    assert_equal(_run([0x0B0F], 0xf0, C | OV), (0x00, Z | OV | C, 0))
+    # IORWF 0x20, w
+    assert_equal(_run([0x1020], 0x80, Z, 0x01), (0x81, N, 0x01))
+    # XORWF 0x20, f
+    assert_equal(_run([0x1A20], 0x55, 0, 0x55), (0x55, Z, 0x00))
+
+def test_result_written_to_status():
+    # ANDWF STATUS, f: affected flags override written result
+    assert_equal(_run([0x16D8], 0x13, OV | Z | DC | C), (0x13, 0x03, 0))
+
+def test_byte_ops():
+    # RLCF 0x20, f
+    assert_equal(_run([0x3620], 0, C, 0x80), (0x00, C, 0x01))
+    # RRNCF 0x20, w
+    assert_equal(_run([0x4020], 0, C, 0x01), (0x80, N | C, 0x01))
+    # SWAPF 0x20, w
+    assert_equal(_run([0x3820], 0, Z, 0x12), (0x21, Z, 0x12))
+    # NEGF 0x20
+    assert_equal(_run([0x6C20], 0, 0, 0x01), (0x00, N, 0xff))
+    # DECF 0x20, f
+    assert_equal(_run([0x0620], 0, 0, 0x00), (0x00, N, 0xff))
+    # INCF 0x20, f
+    assert_equal(_run([0x2A20], 0, 0, 0xff), (0x00, Z | DC | C, 0x00))
+    # COMF 0x20, f
+    assert_equal(_run([0x1E20], 0, 0, 0x0f), (0x00, N, 0xf0))
+    # MOVF 0x20, w
+    assert_equal(_run([0x5020], 0x55, C, 0x00), (0x00, Z | C, 0x00))
+    # CLRF 0x20 affects only Z
+    assert_equal(_run([0x6A20], 0, N, 0x05), (0x00, N | Z, 0x00))
+    # BSF 0x20, 7; BCF 0x20, 0
+    assert_equal(_run([0x8E20, 0x9020], 0, 0, 0x01), (0x00, 0, 0x80))
+
+def _step(words, wreg=0, status=0, f=0):
+    pic = MCU()
+    for i, word in enumerate(words):
+        pic.program.write_word(2 * i, word)
+    pic.data.write(WREG, wreg)
+    pic.data.write(STATUS, status)
+    pic.data.ram[0x20] = f
+    pic.step()
+    return pic
+
+def test_branches():
+    # BZ +1
+    assert_equal(_step([0xE001], status=Z).pc.value, 4)
+    assert_equal(_step([0xE001]).cycles, 1)
+    # BNC -1
+    pic = _step([0xE3FF])
+    assert_equal((pic.pc.value, pic.cycles), (0, 2))
+    # BRA +0x3ff
+    assert_equal(_step([0xD3FF]).pc.value, 0x800)
+
+def test_skips():
+    # CPFSEQ 0x20
+    pic = _step([0x6220], 0x10, 0, 0x10)
+    assert_equal((pic.pc.value, pic.cycles), (4, 2))
+    # CPFSGT 0x20
+    assert_equal(_step([0x6420], 0x10, 0, 0x10).pc.value, 2)
+    # CPFSLT 0x20
+    assert_equal(_step([0x6020], 0x10, 0, 0x0f).pc.value, 4)
+    # TSTFSZ 0x20 over MOVFF, its second word is executed as NOP
+    pic = _step([0x6620, 0xC020, 0xF021])
+    assert_equal((pic.pc.value, pic.cycles), (4, 2))
+    pic.step()
+    assert_equal((pic.pc.value, pic.cycles), (6, 3))
+    # INFSNZ 0x20, f
+    pic = _step([0x4A20], f=0xff)
+    assert_equal((pic.pc.value, pic.data.ram[0x20]), (2, 0))
+    # DCFSNZ 0x20, w
+    pic = _step([0x4C20], f=0x03)
+    assert_equal((pic.pc.value, pic.data.ram[WREG]), (4, 2))
+
+def test_relative_call():
+    # 0: RCALL +2; 2: NOP; 6: RETLW 0x42
+    pic = MCU()
+    for i, word in enumerate([0xD802, 0x0000, 0x0000, 0x0C42]):
+        pic.program.write_word(2 * i, word)
+    assert_equal(pic.run(4, until_pc=2), (STOP_UNTIL_PC, 4))
+    assert_equal(pic.data.ram[WREG], 0x42)
+
+def test_data_ops():
+    # MOVFF 0x020, 0x123
+    pic = _step([0xC020, 0xF123], f=0x5a)
+    assert_equal((pic.pc.value, pic.cycles, pic.data.ram[0x123]), (4, 2, 0x5a))
+    # MULWF 0x20
+    pic = _step([0x0220], 0xf0, Z, 0x11)
+    assert_equal((pic.data.ram[PRODH], pic.data.ram[PRODL], pic.data.ram[STATUS]), (0x0f, 0xf0, Z))
+    # LFSR 1, 0x123
+    pic = _step([0xEE11, 0xF023])
+    assert_equal((pic.data.ram[FSR1H], pic.data.ram[FSR1L]), (0x01, 0x23))
+    # MOVLB 5
+    assert_equal(_step([0x0105]).data.ram[BSR], 5)
+
+def test_decimal_adjust():
+    # DAW
+    assert_equal(_run([0x0007], 0x0f), (0x15, 0, 0))
+    assert_equal(_run([0x0007], 0x9a), (0x00, C, 0))
+    assert_equal(_run([0x0007], 0x22, DC | C), (0x88, DC | C, 0))
+
+def test_computed_jump():
+    # 0: MOVLW 4; 2: ADDWF PCL, f; 4: BTG 0x20, 0; 8: BTG 0x21, 0; 10: MOVWF PCL
+    words = [0x0E04, 0x26F9, 0x7020, 0x0000, 0x7021, 0x6EF9]
+    for blocks in (False, True):
+        pic = MCU(blocks=blocks)
+        for i, word in enumerate(words):
+            pic.program.write_word(2 * i, word)
+        # read of PCL latches PCLATH
+        pic.data.ram[PCLATH] = 0x01
+        assert_equal(pic.run(3), (STOP_MAX_CYCLES, 3))
+        assert_equal(pic.pc.value, 10)
+        assert_equal(pic.data.ram[0x20:0x22], bytearray([0, 1]))
+        pic.data.ram[PCLATH] = 0x01
+        pic.run(1)
+        assert_equal(pic.pc.value, 0x104)
+
+def test_reset():
+    from minipic.peripherals import Timer0, InterruptController
+    # 0: NOP; 2: RESET
+    pic = MCU()
+    for i, word in enumerate([0x0000, 0x00FF]):
+        pic.program.write_word(2 * i, word)
+    timer = pic.attach(Timer0(pic))
+    controller = pic.attach(InterruptController(pic))
+    data = pic.data
+    # timer on and its interrupt enabled but not yet requested
+    data.write(T0CON, 0xC0)
+    data.write(INTCON, 0xA0)
+    data.write(BSR, 3)
+    data.write(WREG, 0x42)
+    data.write(STKPTR, 0x85)
+    pic.pc.value = 2
+    pic.step()
+    assert_equal(pic.pc.value, 0)
+    assert_equal([data.ram[addr] for addr in (T0CON, INTCON, INTCON2, BSR, STKPTR, WREG)],
+                 [0xff, 0, 0xf5, 0, 0x80, 0x42])
+    assert_equal(data.bank, 0)
+    # timer is stopped, nothing is scheduled
+    assert_equal(pic.scheduler.time_of(timer), None)
+    assert_equal(pic.scheduler.time_of(controller), None)
@@ -0,0 +1,172 @@
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.peripherals import *
+from minipic.scheduler import Scheduler, NEVER
+
+class _Source:
+    def __init__(self, log):
+        self.log = log
+    def fire(self, time):
+        self.log.append((self, time))
+
+def test_scheduler_fires_events_in_order():
+    scheduler = Scheduler()
+    log = []
+    a, b, c = _Source(log), _Source(log), _Source(log)
+    scheduler.schedule(a, 30)
+    scheduler.schedule(b, 10)
+    scheduler.schedule(c, 20)
+    scheduler.schedule(a, 15)
+    scheduler.cancel(c)
+    assert_equal(scheduler.next_time, 10)
+    assert_equal(scheduler.run_due(15), NEVER)
+    assert_equal(log, [(b, 10), (a, 15)])
+
+def _idle_mcu(level=TRACE_OFF):
+    # 0: GOTO 0
+    pic = MCU(level)
+    pic.program.write_word(0, 0xEF00)
+    pic.program.write_word(2, 0xF000)
+    return pic
+
+def test_timer0_counts_lazily():
+    for level in (TRACE_OFF, TRACE_FULL):
+        pic = _idle_mcu(level)
+        pic.attach(Timer0(pic))
+        # on, 8-bit, internal clock, prescaler 1:8
+        pic.data.write(T0CON, 0xC2)
+        pic.run(1000)
+        assert_equal(pic.data.read(TMR0L), 1000 // 8)
+        assert_equal(pic.data.ram[INTCON], 0)
+        pic.run(1048)
+        assert_equal(pic.data.ram[INTCON], 0x04)
+        assert_equal(pic.data.read(TMR0L), 0)
+
+def test_timer0_16bit_buffered_access():
+    pic = _idle_mcu()
+    timer = pic.attach(Timer0(pic))
+    pic.data.write(TMR0H, 0xff)
+    pic.data.write(T0CON, 0x88)
+    pic.data.write(TMR0L, 0xf0)
+    assert_equal(timer.value(), 0xfff0)
+    assert_equal(pic.scheduler.next_time, 0x10)
+    pic.run(0x10)
+    assert_equal(pic.data.ram[INTCON], 0x04)
+    pic.run(0x310)
+    # high byte is buffer written before or latched by read of low byte
+    assert_equal(pic.data.read(TMR0H), 0xff)
+    assert_equal(pic.data.read(TMR0L), 0x10)
+    assert_equal(pic.data.read(TMR0H), 0x03)
+
+def test_timer1_and_snapshot():
+    pic = _idle_mcu()
+    pic.attach(Timer1(pic))
+    # on, prescaler 1:2, 8-bit reads and writes
+    pic.data.write(T1CON, 0x11)
+    pic.data.write(TMR1H, 0xff)
+    snap = pic.snapshot()
+    pic.run(512)
+    assert_equal(pic.data.ram[PIR1] & 1, 1)
+    pic.restore(snap)
+    assert_equal(pic.data.ram[PIR1] & 1, 0)
+    assert_equal(pic.data.read(TMR1H), 0xff)
+    pic.run(510)
+    assert_equal(pic.data.ram[PIR1] & 1, 0)
+    pic.run(2)
+    assert_equal(pic.data.ram[PIR1] & 1, 1)
+
+def test_stopped_timer_has_no_events():
+    pic = _idle_mcu()
+    pic.attach(Timer0(pic))
+    pic.data.write(T0CON, 0xC8)
+    pic.data.write(T0CON, 0x48)
+    pic.run(1000)
+    assert_equal(pic.scheduler.next_time, NEVER)
+    assert_equal(pic.data.ram[INTCON], 0)
+
+def _load(pic, code):
+    for addr, words in code.items():
+        for i, word in enumerate(words):
+            pic.program.write_word(addr + 2 * i, word)
+    return pic
+
+# 0: GOTO 0x20
+# 8: INCF 0x20, f; MOVLW 0x55; BCF INTCON, TMR0IF; RETFIE FAST
+# 0x20: MOVLW 0xA0; MOVWF INTCON; BRA 0x24
+COUNTER = {0: [0xEF10, 0xF000], 8: [0x2A20, 0x0E55, 0x94F2, 0x0011],
+           0x20: [0x0EA0, 0x6EF2, 0xD7FF]}
+
+def test_timer0_interrupts():
+    states = []
+    for level in (TRACE_OFF, TRACE_INSTR):
+        pic = _load(MCU(level), COUNTER)
+        pic.attach(Timer0(pic))
+        pic.attach(InterruptController(pic))
+        # on, 8-bit, prescaler 1:2
+        pic.data.write(T0CON, 0xC0)
+        pic.run(10 * 512 + 20)
+        assert_equal(pic.data.ram[0x20], 10)
+        # WREG is restored by RETFIE FAST
+        assert_equal(pic.data.ram[WREG], 0xA0)
+        assert_equal(pic.data.ram[STKPTR], 0)
+        states.append((pic.cycles, pic.pc.value, pic.data.ram[INTCON]))
+    assert_equal(states[0], states[1])
+
+# 0: GOTO 0; 8: BCF PIR1, TMR1IF; RETFIE; 0x18: BCF INTCON, TMR0IF; RETFIE
+PRIORITIES = {0: [0xEF00, 0xF000], 8: [0x909E, 0x0010], 0x18: [0x94F2, 0x0010]}
+
+def test_interrupt_priorities():
+    pic = _load(MCU(), PRIORITIES)
+    pic.attach(InterruptController(pic))
+    data = pic.data
+    data.write(RCON, 0x80)
+    # TMR0 of low priority: GIEH, GIEL, TMR0IE, TMR0IF
+    data.write(INTCON2, 0xf1)
+    data.write(INTCON, 0xE4)
+    states = []
+    pic.step()
+    states.append((pic.pc.value, data.ram[INTCON]))
+    # high priority TMR1 interrupts low priority handler
+    data.write(PIE1, 0x01)
+    data.write(PIR1, 0x01)
+    for _ in xrange(4):
+        pic.step()
+        states.append((pic.pc.value, data.ram[INTCON]))
+    assert_equal(states, [(0x18, 0xA4), (0x08, 0x20), (0x0a, 0x20), (0x1a, 0xA0), (0, 0xE0)])
+    assert_equal(pic.cycles, 2 + 2 + 1 + 2 + 1 + 2 + 2)
+
+def test_sleep_is_woken_by_enabled_interrupt():
+    pic = _load(MCU(), {0: [0x0003, 0x7020, 0xEF00, 0xF000]})
+    pic.attach(Timer0(pic))
+    pic.attach(InterruptController(pic))
+    pic.data.write(T0CON, 0xC0)
+    assert_equal(pic.run(10000), (STOP_MAX_CYCLES, 10000))
+    assert_true(pic.sleeping)
+    assert_equal(pic.data.ram[0x20], 0)
+    # TMR0IE without GIE wakes MCU, which goes on after SLEEP
+    pic.data.write(INTCON, 0x20)
+    assert_equal(pic.run(600, until_pc=4), (STOP_UNTIL_PC, 10240 - 10000 + 1))
+    assert_equal(pic.data.ram[0x20], 1)
+    assert_equal(pic.data.ram[STKPTR], 0)
+
+# 0: SLEEP; 2: BTFSS 0x20, 0; 4: BRA 2; 8: BSF 0x20, 0; BCF INTCON, TMR0IF; RETFIE
+WAITER = {0: [0x0003, 0xA020, 0xD7FE], 8: [0x8020, 0x94F2, 0x0010]}
+
+def test_run_counts_cycles_of_interrupts():
+    pic = _load(MCU(), WAITER)
+    pic.attach(Timer0(pic))
+    pic.attach(InterruptController(pic))
+    # 8-bit, no prescaler, the next cycle overflows
+    pic.data.write(T0CON, 0xC8)
+    pic.data.write(TMR0L, 0xff)
+    pic.data.write(INTCON, 0xA0)
+    # SLEEP is woken by interrupt at once and vectoring takes 2 cycles
+    assert_equal(pic.run(1), (STOP_MAX_CYCLES, 3))
+    assert_equal((pic.cycles, pic.pc.value), (3, 8))
+    pic.run(until_pc=2)
+    pic.data.ram[0x20] = 0
+    # polling loop is skipped up to the next overflow, then interrupted
+    assert_equal(pic.cycles, 7)
+    # 84 iterations of 3 cycles reach overflow at 257, vectoring takes 2
+    assert_equal(pic.run(until_pc=8), (STOP_UNTIL_PC, 84 * 3 + 2))
+    assert_equal(pic.cycles, 7 + 84 * 3 + 2)
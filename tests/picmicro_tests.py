@@ -0,0 +1,210 @@
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.op import *
+
+def test_data_memory_plain_cells():
+    pic = MCU()
+    pic.data.write(0x20, 0x5a)
+    assert_equal(pic.data.ram[0x20], 0x5a)
+    assert_equal(pic.data.read(0x20), 0x5a)
+    assert_equal(pic.data[0x20].value, 0x5a)
+    assert_true(pic.data[0x20] is pic.data[0x20])
+
+def test_data_memory_sfr_hooks():
+    pic = MCU()
+    assert_true(pic.data.hooks[0x20] is None)
+    pic.data[WREG].put(7)
+    assert_equal(pic.data.ram[WREG], 7)
+    assert_equal(pic.data.read(WREG), 7)
+
+def test_decfsz_loop():
+    pic = MCU()
+    pic.data.write(0x10, 2)
+    op = DECFSZ(0x10, 1, 0)
+    op.execute(pic)
+    assert_equal((pic.data.ram[0x10], pic.pc.value), (1, 2))
+    pic.pc.value = 0
+    op.execute(pic)
+    assert_equal((pic.data.ram[0x10], pic.pc.value), (0, 4))
+
+def test_btfsc_btg():
+    pic = MCU()
+    BTFSC(0x11, 3, 0).execute(pic)
+    assert_equal(pic.pc.value, 4)
+    pic.pc.value = 0
+    BTG(0x11, 3, 0).execute(pic)
+    assert_equal(pic.data.ram[0x11], 0x08)
+    BTFSC(0x11, 3, 0).execute(pic)
+    assert_equal(pic.pc.value, 4)
+
+def test_program_memory_lazy_decode():
+    pic = MCU()
+    assert_true(pic.program.image is ProgramMemory.ERASED)
+    pic.program.write_word(0, 0x0E05)
+    pic.program.write_word(2, 0x0E05)
+    assert_false(pic.program.image is ProgramMemory.ERASED)
+    assert_equal(ProgramMemory.ERASED[0:2], bytearray([0xff, 0xff]))
+    op = pic.program[0]
+    assert_equal(op, MOVLW(5))
+    assert_true(op is pic.program[2])
+    other = MCU()
+    other.program.write_word(0, 0x0E05)
+    assert_true(other.program[0] is op)
+
+def test_program_memory_write_invalidates_long_op():
+    pic = MCU()
+    pic.program.write_word(0, 0xEF02)
+    pic.program.write_word(2, 0xF000)
+    assert_equal(pic.program[0], GOTO(2))
+    pic.program.write_word(2, 0xF001)
+    assert_equal(pic.program[0], GOTO(0x102))
+
+@raises(AttributeError)
+def test_ops_are_immutable():
+    MOVLW(5).k = 6
+
+def _events(pic):
+    return list(pic.trace)
+
+def _run_decfsz(level):
+    pic = MCU(level)
+    pic.program.write_word(0, 0x2E20)
+    pic.data.ram[0x20] = 2
+    pic.step()
+    return _events(pic)
+
+def test_trace_levels():
+    assert_equal(_run_decfsz(TRACE_OFF), [])
+    assert_equal(_run_decfsz(TRACE_INSTR), [('opcode_fetch', 0, 0x2E20)])
+    assert_equal(_run_decfsz(TRACE_WRITES)[1:], [('register_write', 0x20, 1)])
+    assert_equal(_run_decfsz(TRACE_FULL)[1:],
+                 [('register_read', 0x20, 2), ('register_write', 0x20, 1)])
+
+def test_trace_logs_stored_values():
+    # MOVLW 0xff; MOVWF STATUS; MOVWF BSR; BSF BSR, 7 (unimplemented bit)
+    pic = MCU(TRACE_WRITES)
+    for i, word in enumerate([0x0Eff, 0x6ED8, 0x6EE0, 0x8EE0]):
+        pic.program.write_word(2 * i, word)
+    pic.run(4)
+    writes = [event for event in _events(pic) if event[0] != 'opcode_fetch']
+    assert_equal(writes, [('register_write', WREG, 0xff), ('register_write', STATUS, 0x1f),
+                          ('register_write', BSR, 0x0f), ('register_write', BSR, 0x0f)])
+    pic.data[STATUS][7] = 1
+    assert_equal(_events(pic)[-1], ('register_write_bit', STATUS, 7, 0))
+
+def test_trace_ring_keeps_newest_events():
+    trace = TraceBuf(4)
+    for value in xrange(6):
+        trace.add_event(('register_write', 0x20, value))
+    assert_equal([event[2] for event in trace.cursor(oldest=True)], [2, 3, 4, 5])
+    assert_equal(list(trace.records(4, 6)[2]), [4, 5])
+
+def test_trace_cursors_are_independent():
+    trace = TraceBuf(4)
+    slow, fast = trace.cursor(), trace.cursor()
+    trace.add_event(('stack_push', 0x100))
+    trace.add_event(('register_write_bit', 0x20, 3, 1))
+    assert_equal(list(fast), [('stack_push', 0x100), ('register_write_bit', 0x20, 3, 1)])
+    for _ in xrange(4):
+        trace.add(STACK_IS_FULL)
+    assert_equal(len(list(fast)), 4)
+    assert_equal(len(list(slow)), 4)
+    assert_equal((fast.lost, slow.lost), (0, 2))
+
+def test_trace_stamps_cycles_and_exports_to_file():
+    from StringIO import StringIO
+    pic = _loop_mcu(TRACE_INSTR)
+    pic.run(max_cycles=3)
+    f = StringIO()
+    pic.trace.tofile(f)
+    f.seek(0)
+    first, (codes, addrs, values, bits, cycles) = fromfile(f)
+    assert_equal(first, 0)
+    assert_equal(list(addrs), [0, 2, 4])
+    assert_equal(list(values), [0x0E03, 0x6E20, 0x2E20])
+    assert_equal(list(cycles), [0, 1, 2])
+
+def test_two_cycle_op_may_exceed_budget():
+    pic = _loop_mcu()
+    pic.pc.value = 6
+    assert_equal(pic.run(1), (STOP_MAX_CYCLES, 2))
+    assert_equal(pic.cycles, 2)
+
+def test_time_of_cycles():
+    pic = MCU(frequency=8000000)
+    pic.run(10)
+    assert_equal(pic.time, 5e-6)
+
+def test_untraced_memory_has_plain_registers():
+    pic = MCU(TRACE_OFF)
+    assert_true(type(pic.data.hooks[WREG]) is ByteRegister)
+    assert_true(pic.stack.__class__ is Stack)
+
+def _loop_mcu(level=TRACE_OFF):
+    # 0: MOVLW 3; 2: MOVWF 0x20; 4: DECFSZ 0x20,f; 6: GOTO 4; 10: GOTO 10
+    pic = MCU(level)
+    for i, word in enumerate([0x0E03, 0x6E20, 0x2E20, 0xEF02, 0xF000, 0xEF05, 0xF000]):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+def test_run_until_pc():
+    pic = _loop_mcu()
+    # taken skip and NOP in second word of skipped GOTO take 3 cycles
+    assert_equal(pic.run(until_pc=10), (STOP_UNTIL_PC, 11))
+    assert_equal(pic.data.ram[0x20], 0)
+    assert_equal(pic.cycles, 11)
+
+def test_run_breakpoints_and_budget():
+    for level in (TRACE_OFF, TRACE_FULL):
+        pic = _loop_mcu(level)
+        assert_equal(pic.run(breakpoints=set([4])), (STOP_BREAKPOINT, 2))
+        assert_equal(pic.run(breakpoints=set([4])), (STOP_BREAKPOINT, 3))
+        assert_equal(pic.run(6), (STOP_MAX_CYCLES, 6))
+        assert_equal(pic.pc.value, 10)
+
+def test_snapshot_restore():
+    pic = _loop_mcu()
+    pic.run(2)
+    snap = pic.snapshot()
+    pic.run(until_pc=10)
+    CALL(5, 0).execute(pic)
+    pic.program.write_word(0, 0x0E07)
+    pic.restore(snap)
+    assert_equal((pic.pc.value, pic.cycles, pic.data.ram[0x20]), (4, 2, 3))
+    assert_equal(pic.data.ram[STKPTR], 0)
+    assert_equal(pic.program[0], MOVLW(3))
+    assert_equal(pic.run(until_pc=10), (STOP_UNTIL_PC, 9))
+
+def test_snapshot_copy_on_write_pages():
+    pic = _loop_mcu()
+    first = pic.snapshot()
+    pic.program.write_word(0x1000, 0x0E01)
+    second = pic.snapshot()
+    assert_equal(first.program.pages.keys(), [0x1000 >> 1 >> 8])
+    assert_equal(second.program.pages, {})
+    pic.restore(first)
+    assert_equal(pic.program.read_word(0x1000), 0xffff)
+    pic.restore(second)
+    assert_equal(pic.program.read_word(0x1000), 0x0E01)
+
+@raises(ValueError)
+def test_restore_foreign_snapshot():
+    MCU().restore(MCU().snapshot())
+
+def test_banked_operands():
+    # 0: MOVLB 2; 2: MOVWF 0x10, BANKED; 4: MOVWF 0xE8 (WREG); 6: BTG 0x10, 0, BANKED
+    for level in (TRACE_OFF, TRACE_FULL):
+        pic = MCU(level)
+        for i, word in enumerate([0x0102, 0x6F10, 0x6EE8, 0x7110]):
+            pic.program.write_word(2 * i, word)
+        assert_equal(pic.program[2].addr, 0x10)
+        assert_equal(pic.program[4].addr, WREG)
+        pic.data.write(WREG, 0x5a)
+        snap = pic.snapshot()
+        pic.run(4)
+        assert_equal(pic.data.ram[0x210], 0x5b)
+        assert_equal(pic.data.bank, 0x200)
+        pic.restore(snap)
+        assert_equal(pic.data.bank, 0)
+    # banked operands are resolved without reading BSR
+    assert_false(any(event[:2] == ('register_read', BSR) for event in _events(pic)))
@@ -0,0 +1,92 @@
+from StringIO import StringIO
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.profiler import *
+
+def _nested_calls(level=TRACE_OFF):
+    # 0: CALL 8; 4: GOTO 4; 8: CALL 0x10; 12: RETURN; 14: NOP; 16: NOP; 18: RETURN
+    pic = MCU(level)
+    words = [0xEC04, 0xF000, 0xEF02, 0xF000, 0xEC08, 0xF000, 0x0012, 0x0000, 0x0000,
+             0x0012]
+    for i, word in enumerate(words):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+def test_flat_profile():
+    pic = _nested_calls()
+    profiler = Profiler(pic)
+    assert_equal(pic.run(max_cycles=13), (STOP_MAX_CYCLES, 13))
+    assert_equal([(addr, count, cycles) for addr, _, count, cycles in profiler.flat()],
+                 [(4, 2, 4), (0, 1, 2), (8, 1, 2), (12, 1, 2), (18, 1, 2), (16, 1, 1)])
+    assert_equal(profiler.by_op(), {'CALL': [2, 4], 'GOTO': [2, 4], 'NOP': [1, 1],
+                                    'RETURN': [2, 4]})
+    assert_equal(pic.cycles, 13)
+
+def _check_call_graph(level):
+    pic = _nested_calls(level)
+    profiler = Profiler(pic)
+    pic.run(until_pc=4)
+    assert_equal(profiler.call_graph(), {(None, 8): [1, 9], (8, 0x10): [1, 5]})
+    assert_equal(profiler.functions(), [(8, 1, 9), (0x10, 1, 5)])
+
+def test_call_graph():
+    _check_call_graph(TRACE_OFF)
+
+def test_call_graph_of_traced_mcu():
+    _check_call_graph(TRACE_WRITES)
+
+def test_steps_are_profiled():
+    pic = _nested_calls()
+    profiler = Profiler(pic)
+    for _ in xrange(5):
+        pic.step()
+    assert_equal(pic.cycles, 9)
+    assert_equal(profiler.functions(), [(8, 1, 9), (0x10, 1, 5)])
+
+def test_stop_detaches_profiler():
+    pic = _nested_calls()
+    profiler = Profiler(pic)
+    profiler.stop()
+    pic.step()
+    pic.run(until_pc=4)
+    assert_equal(profiler.flat(), [])
+    assert_equal(profiler.call_graph(), {})
+
+def test_report():
+    pic = _nested_calls()
+    profiler = Profiler(pic)
+    pic.run(until_pc=4)
+    out = StringIO()
+    profiler.report(out)
+    assert_true('CALL' in out.getvalue())
+
+def test_profiled_mcu_serves_peripherals():
+    from minipic.peripherals import Timer0
+    from minipic.register import T0CON, INTCON
+    pic = _nested_calls()
+    pic.attach(Timer0(pic))
+    profiler = Profiler(pic)
+    pic.data.write(T0CON, 0xC8)
+    pic.run(300)
+    assert_equal(pic.data.ram[INTCON], 0x04)
+
+def test_interrupts_are_called_by_interrupt():
+    from minipic.peripherals import Timer0, InterruptController
+    from minipic.register import T0CON
+    pic = MCU()
+    # 0: GOTO 0x20; 8: INCF 0x20; MOVLW 0x55; BCF INTCON, TMR0IF; RETFIE FAST
+    # 0x20: MOVLW 0xA0; MOVWF INTCON; BRA 0x24
+    program = {0: [0xEF10, 0xF000], 8: [0x2A20, 0x0E55, 0x94F2, 0x0011],
+               0x20: [0x0EA0, 0x6EF2, 0xD7FF]}
+    for addr, words in program.items():
+        for i, word in enumerate(words):
+            pic.program.write_word(addr + 2 * i, word)
+    pic.attach(Timer0(pic))
+    pic.attach(InterruptController(pic))
+    profiler = Profiler(pic)
+    pic.data.write(T0CON, 0xC0)
+    pic.run(10 * 512 + 20)
+    assert_equal(pic.data.ram[0x20], 10)
+    # vectoring, INCF, MOVLW, BCF and RETFIE
+    assert_equal(profiler.call_graph(), {(INTERRUPT, 8): [10, 10 * 7]})
+    assert_equal(profiler.functions(), [(8, 10, 10 * 7)])
@@ -0,0 +1,36 @@
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.op import MOVLW
+from minipic.register import ByteRegister, WriteTracing
+from minipic.stats import *
+
+def test_categories_of_code():
+    profiler = SelfProfiler()
+    assert_equal(profiler.category(ProgramMemory.__getitem__.func_code), FETCH)
+    assert_equal(profiler.category(MOVLW.execute.func_code), EXECUTE)
+    assert_equal(profiler.category(DataMemory.read.func_code), DATA)
+    assert_equal(profiler.category(ByteRegister.put.func_code), DATA)
+    assert_equal(profiler.category(WriteTracing.put.func_code), TRACE)
+    assert_equal(profiler.category(MCU.run.func_code), LOOP)
+    assert_equal(profiler.category(test_categories_of_code.func_code), None)
+
+def test_run_is_sampled():
+    pic = MCU(TRACE_FULL)
+    # 0: BTG 0x20,0; 2: GOTO 0
+    for i, word in enumerate([0x7020, 0xEF00, 0xF000]):
+        pic.program.write_word(2 * i, word)
+    with SelfProfiler() as profiler:
+        while profiler.samples[TRACE] == 0 and pic.cycles < 10000000:
+            pic.run(max_cycles=10000)
+    assert_false(profiler.running)
+    assert_true(profiler.samples[TRACE] > 0)
+    assert_equal(sum(n for _, n, _ in profiler.breakdown()), sum(profiler.samples.values()))
+
+def test_blocked_time_is_sampled():
+    import time
+    with SelfProfiler() as profiler:
+        end = time.time() + 0.05
+        while time.time() < end:
+            time.sleep(0.01)
+    assert_true(profiler.samples[OTHER] > 10)
+    assert_true(profiler.wall_time >= 0.05)
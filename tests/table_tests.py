@@ -0,0 +1,85 @@
+from nose.tools import *
+from minipic.picmicro import *
+
+def _mcu(words, blocks=False):
+    pic = MCU(blocks=blocks)
+    for i, word in enumerate(words):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+def _pointer(pic):
+    ram = pic.data.ram
+    return ram[TBLPTRL] | (ram[TBLPTRH] << 8) | (ram[TBLPTRU] << 16)
+
+def test_table_read_modes():
+    # TBLRD*+; TBLRD*+; TBLRD*-; TBLRD+*; TBLRD*
+    pic = _mcu([0x0009, 0x0009, 0x000A, 0x000B, 0x0008])
+    pic.program.write_bytes(0x10ffff, 'ABCD')
+    pic.data.write(TBLPTRU, 0x10)
+    pic.data.write(TBLPTRH, 0xff)
+    pic.data.write(TBLPTRL, 0xff)
+    results = []
+    for _ in xrange(5):
+        pic.step()
+        results.append((pic.data.ram[TABLAT], _pointer(pic)))
+    assert_equal(results, [(0x41, 0x110000), (0x42, 0x110001), (0x43, 0x110000),
+                           (0x43, 0x110001), (0x43, 0x110001)])
+    assert_equal(pic.cycles, 10)
+
+def test_table_read_above_program_memory():
+    # TBLRD*
+    pic = _mcu([0x0008])
+    pic.data.write(TBLPTRU, 0x30)
+    pic.data.write(TABLAT, 0x55)
+    pic.step()
+    assert_equal(pic.data.ram[TABLAT], 0)
+
+# 0: MOVLW 0x10; 2: MOVWF TBLPTRH; 4: CLRF TBLPTRL; 6: MOVLW 16; 8: MOVWF 0x20
+# 10: CLRF 0x21; 12: TBLRD*+; 14: MOVF TABLAT, w; 16: ADDWF 0x21, f
+# 18: DECFSZ 0x20, f; 20: BRA 12; 22: BRA 22
+SUM = [0x0E10, 0x6EF7, 0x6AF6, 0x0E10, 0x6E20, 0x6A21, 0x0009, 0x50F5, 0x2621,
+       0x2E20, 0xD7FB, 0xD7FF]
+
+def test_table_read_loop():
+    for blocks in (False, True):
+        pic = _mcu(SUM, blocks)
+        pic.program.write_bytes(0x1000, bytearray(range(1, 17)))
+        assert_equal(pic.run(until_pc=22), (STOP_UNTIL_PC, 6 + 16 * 7 - 1))
+        assert_equal(pic.data.ram[0x21], 136)
+        assert_equal(_pointer(pic), 0x1010)
+
+class Recorder:
+    def __init__(self):
+        self.words = []
+    def invalidate(self, i):
+        self.words.append(i)
+
+# 0: MOVLW 0x12; 2: MOVWF TABLAT; 4: MOVLW 0x10; 6: MOVWF TBLPTRL; 8: TBLWT*
+# 10: BRA 16; 16: MOVLW 0; 18: MOVWF 0x20; 20: BRA 20
+PATCH = [0x0E12, 0x6EF5, 0x0E10, 0x6EF6, 0x000C, 0xD002, 0x0000, 0x0000,
+         0x0E00, 0x6E20, 0xD7FF]
+
+def test_table_write_drops_only_affected_code():
+    for blocks in (False, True):
+        pic = _mcu(PATCH, blocks)
+        pic.program.predecode()
+        recorder = Recorder()
+        pic.program.observers.append(recorder)
+        assert_equal(pic.run(until_pc=20), (STOP_UNTIL_PC, 10))
+        assert_equal(recorder.words, [8])
+        assert_equal(pic.data.ram[0x20], 0x12)
+        assert_equal(pic.program.read_word(16), 0x0E12)
+    # compiled blocks not covering written word are kept
+    first, patched = pic.blocks[0], pic.blocks[16]
+    pic.pc.value = 0
+    pic.run(until_pc=20)
+    assert_true(pic.blocks[0] is first)
+    assert_false(pic.blocks[16] is patched)
+
+def test_flash_view():
+    pic = MCU()
+    view = pic.program.flash()
+    assert_false(pic.program.image is ProgramMemory.ERASED)
+    pic.program.write_word(0x20, 0x0E05)
+    assert_equal(view[0x20:0x22].tobytes(), '\x05\x0e')
+    assert_equal(len(view), ProgramMemory.SIZE)
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.tracelog import *
+
+def _loop_mcu():
+    # 0: MOVLW 100; 2: MOVWF 0x20; 4: DECFSZ 0x20,f; 6: GOTO 4; 10: GOTO 0
+    pic = MCU(TRACE_WRITES, trace_capacity=16)
+    for i, word in enumerate([0x0E64, 0x6E20, 0x2E20, 0xEF02, 0xF000, 0xEF00, 0xF000]):
+        pic.program.write_word(2 * i, word)
+    return pic
+
+class TestTraceLog:
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'trace.log')
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def _write_log(self, cycles):
+        pic = _loop_mcu()
+        with TraceSink(pic.trace, self.path, block_events=100):
+            pic.run(max_cycles=cycles)
+        return pic
+
+    def test_log_keeps_all_events(self):
+        pic = self._write_log(1000)
+        log = TraceLog(self.path)
+        assert_equal(len(log), pic.trace.count)
+        assert_true(len(log.index) > 1)
+        events = list(log.events())
+        assert_equal(events[0], (0, ('opcode_fetch', 0, 0x0E64)))
+        assert_equal(events[1], (0, ('register_write', WREG, 100)))
+        assert_equal(events[-1][0], 999)
+        log.close()
+
+    def test_seek_by_cycle(self):
+        self._write_log(1000)
+        log = TraceLog(self.path)
+        events = list(log.events(from_cycle=500))
+        assert_equal(events, [event for event in log.events() if event[0] >= 500])
+        assert_equal(events[0][1][0], 'opcode_fetch')
+        log.close()
+
+    def test_unfinished_log_is_scanned(self):
+        self._write_log(1000)
+        with open(self.path, 'r+b') as f:
+            f.seek(-TRAILER.size, 2)
+            f.truncate()
+        log = TraceLog(self.path)
+        assert_equal(len(list(log.events())), len(log))
+        log.close()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from nose.tools import *
+from minipic.picmicro import *
+from minipic.vcd import *
+
+class TestVCD:
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'run.vcd')
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def _dump(self, words, cycles, frequency=FOSC, **kwargs):
+        pic = MCU(TRACE_WRITES, trace_capacity=8, frequency=frequency)
+        for i, word in enumerate(words):
+            pic.program.write_word(2 * i, word)
+        with VCDWriter(pic, self.path, **kwargs):
+            pic.run(max_cycles=cycles)
+        with open(self.path) as f:
+            return f.read().split('\n$end\n', 1)
+
+    def test_header_declares_signals(self):
+        header, _ = self._dump([0xEF00, 0xF000], 1, registers=[0x20])
+        assert_true('$var wire 21 ! PC $end' in header)
+        assert_true('$var wire 8 " r020 $end' in header)
+        assert_true('$enddefinitions $end' in header)
+        assert_true('$timescale 1 us $end' in header)
+
+    def test_time_follows_frequency(self):
+        # 0: MOVLW 3; 2: MOVWF 0x20; 4: GOTO 4, cycle takes 500 ns at 8 MHz
+        header, body = self._dump([0x0E03, 0x6E20, 0xEF02, 0xF000], 3,
+                                  frequency=8000000, registers=[0x20])
+        assert_true('$timescale 1 ns $end' in header)
+        assert_equal(body.split('\n'), ['#500', 'b10 !', 'b11 "', '#1000', 'b100 !', ''])
+
+    def test_only_changes_are_dumped(self):
+        # 0: MOVLW 3; 2: MOVWF 0x20; 4: MOVWF 0x20; 6: BTG 0x20,2; 8: GOTO 8
+        _, body = self._dump([0x0E03, 0x6E20, 0x6E20, 0x7420, 0xEF04, 0xF000], 20,
+                             registers={WREG: 'WREG', 0x20: 'counter'})
+        # counter is '"', WREG is '#'
+        assert_equal(body.split('\n'), [
+            'b11 #',
+            '#1', 'b10 !', 'b11 "',
+            '#2', 'b100 !',
+            '#3', 'b110 !', 'b111 "',
+            '#4', 'b1000 !',
+            ''])
+
+@raises(ValueError)
+def test_vcd_needs_traced_writes():
+    VCDWriter(MCU(TRACE_INSTR), os.devnull)
@@ -0,0 +1,63 @@
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+from minipic.picmicro import MCU
+from minipic.register import WREG, BSR, STATUS
+
+try:
+    import numpy
+    from minipic.vector import VectorMCU
+except ImportError:
+    numpy = None
+
+# 0: CALL 12; 4: DECFSZ 0x20,f; 6: GOTO 4; 10: GOTO 10
+# 12: BTFSC 0x21,0; 14: BTG 0x22,1; 16: MOVWF 0x23; 18: RETURN
+PROGRAM = [0xEC06, 0xF000, 0x2E20, 0xEF02, 0xF000, 0xEF05, 0xF000,
+           0xB021, 0x7222, 0x6E23, 0x0012]
+
+def _load(program):
+    for i, word in enumerate(PROGRAM):
+        program.write_word(2 * i, word)
+
+def test_lanes_match_scalar_mcu():
+    if numpy is None:
+        raise SkipTest('numpy is not installed')
+    lanes = 16
+    vm = VectorMCU(lanes)
+    _load(vm.program)
+    vm.ram[:, 0x20] = numpy.arange(lanes) * 3
+    vm.ram[:, 0x21] = numpy.arange(lanes) & 1
+    vm.ram[:, WREG] = numpy.arange(lanes) + 100
+    assert_equal(vm.run(2000, until_pc=10), 0)
+    for lane in range(lanes):
+        pic = MCU()
+        _load(pic.program)
+        pic.data.ram[0x20] = lane * 3
+        pic.data.ram[0x21] = lane & 1
+        pic.data.ram[WREG] = lane + 100
+        pic.run(until_pc=10)
+        assert_equal(vm.pc[lane], pic.pc.value)
+        assert_equal(vm.cycles[lane], pic.cycles)
+        assert_equal(bytearray(vm.ram[lane].tobytes()), pic.data.ram)
+
+def test_bsr_and_status_writes_are_masked():
+    if numpy is None:
+        raise SkipTest('numpy is not installed')
+    # 0: MOVWF BSR; 2: MOVWF STATUS; 4: BTG 0x20,0,b; 6: GOTO 6
+    vm = VectorMCU(2)
+    for i, word in enumerate([0x6EE0, 0x6ED8, 0x7120, 0xEF03, 0xF000]):
+        vm.program.write_word(2 * i, word)
+    vm.ram[:, WREG] = [0xff, 0x31]
+    vm.run(10, until_pc=6)
+    assert_equal(list(vm.ram[:, BSR]), [0x0f, 0x01])
+    assert_equal(list(vm.ram[:, STATUS]), [0x1f, 0x11])
+    assert_equal(list(vm.ram[:, 0xf20]), [1, 0])
+    assert_equal(list(vm.ram[:, 0x120]), [0, 1])
+
+@raises(NotImplementedError)
+def test_pcl_is_rejected():
+    if numpy is None:
+        raise SkipTest('numpy is not installed')
+    # MOVWF PCL
+    vm = VectorMCU(2)
+    vm.program.write_word(0, 0x6EF9)
+    vm.step()